@@ -1,39 +1,124 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import pandas as pd
+
+from control_tower.ingest import (
+    SHEET_CACHE, changed_tables, file_hash, parse_sheet, read_manifest, resolve_sources,
+    sheet_hashes, table_record, write_manifest,
+)
+from control_tower.metrics import instrument, step
+from control_tower.storage import FrameHasher, TableWriter, apply_schema, iter_table, table_path
 
 RAW_DIR = Path("data/raw")
 PROCESSED_DIR = Path("data/processed")
+CACHE_DIR = PROCESSED_DIR / SHEET_CACHE
 
 RAW_DIR.mkdir(parents=True, exist_ok=True)
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
 EXCEL_FILE = RAW_DIR / "Supply chain logistics problem.xlsx"
 
+def _outputs_exist(sheet: str, export_csv: bool) -> bool:
+    return table_path(sheet, PROCESSED_DIR).exists() and (
+        not export_csv or table_path(sheet, PROCESSED_DIR, ".csv").exists()
+    )
 
+def _parse_all(tasks: list[tuple], workers: int) -> list[dict]:
+    # One task per (workbook, sheet); each worker parses and caches its sheet
+    if workers <= 1 or len(tasks) <= 1:
+        return [parse_sheet(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_sheet, *task) for task in tasks]
+        return [f.result() for f in futures]
 
+def main(export_csv: bool = False, force: bool = False, source: str | None = None, workers: int | None = None):
+    books = resolve_sources(source or EXCEL_FILE)
+    print("Loading workbooks:", [str(b) for b in books])
 
-def main():
-    print("Loading dataset:", EXCEL_FILE)
-
-    if not EXCEL_FILE.exists():
+    if not books:
         raise FileNotFoundError(
-            f"Dataset not found at {EXCEL_FILE}. "
+            f"Dataset not found at {source or EXCEL_FILE}. "
             "Upload the .xlsx into data/raw/ with the exact same filename."
         )
 
-    xls = pd.ExcelFile(EXCEL_FILE)
-    print("Sheets found:", xls.sheet_names)
+    # Content hashes decide what needs parsing: raw sheet parts are hashed
+    # straight from the .xlsx zip, without going through openpyxl
+    manifest = read_manifest(PROCESSED_DIR)
+    for meta in manifest["tables"].values():
+        meta["changed"] = False
+
+    sources = {}
+    for book in books:
+        wb_hash = file_hash(book)
+        known = manifest["workbooks"].get(book.name, {})
+        # Same workbook bytes: the per-sheet hashes from the last run still hold
+        sheets = known["sheets"] if known.get("hash") == wb_hash else sheet_hashes(book)
+        manifest["workbooks"][book.name] = {"hash": wb_hash, "sheets": sheets}
+        sources[book] = sheets
+
+    tasks = []
+    for book, sheets in sources.items():
+        parsed = manifest["sheets"].setdefault(book.name, {})
+        for sheet, source_hash in sheets.items():
+            cached = table_path(sheet, CACHE_DIR / book.name).exists()
+            if force or not cached or parsed.get(sheet, {}).get("source_hash") != source_hash:
+                tasks.append((book, sheet, CACHE_DIR, source_hash))
+            else:
+                print(f"Unchanged {book.name} / {sheet} | skipped")
+
+    workers = workers or os.cpu_count() or 1
+    with step("parse sheets", rows_in=len(tasks)) as metrics:
+        records = _parse_all(tasks, workers)
+        metrics.rows_out = sum(record["rows"] for record in records)
+    for (book, sheet, _, _), record in zip(tasks, records):
+        manifest["sheets"][book.name][sheet] = record
+        print(f"Parsed {book.name} / {sheet} | Rows: {record['rows']} | {record['rows_per_sec'] or 0:,} rows/s")
+    print(f"Parsed {len(tasks)} sheet(s) with {min(workers, max(len(tasks), 1))} worker(s)")
 
-    for sheet in xls.sheet_names:
-        df = xls.parse(sheet)
+    # ---------- Processed tables: per-sheet outputs concatenated over workbooks ----------
+    tables = {}
+    for book, sheets in sources.items():
+        for sheet in sheets:
+            tables.setdefault(sheet, []).append(book.name)
 
-        # basic column cleanup
-        df.columns = [str(c).strip().replace(" ", "_") for c in df.columns]
+    for sheet, names in tables.items():
+        prev = manifest["tables"].get(sheet, {})
+        hashes = [manifest["sheets"][n][sheet]["table_hash"] for n in names]
+        if prev.get("sources") == names and prev.get("sheet_hashes") == hashes and _outputs_exist(sheet, export_csv):
+            continue
 
-        out_file = PROCESSED_DIR / f"{sheet}.csv"
-        df.to_csv(out_file, index=False)
+        # Cached sheets are streamed in batches, never concatenated in memory
+        hasher = FrameHasher()
+        for n in names:
+            for df in iter_table(sheet, CACHE_DIR / n):
+                hasher.update(apply_schema(df, sheet))
+        record = table_record(hasher, sources=names, sheet_hashes=hashes)
+        # A re-saved workbook can change the raw parts but not the data
+        record["changed"] = record["table_hash"] != prev.get("table_hash") or not _outputs_exist(sheet, export_csv)
+        if record["changed"]:
+            with TableWriter(sheet, PROCESSED_DIR, export_csv=export_csv) as writer:
+                for n in names:
+                    for df in iter_table(sheet, CACHE_DIR / n):
+                        writer.write(df)
+            print(f"Saved {writer.path} | Rows: {record['rows']} | Cols: {record['cols']}")
+        else:
+            record["updated"] = prev.get("updated", record["updated"])
+        manifest["tables"][sheet] = record
 
-        print(f"Saved {out_file} | Rows: {len(df)} | Cols: {len(df.columns)}")
+    # Workbooks no longer in the source set drop out of the manifest
+    for name in set(manifest["sheets"]) - {b.name for b in books}:
+        manifest["sheets"].pop(name)
+        manifest["workbooks"].pop(name, None)
+    write_manifest(PROCESSED_DIR, manifest)
+    print("Changed tables:", changed_tables(PROCESSED_DIR))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Also export CSV copies of the processed tables")
+    parser.add_argument("--force", action="store_true", help="Re-parse every sheet even if its content hash is unchanged")
+    parser.add_argument("--source", help="Workbook file, directory or glob (default: the single dataset workbook)")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    args = parser.parse_args()
+    with instrument("ingest"):
+        main(export_csv=args.csv, force=args.force, source=args.source, workers=args.workers)
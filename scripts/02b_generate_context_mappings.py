@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
 import pandas as pd
 
+from control_tower.context import build_dimension
+from control_tower.metrics import instrument, step
+from control_tower.storage import DEFAULT_BATCH_ROWS, iter_table, read_table, table_exists, write_table
+
 ROOT = Path(__file__).resolve().parents[1]
 ANALYTICS = ROOT / "data" / "analytics"
-FACT = ANALYTICS / "fact_orders.csv"
 CTX = ROOT / "data" / "context"
 CTX.mkdir(parents=True, exist_ok=True)
 
+CODE_COLS = ["carrier", "svc_cd", "orig_port_cd", "dest_port_cd", "plant_code", "product_id", "customer"]
+
 # Deterministic name pools (assigned in sorted-code order)
 CARRIER_NAMES = [
     "DHL Global Forwarding", "Kuehne+Nagel", "DB Schenker", "DSV", "Expeditors",
@@ -39,20 +45,17 @@ CUSTOMER_SEGMENTS = [
     "Distributor", "Channel Partner", "Direct Customer",
 ]
 
-def _assign_names(codes: list[str], names: list[str], fallback_prefix: str) -> pd.DataFrame:
-    codes_sorted = sorted(set([str(c) for c in codes if pd.notna(c)]))
-    rows = []
-    for i, code in enumerate(codes_sorted):
-        label = names[i] if i < len(names) else f"{fallback_prefix} {i+1:02d}"
-        rows.append((code, label))
-    return pd.DataFrame(rows, columns=["code", "name"])
-
-def main() -> None:
-    if not FACT.exists():
-        raise FileNotFoundError(f"Missing {FACT}. Ensure you have data/analytics/fact_orders.csv")
-
-    df = pd.read_csv(FACT)
+def _distinct_codes(batch_size: int) -> pd.DataFrame:
+    # Keep only distinct code combinations per batch; the code sets are tiny next to the orders
+    df = pd.DataFrame(columns=CODE_COLS)
+    for batch in iter_table("fact_orders", ANALYTICS, columns=CODE_COLS, batch_size=batch_size):
+        batch = batch.astype(object).drop_duplicates()
+        df = batch if df.empty else pd.concat([df, batch], ignore_index=True).drop_duplicates()
+    return df
 
+def build(tables: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """The integer-keyed dimension tables from the codes in ``fact_orders``."""
+    df = tables["fact_orders"]
     carriers = df["carrier"].dropna().astype(str).unique().tolist() if "carrier" in df.columns else []
     services = df["svc_cd"].dropna().astype(str).unique().tolist() if "svc_cd" in df.columns else []
     orig_ports = df["orig_port_cd"].dropna().astype(str).unique().tolist() if "orig_port_cd" in df.columns else []
@@ -62,28 +65,44 @@ def main() -> None:
     products = df["product_id"].dropna().astype(str).unique().tolist() if "product_id" in df.columns else []
     customers = df["customer"].dropna().astype(str).unique().tolist() if "customer" in df.columns else []
 
-    carriers_map = _assign_names(carriers, CARRIER_NAMES, "Carrier")
-    services_map = _assign_names(services, SERVICE_TIERS, "Service")
-    ports_map = _assign_names(ports, PORT_NAMES, "Port")
-    plants_map = _assign_names(plants, PLANT_NAMES, "Plant")
-    products_map = _assign_names(products, PRODUCT_FAMILIES, "Product")
+    # Integer-keyed dimension tables: key = position in sorted-code order
+    with step("build dimensions", rows_in=len(df)) as metrics:
+        dims = {
+            "carriers": build_dimension(carriers, CARRIER_NAMES, "Carrier"),
+            "services": build_dimension(services, SERVICE_TIERS, "Service"),
+            "ports": build_dimension(ports, PORT_NAMES, "Port"),
+            "plants": build_dimension(plants, PLANT_NAMES, "Plant"),
+            "products": build_dimension(products, PRODUCT_FAMILIES, "Product"),
+            "customers": build_dimension(customers, CUSTOMER_SEGMENTS, "Customer", cycle=True),
+        }
+        metrics.rows_out = sum(len(dim) for dim in dims.values())
+    return dims
+
+def save(outputs: dict[str, pd.DataFrame], export_csv: bool = False) -> None:
+    for name, dim in outputs.items():
+        # Parquet is what the pipeline reads; the CSV copy is for inspection
+        write_table(dim, name, CTX, export_csv=True)
+
+def main(chunked: bool = False, batch_size: int = DEFAULT_BATCH_ROWS) -> None:
+    if not table_exists("fact_orders", ANALYTICS):
+        raise FileNotFoundError(f"Missing fact_orders in {ANALYTICS}. Run scripts/02_prepare_data.py first.")
 
-    cust_sorted = sorted(set([str(c) for c in customers if pd.notna(c)]))
-    cust_rows = []
-    for i, c in enumerate(cust_sorted):
-        seg = CUSTOMER_SEGMENTS[i % len(CUSTOMER_SEGMENTS)] if CUSTOMER_SEGMENTS else "Customer"
-        cust_rows.append((c, seg))
-    customers_map = pd.DataFrame(cust_rows, columns=["code", "name"])
+    # Only the code columns are needed to build the mappings
+    if chunked:
+        df = _distinct_codes(batch_size)
+    else:
+        df = read_table("fact_orders", ANALYTICS, columns=CODE_COLS)
 
-    (CTX / "carriers.csv").write_text(carriers_map.to_csv(index=False))
-    (CTX / "services.csv").write_text(services_map.to_csv(index=False))
-    (CTX / "ports.csv").write_text(ports_map.to_csv(index=False))
-    (CTX / "plants.csv").write_text(plants_map.to_csv(index=False))
-    (CTX / "products.csv").write_text(products_map.to_csv(index=False))
-    (CTX / "customers.csv").write_text(customers_map.to_csv(index=False))
+    dims = build({"fact_orders": df})
+    save(dims)
 
     print("Generated context mappings in data/context/")
-    print(f"carriers={len(carriers_map)} services={len(services_map)} ports={len(ports_map)} plants={len(plants_map)} products={len(products_map)} customers={len(customers_map)}")
+    print(" ".join(f"{name}={len(dim)}" for name, dim in dims.items()))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunked", action="store_true", help="Scan the fact table codes in row batches (bounded memory)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per batch with --chunked")
+    args = parser.parse_args()
+    with instrument("context"):
+        main(chunked=args.chunked, batch_size=args.batch_size)
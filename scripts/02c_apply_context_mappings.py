@@ -1,56 +1,98 @@
 from __future__ import annotations
 
+import argparse
+import hashlib
 from pathlib import Path
 import pandas as pd
 
+from control_tower.context import DIMENSIONS, Dimension, load_dimensions, resolve_labels
+from control_tower.metrics import instrument, step
+from control_tower.storage import (
+    DEFAULT_BATCH_ROWS, TableWriter, changed_days, day_hashes, drop_partitions, export_partitions_csv, iter_table,
+    read_manifest, read_table, table_exists, table_file, write_manifest, write_partitions, write_table,
+)
+
 ROOT = Path(__file__).resolve().parents[1]
 ANALYTICS = ROOT / "data" / "analytics"
 CTX = ROOT / "data" / "context"
 
-FACT_IN = ANALYTICS / "fact_orders.csv"
-FACT_OUT = ANALYTICS / "fact_orders_enriched.csv"
-
-def _load_map(filename: str, key_col: str, out_col: str) -> pd.DataFrame:
-    path = CTX / filename
-    if not path.exists():
-        raise FileNotFoundError(f"Missing {path}. Run scripts/02b_generate_context_mappings.py first.")
-    m = pd.read_csv(path).rename(columns={"code": key_col, "name": out_col})
-    m[key_col] = m[key_col].astype(str)
-    return m[[key_col, out_col]]
-
-def main() -> None:
-    if not FACT_IN.exists():
-        raise FileNotFoundError(f"Missing {FACT_IN}. Ensure data/analytics/fact_orders.csv exists.")
-
-    df = pd.read_csv(FACT_IN)
-
-    # normalize join keys
-    for col in ["carrier", "svc_cd", "orig_port_cd", "dest_port_cd", "plant_code", "product_id", "customer"]:
-        if col in df.columns:
-            df[col] = df[col].astype(str)
-
-    carriers = _load_map("carriers.csv", "carrier", "carrier_name")
-    services = _load_map("services.csv", "svc_cd", "service_tier")
-    ports_o = _load_map("ports.csv", "orig_port_cd", "origin_port_name")
-    ports_d = _load_map("ports.csv", "dest_port_cd", "dest_port_name")
-    plants = _load_map("plants.csv", "plant_code", "plant_name")
-    products = _load_map("products.csv", "product_id", "product_family")
-    customers = _load_map("customers.csv", "customer", "customer_segment")
-
-    df = df.merge(carriers, on="carrier", how="left")
-    df = df.merge(services, on="svc_cd", how="left")
-    df = df.merge(ports_o, on="orig_port_cd", how="left")
-    df = df.merge(ports_d, on="dest_port_cd", how="left")
-    df = df.merge(plants, on="plant_code", how="left")
-    df = df.merge(products, on="product_id", how="left")
-    df = df.merge(customers, on="customer", how="left")
-
-    # readable lane
-    df["lane_name"] = df["origin_port_name"].fillna(df["orig_port_cd"]) + " → " + df["dest_port_name"].fillna(df["dest_port_cd"])
-
-    df.to_csv(FACT_OUT, index=False)
-    print(f"Wrote: {FACT_OUT}")
+FACT_IN = "fact_orders"
+FACT_OUT = "fact_orders_enriched"
+
+def _enrich(df: pd.DataFrame, dims: dict[str, Dimension]) -> pd.DataFrame:
+    # Labels are key lookups on the code columns, stored as categoricals
+    # (one dictionary entry per distinct label rather than a string per row)
+    with step("enrich labels", rows_in=len(df)) as metrics:
+        df = resolve_labels(df, dims)
+        metrics.rows_out = len(df)
+    return df
+
+def _context_hash() -> str:
+    h = hashlib.sha256()
+    for name in DIMENSIONS:
+        h.update(table_file(name, CTX).read_bytes())
+    return h.hexdigest()
+
+def build(tables: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """fact_orders_enriched from ``fact_orders`` and the dimension tables."""
+    dims = {name: Dimension.from_frame(tables[name]) for name in DIMENSIONS}
+    return {FACT_OUT: _enrich(tables[FACT_IN], dims)}
+
+def save(outputs: dict[str, pd.DataFrame], export_csv: bool = False) -> Path:
+    # The source record hashes the stored fact_orders days, so they must be written first
+    out = write_table(outputs[FACT_OUT], FACT_OUT, ANALYTICS, export_csv=export_csv)
+    _record_source()
+    return out
+
+def _record_source() -> None:
+    # Remember which fact_orders days (and label files) the enriched table was built from
+    manifest = read_manifest(FACT_OUT, ANALYTICS)
+    manifest["source"] = day_hashes(FACT_IN, ANALYTICS)
+    manifest["context"] = _context_hash()
+    write_manifest(FACT_OUT, ANALYTICS, manifest)
+
+def main(export_csv: bool = False, chunked: bool = False, batch_size: int = DEFAULT_BATCH_ROWS, incremental: bool = False) -> None:
+    if not table_exists(FACT_IN, ANALYTICS):
+        raise FileNotFoundError(f"Missing {FACT_IN} in {ANALYTICS}. Run scripts/02_prepare_data.py first.")
+
+    dims = load_dimensions(CTX)
+    manifest = read_manifest(FACT_OUT, ANALYTICS)
+    if incremental and manifest.get("context") == _context_hash():
+        # Only days whose fact_orders partition changed since the last run are re-enriched;
+        # new label files fall through to a full rebuild below
+        source = day_hashes(FACT_IN, ANALYTICS)
+        days = changed_days(source, manifest.get("source", {}))
+        present = [d for d in days if d in source]
+        drop_partitions(FACT_OUT, ANALYTICS, [d for d in days if d not in present])
+        if present:
+            df = _enrich(read_table(FACT_IN, ANALYTICS, days=present), dims)
+            write_partitions(df, FACT_OUT, ANALYTICS, mode="replace")
+        if export_csv:
+            export_partitions_csv(FACT_OUT, ANALYTICS)
+        _record_source()
+        print(f"Incremental enrich: {len(present)} day(s) rewritten, {len(days) - len(present)} removed")
+        return
+
+    if chunked:
+        # Row-wise lookups only, so batches are enriched and appended independently
+        with TableWriter(FACT_OUT, ANALYTICS, export_csv=export_csv) as writer:
+            for df in iter_table(FACT_IN, ANALYTICS, batch_size=batch_size):
+                writer.write(_enrich(df, dims))
+        out = writer.path
+        _record_source()
+    else:
+        tables = {name: read_table(name, CTX) for name in DIMENSIONS}
+        tables[FACT_IN] = read_table(FACT_IN, ANALYTICS)
+        out = save(build(tables), export_csv)
+    print(f"Wrote: {out}")
     print("Added columns: carrier_name, service_tier, origin_port_name, dest_port_name, plant_name, product_family, customer_segment, lane_name")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Also export a CSV copy of the enriched fact table")
+    parser.add_argument("--chunked", action="store_true", help="Enrich the fact table in row batches (bounded memory)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per batch with --chunked")
+    parser.add_argument("--incremental", action="store_true", help="Re-enrich only the fact_orders days that changed")
+    args = parser.parse_args()
+    with instrument("apply_context"):
+        main(export_csv=args.csv, chunked=args.chunked, batch_size=args.batch_size, incremental=args.incremental)
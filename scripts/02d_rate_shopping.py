@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from control_tower.ingest import drop_repeated_sources
+from control_tower.kpis import KpiAccumulator, KpiSpec, compute_kpis
+from control_tower.metrics import instrument, step
+from control_tower.rates import DEFAULT_MAX_PAIRS, build_lane_index, shop_rates
+from control_tower.storage import DEFAULT_BATCH_ROWS, TableWriter, iter_table, read_table, table_exists, write_table
+
+ROOT = Path(__file__).resolve().parents[1]
+PROCESSED_DIR = ROOT / "data" / "processed"
+ANALYTICS_DIR = ROOT / "data" / "analytics"
+
+FACT_IN = "fact_orders"
+ORDERS_OUT = "rate_shop_orders"
+SAVINGS_OUT = "kpi_rate_savings"
+
+ORDER_COLS = [
+    "order_id", "order_date", "orig_port_cd", "dest_port_cd", "carrier", "svc_cd", "weight",
+    "freight_cost_est", "tpt",
+]
+# Savings below a cent are rounding, not a cheaper option
+MIN_SAVING = 0.01
+
+SAVINGS_SPEC = KpiSpec(SAVINGS_OUT, ["orig_port_cd", "dest_port_cd", "carrier"], {
+    "orders": ("order_id", "count"),
+    "shopped_orders": ("cheapest_cost", "count"),
+    "freight_cost": ("shopped_cost", "sum"),
+    "cheapest_cost": ("cheapest_cost", "sum"),
+    "savings": ("positive_savings", "sum"),
+    "orders_with_savings": ("has_savings", "sum"),
+    "avg_days_saved": ("fastest_days_saved", "mean"),
+})
+
+def _clean_cols(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    return df
+
+def _shop(df: pd.DataFrame, index, max_pairs: int) -> pd.DataFrame:
+    out = df[ORDER_COLS].reset_index(drop=True)
+    with step("rate shopping", rows_in=len(out)) as metrics:
+        shop = shop_rates(out, index, max_pairs=max_pairs)
+        metrics.rows_out = int(shop["cheapest_cost"].notna().sum())
+    out = pd.concat([out, shop], axis=1)
+    # Savings vs the carrier actually used; negative when the used rate beat every eligible row
+    out["savings"] = out["freight_cost_est"] - out["cheapest_cost"]
+    out["fastest_days_saved"] = pd.to_numeric(out["tpt"], errors="coerce") - out["fastest_tpt"]
+    return out
+
+def _derived(df: pd.DataFrame) -> dict:
+    # Costs are only compared on orders that have an eligible alternative
+    shopped = df["cheapest_cost"].notna()
+    return {
+        "shopped_cost": df["freight_cost_est"].where(shopped),
+        "has_savings": df["savings"] > MIN_SAVING,
+        "positive_savings": df["savings"].where(df["savings"] > MIN_SAVING, 0.0),
+    }
+
+def _finish(savings: pd.DataFrame) -> pd.DataFrame:
+    cost = savings["freight_cost"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        savings["savings_pct"] = np.where(cost > 0, savings["savings"].to_numpy(dtype=float) / cost, np.nan)
+    return savings.sort_values("savings", ascending=False, kind="stable").reset_index(drop=True)
+
+def _index(freight: pd.DataFrame):
+    # Every rate card row, grouped by lane; the order x row fan-out is bounded by max_pairs
+    return build_lane_index(drop_repeated_sources(_clean_cols(freight)))
+
+def build(tables: dict[str, pd.DataFrame], max_pairs: int = DEFAULT_MAX_PAIRS) -> dict[str, pd.DataFrame]:
+    """rate_shop_orders and kpi_rate_savings from ``fact_orders`` and ``FreightRates``."""
+    df = _shop(tables[FACT_IN], _index(tables["FreightRates"]), max_pairs)
+    savings = compute_kpis(df, [SAVINGS_SPEC], derived=_derived(df))[SAVINGS_OUT]
+    return {ORDERS_OUT: df, SAVINGS_OUT: _finish(savings)}
+
+def save(outputs: dict[str, pd.DataFrame], export_csv: bool = False) -> None:
+    for name, table in outputs.items():
+        write_table(table, name, ANALYTICS_DIR, export_csv=export_csv)
+
+def main(
+    export_csv: bool = False,
+    chunked: bool = False,
+    batch_size: int = DEFAULT_BATCH_ROWS,
+    max_pairs: int = DEFAULT_MAX_PAIRS,
+) -> None:
+    if not table_exists(FACT_IN, ANALYTICS_DIR):
+        raise FileNotFoundError(f"Missing {FACT_IN} in {ANALYTICS_DIR}. Run scripts/02_prepare_data.py first.")
+
+    freight = read_table("FreightRates", PROCESSED_DIR)
+    if chunked:
+        index = _index(freight)
+        acc = KpiAccumulator([SAVINGS_SPEC])
+        with TableWriter(ORDERS_OUT, ANALYTICS_DIR, export_csv=export_csv) as writer:
+            for df in iter_table(FACT_IN, ANALYTICS_DIR, columns=ORDER_COLS, batch_size=batch_size):
+                df = _shop(df, index, max_pairs)
+                writer.write(df)
+                acc.update(df, derived=_derived(df))
+        savings = _finish(acc.result()[SAVINGS_OUT])
+        write_table(savings, SAVINGS_OUT, ANALYTICS_DIR, export_csv=export_csv)
+    else:
+        fact = read_table(FACT_IN, ANALYTICS_DIR, columns=ORDER_COLS)
+        outputs = build({FACT_IN: fact, "FreightRates": freight}, max_pairs)
+        save(outputs, export_csv)
+        savings = outputs[SAVINGS_OUT]
+
+    print(f"Rate shopping: {savings['orders_with_savings'].sum():,} order(s) with a cheaper option, "
+          f"potential savings {savings['savings'].sum():,.2f}")
+    print(f"Wrote: {ANALYTICS_DIR / ORDERS_OUT}, {ANALYTICS_DIR / SAVINGS_OUT}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Also export CSV copies of the rate shopping tables")
+    parser.add_argument("--chunked", action="store_true", help="Stream the fact table in row batches (bounded memory)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per batch with --chunked")
+    parser.add_argument("--max-pairs", type=int, default=DEFAULT_MAX_PAIRS, help="Order x rate row pairs costed at once")
+    args = parser.parse_args()
+    with instrument("rate_shopping"):
+        main(export_csv=args.csv, chunked=args.chunked, batch_size=args.batch_size, max_pairs=args.max_pairs)
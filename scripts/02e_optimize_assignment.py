@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from control_tower.assignment import SEARCH_ROUNDS, Network, solve
+from control_tower.context import code_strings
+from control_tower.ingest import drop_repeated_sources
+from control_tower.metrics import instrument, step
+from control_tower.rates import DEFAULT_MAX_PAIRS, SHOP_KEYS, build_lane_index
+from control_tower.storage import TableWriter, day_hashes, read_table, table_exists, write_table
+
+ROOT = Path(__file__).resolve().parents[1]
+PROCESSED_DIR = ROOT / "data" / "processed"
+ANALYTICS_DIR = ROOT / "data" / "analytics"
+
+FACT_IN = "fact_orders"
+PLAN_OUT = "assignment_plan"
+SUMMARY_OUT = "assignment_summary"
+
+REFERENCE = ["FreightRates", "WhCapacities", "WhCosts", "PlantPorts", "ProductsPerPlant", "VmiCustomers"]
+
+ORDER_COLS = [
+    "order_id", "order_date", "customer", "product_id", "unit_quantity", "weight", "dest_port_cd",
+    "svc_cd", "plant_code", "orig_port_cd", "carrier", "mode_dsc", "freight_cost_est", "wh_cost_per_unit",
+]
+PLAN_COLS = [
+    "order_id", "order_date", "customer", "product_id", "svc_cd", "plant_code", "orig_port_cd", "carrier",
+    "actual_cost", "plan_plant_code", "plan_port", "plan_carrier", "plan_mode_dsc",
+    "plan_freight_cost", "plan_wh_cost", "plan_cost", "cost_delta", "status",
+]
+
+def _clean_cols(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    return df
+
+def _reference(df: pd.DataFrame) -> pd.DataFrame:
+    return drop_repeated_sources(_clean_cols(df))
+
+def _load_network(tables: dict[str, pd.DataFrame]) -> Network:
+    # Same renames as 02_prepare_data.py
+    return Network.from_tables(
+        products=_reference(tables["ProductsPerPlant"]),
+        ports=_reference(tables["PlantPorts"]),
+        vmi=_reference(tables["VmiCustomers"]),
+        capacities=_reference(tables["WhCapacities"]).rename(columns={"plant_id": "plant_code"}),
+        costs=_reference(tables["WhCosts"]).rename(columns={"wh": "plant_code", "cost/unit": "wh_cost_per_unit"}),
+    )
+
+def _load_rates(tables: dict[str, pd.DataFrame]):
+    # Freight alternatives must keep the order's service level
+    return build_lane_index(_reference(tables["FreightRates"]), keys=SHOP_KEYS + ["svc_cd"])
+
+def _plan(df: pd.DataFrame, network: Network, rates, rounds: int, max_pairs: int) -> pd.DataFrame:
+    df = df[ORDER_COLS].reset_index(drop=True)
+    with step("assignment solve", rows_in=len(df)) as metrics:
+        solved = solve(df, network, rates, rounds=rounds, max_pairs=max_pairs)
+        metrics.rows_out = int((solved["status"] == "assigned").sum())
+    plan = pd.concat([df, solved], axis=1)
+    # Actual cost on the same basis: warehouse leg plus the costed freight (none for customer-referred)
+    units = pd.to_numeric(plan["unit_quantity"], errors="coerce").fillna(0)
+    plan["actual_cost"] = plan["freight_cost_est"].fillna(0) + plan["wh_cost_per_unit"].fillna(0) * units
+    plan["cost_delta"] = plan["plan_cost"] - plan["actual_cost"]
+    return plan[PLAN_COLS]
+
+def _summarize(plan: pd.DataFrame, network: Network) -> pd.DataFrame:
+    # Per plant: capacity, actual vs planned load and cost. Costs cover assigned
+    # orders only, as _report does: actual_cost and cost_delta are those orders
+    # at their actual plant, plan_cost the same orders at their planned plant
+    plan = plan.assign(plant_code=code_strings(plan["plant_code"]).to_numpy(), day=plan["order_date"].dt.normalize())
+    is_assigned = plan["status"] == "assigned"
+    assigned = plan[is_assigned]
+    actual = plan.assign(unassigned=~is_assigned).groupby("plant_code").agg(
+        actual_orders=("order_id", "count"), unassigned_orders=("unassigned", "sum"),
+    )
+    actual = actual.join(assigned.groupby("plant_code")[["actual_cost", "cost_delta"]].sum())
+    actual["actual_peak_day_orders"] = plan.groupby(["plant_code", "day"], dropna=False).size().groupby(level=0).max()
+    planned = assigned.groupby("plan_plant_code").agg(plan_orders=("order_id", "count"), plan_cost=("plan_cost", "sum"))
+    planned["plan_peak_day_orders"] = assigned.groupby(["plan_plant_code", "day"], dropna=False).size().groupby(level=0).max()
+
+    out = pd.DataFrame({"daily_capacity": network.capacity}, index=network.plants)
+    out = out.join(actual, how="outer").join(planned, how="outer")
+    for col in ["actual_orders", "unassigned_orders", "actual_peak_day_orders", "plan_orders", "plan_peak_day_orders"]:
+        out[col] = out[col].fillna(0).astype(np.int64)
+    out[["actual_cost", "cost_delta", "plan_cost"]] = out[["actual_cost", "cost_delta", "plan_cost"]].fillna(0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out["plan_peak_utilization"] = out["plan_peak_day_orders"] / out["daily_capacity"]
+    return out.rename_axis("plant_code").reset_index()
+
+def build(
+    tables: dict[str, pd.DataFrame],
+    rounds: int = SEARCH_ROUNDS,
+    max_pairs: int = DEFAULT_MAX_PAIRS,
+) -> dict[str, pd.DataFrame]:
+    """assignment_plan and assignment_summary from ``fact_orders`` and the reference tables."""
+    network = _load_network(tables)
+    plan = _plan(tables[FACT_IN], network, _load_rates(tables), rounds, max_pairs)
+    return {PLAN_OUT: plan, SUMMARY_OUT: _summarize(plan, network)}
+
+def save(outputs: dict[str, pd.DataFrame], export_csv: bool = False) -> None:
+    for name, table in outputs.items():
+        write_table(table, name, ANALYTICS_DIR, export_csv=export_csv)
+
+def _report(plan: pd.DataFrame, seconds: float) -> None:
+    status = plan["status"].value_counts()
+    assigned = plan[plan["status"] == "assigned"]
+    delta = assigned["cost_delta"].sum()
+    base = assigned["actual_cost"].sum()
+    print(f"Assignment: {len(plan):,} orders in {seconds:.1f}s; " + ", ".join(f"{k} {v:,}" for k, v in status.items()))
+    print(f"Assigned orders: actual cost {base:,.2f}, plan cost {base + delta:,.2f}, delta {delta:,.2f}")
+
+def main(
+    export_csv: bool = False,
+    chunked: bool = False,
+    rounds: int = SEARCH_ROUNDS,
+    max_pairs: int = DEFAULT_MAX_PAIRS,
+) -> None:
+    if not table_exists(FACT_IN, ANALYTICS_DIR):
+        raise FileNotFoundError(f"Missing {FACT_IN} in {ANALYTICS_DIR}. Run scripts/02_prepare_data.py first.")
+
+    started = time.perf_counter()
+    tables = {name: read_table(name, PROCESSED_DIR) for name in REFERENCE}
+
+    if chunked:
+        network, rates = _load_network(tables), _load_rates(tables)
+        # Capacity is per day, so days are solved independently, one partition at a time
+        parts = []
+        with TableWriter(PLAN_OUT, ANALYTICS_DIR, export_csv=export_csv) as writer:
+            for day in sorted(day_hashes(FACT_IN, ANALYTICS_DIR)):
+                plan = _plan(read_table(FACT_IN, ANALYTICS_DIR, days=[day]), network, rates, rounds, max_pairs)
+                writer.write(plan)
+                parts.append(plan[["order_id", "order_date", "plant_code", "actual_cost", "plan_plant_code", "plan_cost", "cost_delta", "status"]])
+        plan = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=PLAN_COLS)
+        write_table(_summarize(plan, network), SUMMARY_OUT, ANALYTICS_DIR, export_csv=export_csv)
+    else:
+        tables[FACT_IN] = read_table(FACT_IN, ANALYTICS_DIR)
+        outputs = build(tables, rounds, max_pairs)
+        save(outputs, export_csv)
+        plan = outputs[PLAN_OUT]
+
+    _report(plan, time.perf_counter() - started)
+    print(f"Wrote: {ANALYTICS_DIR / PLAN_OUT}, {ANALYTICS_DIR / SUMMARY_OUT}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Also export CSV copies of the plan tables")
+    parser.add_argument("--chunked", action="store_true", help="Solve one order day at a time (bounded memory)")
+    parser.add_argument("--rounds", type=int, default=SEARCH_ROUNDS, help="Local search rounds after the greedy pass")
+    parser.add_argument("--max-pairs", type=int, default=DEFAULT_MAX_PAIRS, help="Order x rate row pairs costed at once")
+    args = parser.parse_args()
+    with instrument("assignment"):
+        main(export_csv=args.csv, chunked=args.chunked, rounds=args.rounds, max_pairs=args.max_pairs)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from control_tower.feasibility import VIOLATIONS, NetworkRules, violation_names
+from control_tower.ingest import drop_repeated_sources
+from control_tower.kpis import KpiAccumulator, KpiSpec, compute_kpis
+from control_tower.metrics import instrument, step
+from control_tower.storage import DEFAULT_BATCH_ROWS, TableWriter, iter_table, read_table, table_exists, write_table
+
+ROOT = Path(__file__).resolve().parents[1]
+PROCESSED_DIR = ROOT / "data" / "processed"
+ANALYTICS_DIR = ROOT / "data" / "analytics"
+
+FACT_IN = "fact_orders"
+VIOLATIONS_OUT = "network_violations"
+SUMMARY_OUT = "network_violation_summary"
+
+REFERENCE = ["PlantPorts", "ProductsPerPlant", "VmiCustomers"]
+
+ORDER_COLS = [
+    "order_id", "order_date", "plant_code", "product_id", "orig_port_cd", "dest_port_cd",
+    "customer", "carrier", "svc_cd", "freight_cost_est",
+]
+
+SUMMARY_SPEC = KpiSpec(SUMMARY_OUT, ["plant_code"], {
+    "orders": ("order_id", "count"),
+    "violating_orders": ("is_violation", "sum"),
+    **{name: (name, "sum") for name in VIOLATIONS},
+}, dropna=False)
+
+def _clean_cols(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    return df
+
+def _reference(df: pd.DataFrame) -> pd.DataFrame:
+    return drop_repeated_sources(_clean_cols(df))
+
+def _load_rules(tables: dict[str, pd.DataFrame]) -> NetworkRules:
+    return NetworkRules.from_tables(
+        products=_reference(tables["ProductsPerPlant"]),
+        ports=_reference(tables["PlantPorts"]),
+        vmi=_reference(tables["VmiCustomers"]),
+    )
+
+def _check(df: pd.DataFrame, rules: NetworkRules) -> tuple[pd.DataFrame, dict]:
+    # Violating orders only (orders not listed pass every check), plus the summary's flag columns
+    with step("network check", rows_in=len(df)) as metrics:
+        mask = rules.check(df)
+        metrics.rows_out = int((mask > 0).sum())
+    flags = {name: pd.Series((mask & bit) > 0, index=df.index) for name, bit in VIOLATIONS.items()}
+    flags["is_violation"] = pd.Series(mask > 0, index=df.index)
+
+    bad = mask > 0
+    out = df.loc[bad, ORDER_COLS].reset_index(drop=True)
+    out["violation_mask"] = mask[bad]
+    out["violations"] = violation_names(mask[bad])
+    return out, flags
+
+def _finish(summary: pd.DataFrame) -> pd.DataFrame:
+    orders = summary["orders"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        summary["violation_rate"] = np.where(orders > 0, summary["violating_orders"] / orders, np.nan)
+    return summary
+
+def build(tables: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """network_violations and network_violation_summary from ``fact_orders`` and the network tables."""
+    df = tables[FACT_IN]
+    out, flags = _check(df, _load_rules(tables))
+    summary = compute_kpis(df, [SUMMARY_SPEC], derived=flags)[SUMMARY_OUT]
+    return {VIOLATIONS_OUT: out, SUMMARY_OUT: _finish(summary)}
+
+def save(outputs: dict[str, pd.DataFrame], export_csv: bool = False) -> None:
+    for name, table in outputs.items():
+        write_table(table, name, ANALYTICS_DIR, export_csv=export_csv)
+
+def main(export_csv: bool = False, chunked: bool = False, batch_size: int = DEFAULT_BATCH_ROWS) -> None:
+    if not table_exists(FACT_IN, ANALYTICS_DIR):
+        raise FileNotFoundError(f"Missing {FACT_IN} in {ANALYTICS_DIR}. Run scripts/02_prepare_data.py first.")
+
+    started = time.perf_counter()
+    tables = {name: read_table(name, PROCESSED_DIR) for name in REFERENCE}
+
+    if chunked:
+        rules = _load_rules(tables)
+        rows = 0
+        acc = KpiAccumulator([SUMMARY_SPEC])
+        with TableWriter(VIOLATIONS_OUT, ANALYTICS_DIR, export_csv=export_csv) as writer:
+            for df in iter_table(FACT_IN, ANALYTICS_DIR, columns=ORDER_COLS, batch_size=batch_size):
+                out, flags = _check(df, rules)
+                writer.write(out)
+                acc.update(df, derived=flags)
+                rows += len(df)
+        summary = _finish(acc.result()[SUMMARY_OUT])
+        write_table(summary, SUMMARY_OUT, ANALYTICS_DIR, export_csv=export_csv)
+    else:
+        tables[FACT_IN] = read_table(FACT_IN, ANALYTICS_DIR, columns=ORDER_COLS)
+        outputs = build(tables)
+        save(outputs, export_csv)
+        summary = outputs[SUMMARY_OUT]
+        rows = len(tables[FACT_IN])
+
+    counts = {name: int(summary[name].sum()) for name in VIOLATIONS}
+    print(f"Network check: {rows:,} orders in {time.perf_counter() - started:.1f}s, "
+          f"{int(summary['violating_orders'].sum()):,} violating; {counts}")
+    print(f"Wrote: {ANALYTICS_DIR / VIOLATIONS_OUT}, {ANALYTICS_DIR / SUMMARY_OUT}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Also export CSV copies of the violation tables")
+    parser.add_argument("--chunked", action="store_true", help="Stream the fact table in row batches (bounded memory)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per batch with --chunked")
+    args = parser.parse_args()
+    with instrument("network"):
+        main(export_csv=args.csv, chunked=args.chunked, batch_size=args.batch_size)
@@ -1,194 +1,201 @@
 from __future__ import annotations
 
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 import numpy as np
 import pandas as pd
 
+from control_tower.capacity import backlog_tables
+from control_tower.kpis import KpiAccumulator, KpiSpec, compute_kpis
+from control_tower.metrics import instrument, step
+from control_tower.risk import RiskModel
+from control_tower.scenarios import ScenarioAccumulator, simulate
+from control_tower.storage import (
+    DEFAULT_BATCH_ROWS, TableWriter, changed_days, day_hashes, iter_table, read_table, table_exists, write_table,
+)
+from control_tower.topk import top_k
+
 ROOT = Path(__file__).resolve().parents[1]
 ANALYTICS_DIR = ROOT / "data" / "analytics"
-FACT_PATH = ANALYTICS_DIR / "fact_orders.csv"
-
+FACT_TABLE = "fact_orders"
+# Per-day partials of the day-additive aggregates, merged into by --incremental
+STATE_DIR = ANALYTICS_DIR / "_state"
+STATE_DAYS = STATE_DIR / "control_tower_days.json"
+# Fitted risk model (late rates + scaling ranges) for scoring new orders without history
+RISK_MODEL = ANALYTICS_DIR / "risk_model.json"
+# Keys of the fitted risk model and the per-day partials in build()'s outputs (not tables)
+RISK_STATE = "_risk_model"
+DAILY_STATE = "_daily_state"
+DAY = "day"
+
+# Every aggregate this stage needs, evaluated in one scan of the fact table
+KPI_SPECS = [
+    KpiSpec("kpi_sla", ["mode_dsc", "carrier", "lane"], {
+        "orders": ("order_id", "count"),
+        "on_time_rate": ("is_on_time", "mean"),
+        "late_rate": ("is_late", "mean"),
+        "avg_late_days": ("ship_late_day_count", "mean"),
+        "total_freight_cost": ("freight_cost_est", "sum"),
+        "sla_target": ("sla_target", "mean"),
+    }, dropna=False),
+    KpiSpec("lane_late", ["lane"], {"late_rate": ("is_late", "mean")}),
+    KpiSpec("carrier_late", ["carrier"], {"late_rate": ("is_late", "mean")}),
+    KpiSpec("seasonality_monthly", ["month"], {
+        "orders": ("order_id", "count"),
+        "on_time_rate": ("is_on_time", "mean"),
+        "late_rate": ("is_late", "mean"),
+        "avg_late_days": ("ship_late_day_count", "mean"),
+        "total_freight_cost": ("freight_cost_est", "sum"),
+        "avg_freight_cost": ("freight_cost_est", "mean"),
+    }, dropna=False),
+    KpiSpec("kpi_margin_at_risk", ["mode_dsc", "lane", "carrier"], {
+        "orders": ("order_id", "count"),
+        "late_rate": ("is_late", "mean"),
+        "total_freight_cost": ("freight_cost_est", "sum"),
+        "total_order_value_proxy": ("order_value_proxy", "sum"),
+        "total_margin_proxy": ("gross_margin_proxy", "sum"),
+        "total_margin_at_risk": ("margin_at_risk", "sum"),
+    }, dropna=False),
+    KpiSpec("inventory_risk", ["node"], {
+        "orders": ("order_id", "count"),
+        "avg_daily_capacity": ("daily_capacity", "mean"),
+        "avg_wh_cost_per_unit": ("wh_cost_per_unit", "mean"),
+        "avg_unit_qty": ("unit_quantity", "mean"),
+        "avg_weight": ("weight", "mean"),
+        "late_rate": ("is_late", "mean"),
+    }, dropna=False),
+    # Orders received per plant and day, walked against Daily_Capacity by the backlog simulation
+    KpiSpec("plant_daily", ["plant_code", DAY], {
+        "orders": ("order_id", "count"),
+        "daily_capacity": ("daily_capacity", "mean"),
+    }),
+]
+DAILY_SPECS = [s for s in KPI_SPECS if s.name in ("kpi_sla", "seasonality_monthly", "plant_daily")]
+
+
+REQUIRED_COLS = [
+    "order_id", "order_date", "orig_port_cd", "dest_port_cd", "carrier",
+    "mode_dsc", "is_on_time", "is_late", "ship_late_day_count",
+    "freight_cost_est", "unit_quantity", "weight", "daily_capacity", "wh_cost_per_unit"
+]
+RISK_COLS = [
+    "order_id", "order_date", "lane", "orig_port_cd", "dest_port_cd", "carrier", "mode_dsc",
+    "is_on_time", "is_late", "ship_late_day_count", "freight_cost_est", "risk_score", "risk_band",
+]
+EXCEPTION_COLS = [
+    "order_id", "order_date", "lane", "carrier", "mode_dsc", "ship_late_day_count",
+    "freight_cost_est", "risk_score", "risk_band", "priority_score",
+]
+TOP_EXCEPTIONS = 50
+# Monte Carlo draws per scenario
+SCENARIO_TRIALS = 2000
+SCENARIO_SEED = 42
+
+# SLA targets (rule-based). You can tune these later for your story
+SLA_TARGET_BY_MODE = {"AIR": 0.99, "SEA": 0.95, "TRUCK": 0.97, "RAIL": 0.96}
+# We do NOT invent "real revenue". We proxy order value from freight cost as % of value.
+MODE_FREIGHT_PCT = {"AIR": 0.06, "SEA": 0.03, "TRUCK": 0.04, "RAIL": 0.035}
+
+
+def _check_columns(columns) -> None:
+    missing = [c for c in REQUIRED_COLS if c not in columns]
+    if missing:
+        raise ValueError(f"fact_orders missing required columns: {missing}")
 
-def main() -> None:
-    if not FACT_PATH.exists():
-        raise FileNotFoundError(f"Missing {FACT_PATH}. Run scripts/02_prepare_data.py first.")
 
-    df = pd.read_csv(FACT_PATH)
+def _margin_map(carrier_types) -> dict:
+    # margin % by carrier_type for stability (avoids random per-row noise)
+    rng = np.random.default_rng(42)
+    ct_list = sorted(carrier_types)
+    return {ct: float(rng.uniform(0.18, 0.35)) for ct in ct_list}
 
-    required = [
-        "order_id", "order_date", "orig_port_cd", "dest_port_cd", "carrier",
-        "mode_dsc", "is_on_time", "is_late", "ship_late_day_count",
-        "freight_cost_est", "unit_quantity", "weight", "daily_capacity", "wh_cost_per_unit"
-    ]
-    missing = [c for c in required if c not in df.columns]
-    if missing:
-        raise ValueError(f"fact_orders.csv missing required columns: {missing}")
 
-    # Types
-    df["order_date"] = pd.to_datetime(df["order_date"], errors="coerce")
-    df["freight_cost_est"] = pd.to_numeric(df["freight_cost_est"], errors="coerce").fillna(0)
-    df["ship_late_day_count"] = pd.to_numeric(df["ship_late_day_count"], errors="coerce").fillna(0)
-    df["unit_quantity"] = pd.to_numeric(df["unit_quantity"], errors="coerce").fillna(0)
-    df["weight"] = pd.to_numeric(df["weight"], errors="coerce").fillna(0)
-    df["daily_capacity"] = pd.to_numeric(df["daily_capacity"], errors="coerce")
-    df["wh_cost_per_unit"] = pd.to_numeric(df["wh_cost_per_unit"], errors="coerce")
+def _add_drivers(df: pd.DataFrame, margin_map: dict) -> pd.DataFrame:
+    # Types are declared by the storage schema; only fill the measure gaps
+    for col in ["freight_cost_est", "ship_late_day_count", "unit_quantity", "weight"]:
+        df[col] = df[col].fillna(0)
 
     # Lane key
     df["lane"] = df["orig_port_cd"].astype(str) + " → " + df["dest_port_cd"].astype(str)
 
     # -----------------------------------
-    # 1) SLA layer (rule-based targets)
+    # 0) Row-level drivers for the aggregates
     # -----------------------------------
-    # You can tune these later for your story
-    SLA_TARGET_BY_MODE = {"AIR": 0.99, "SEA": 0.95, "TRUCK": 0.97, "RAIL": 0.96}
-    df["sla_target"] = df["mode_dsc"].map(SLA_TARGET_BY_MODE).fillna(0.97)
-
-    kpi_sla = (
-        df.groupby(["mode_dsc", "carrier", "lane"], dropna=False)
-          .agg(
-              orders=("order_id", "count"),
-              on_time_rate=("is_on_time", "mean"),
-              late_rate=("is_late", "mean"),
-              avg_late_days=("ship_late_day_count", "mean"),
-              total_freight_cost=("freight_cost_est", "sum"),
-              sla_target=("sla_target", "mean"),
-          )
-          .reset_index()
-    )
-    kpi_sla["sla_breach_pp"] = ((kpi_sla["sla_target"] - kpi_sla["on_time_rate"]) * 100).clip(lower=0)
-    kpi_sla["sla_score"] = (kpi_sla["on_time_rate"] / kpi_sla["sla_target"]).clip(upper=1.25)
-    kpi_sla.to_csv(ANALYTICS_DIR / "kpi_sla.csv", index=False)
+    df["sla_target"] = df["mode_dsc"].map(SLA_TARGET_BY_MODE).astype(float).fillna(0.97)
 
-    # -----------------------------------
-    # 2) Risk scoring (derived from your data)
-    # -----------------------------------
-    # Risk components:
-    # - Lane late rate
-    # - Carrier late rate
-    # - Late severity (late days)
-    # - Cost scaled
-    lane_late = df.groupby("lane")["is_late"].mean()
-    carrier_late = df.groupby("carrier")["is_late"].mean()
-
-    df["lane_late_rate"] = df["lane"].map(lane_late).fillna(df["is_late"].mean())
-    df["carrier_late_rate"] = df["carrier"].map(carrier_late).fillna(df["is_late"].mean())
-
-    # Mode risk factor: keep it lightweight
-    MODE_RISK = {"AIR": 0.25, "SEA": 0.60, "TRUCK": 0.40, "RAIL": 0.50}
-    df["mode_risk"] = df["mode_dsc"].map(MODE_RISK).fillna(0.40)
+    # Monthly bucket for seasonality
+    df["month"] = df["order_date"].dt.to_period("M").astype(str)
 
-    cost = df["freight_cost_est"].astype(float)
-    cost_scaled = (cost - cost.min()) / (cost.max() - cost.min() + 1e-9)
-    df["cost_scaled"] = cost_scaled
+    # Margin-at-risk proxy (consistent, explainable)
+    df["freight_pct_of_value"] = df["mode_dsc"].map(MODE_FREIGHT_PCT).astype(float).fillna(0.04)
+    df["order_value_proxy"] = df["freight_cost_est"] / df["freight_pct_of_value"]
+    df["margin_pct"] = df["carrier_type"].map(margin_map).astype(float).fillna(0.25)
 
-    late_days = df["ship_late_day_count"].astype(float)
-    late_days_scaled = (late_days - late_days.min()) / (late_days.max() - late_days.min() + 1e-9)
-    df["late_days_scaled"] = late_days_scaled
-
-    df["risk_score"] = (
-        100 * (
-            0.35 * df["lane_late_rate"]
-            + 0.30 * df["carrier_late_rate"]
-            + 0.20 * df["late_days_scaled"]
-            + 0.10 * df["cost_scaled"]
-            + 0.05 * df["mode_risk"]
-        )
-    ).clip(0, 100)
+    df["gross_margin_proxy"] = df["order_value_proxy"] * df["margin_pct"]
+    df["margin_at_risk"] = df["gross_margin_proxy"] * df["is_late"].astype(int)
 
-    df["risk_band"] = pd.cut(df["risk_score"], [-1, 33, 66, 101], labels=["Low", "Medium", "High"])
+    # Inventory node: we don't have warehouse_id; we proxy "node" using plant_code + dest_port_cd.
+    df["node"] = df["plant_code"].astype(str) + " @ " + df["dest_port_cd"].astype(str)
+    return df
+
+
+def _fit_risk(kpis: dict, late_mean: float, cost_range: tuple, late_days_range: tuple) -> RiskModel:
+    # Lane/carrier late rates come from the shared KPI scan; scaling ranges and
+    # the overall late rate are dataset-wide, so batches score like the whole table
+    return RiskModel.from_stats(
+        late_mean,
+        kpis["lane_late"].set_index("lane")["late_rate"],
+        kpis["carrier_late"].set_index("carrier")["late_rate"],
+        cost_range,
+        late_days_range,
+    )
 
-    risk_shipments = df[
-        ["order_id", "order_date", "lane", "orig_port_cd", "dest_port_cd", "carrier", "mode_dsc",
-         "is_on_time", "is_late", "ship_late_day_count", "freight_cost_est", "risk_score", "risk_band"]
-    ].copy()
-    risk_shipments.to_csv(ANALYTICS_DIR / "risk_shipments.csv", index=False)
 
-    # -----------------------------------
-    # 3) Exceptions queue (what ops teams work from)
-    # -----------------------------------
+def _top_exceptions(df: pd.DataFrame, model: RiskModel, n: int = TOP_EXCEPTIONS) -> pd.DataFrame:
     late_df = df[df["is_late"] == True].copy()
     if late_df.empty:
-        exceptions = pd.DataFrame(columns=["order_id","order_date","lane","carrier","mode_dsc","ship_late_day_count","freight_cost_est","risk_score","priority_score"])
-    else:
-        late_df["priority_score"] = (0.65 * late_df["risk_score"] + 0.35 * (late_df["cost_scaled"] * 100)).clip(0, 100)
-        exceptions = (
-            late_df.sort_values("priority_score", ascending=False)
-                   .head(50)[
-                       ["order_id","order_date","lane","carrier","mode_dsc","ship_late_day_count","freight_cost_est","risk_score","risk_band","priority_score"]
-                   ]
-        )
-    exceptions.to_csv(ANALYTICS_DIR / "exceptions.csv", index=False)
+        return pd.DataFrame(columns=EXCEPTION_COLS)
+    late_df["priority_score"] = model.priority(late_df)
+    # Partial selection of the n highest priorities; ties keep input order
+    return top_k(late_df, "priority_score", n)[EXCEPTION_COLS]
+
 
+def _seasonality(kpis: dict) -> dict:
     # -----------------------------------
     # 4) Seasonality (monthly trends)
     # -----------------------------------
-    df["month"] = df["order_date"].dt.to_period("M").astype(str)
-    seasonality = (
-        df.groupby("month", dropna=False)
-          .agg(
-              orders=("order_id", "count"),
-              on_time_rate=("is_on_time", "mean"),
-              late_rate=("is_late", "mean"),
-              avg_late_days=("ship_late_day_count", "mean"),
-              total_freight_cost=("freight_cost_est", "sum"),
-              avg_freight_cost=("freight_cost_est", "mean"),
-          )
-          .reset_index()
-          .sort_values("month")
-    )
+    seasonality = kpis["seasonality_monthly"].sort_values("month")
     seasonality["seasonality_index_orders"] = seasonality["orders"] / (seasonality["orders"].mean() + 1e-9)
-    seasonality.to_csv(ANALYTICS_DIR / "seasonality_monthly.csv", index=False)
+    return {"seasonality_monthly": seasonality}
 
-    # -----------------------------------
-    # 5) Margin-at-risk proxy (consistent, explainable)
-    # -----------------------------------
-    # We do NOT invent "real revenue". We proxy order value from freight cost as % of value.
-    MODE_FREIGHT_PCT = {"AIR": 0.06, "SEA": 0.03, "TRUCK": 0.04, "RAIL": 0.035}
-    df["freight_pct_of_value"] = df["mode_dsc"].map(MODE_FREIGHT_PCT).fillna(0.04)
-    df["order_value_proxy"] = df["freight_cost_est"] / df["freight_pct_of_value"]
 
-    # margin % by carrier_type for stability (avoids random per-row noise)
-    rng = np.random.default_rng(42)
-    ct_list = sorted(df["carrier_type"].dropna().unique().tolist())
-    margin_map = {ct: float(rng.uniform(0.18, 0.35)) for ct in ct_list}
-    df["margin_pct"] = df["carrier_type"].map(margin_map).fillna(0.25)
+def _backlog(kpis: dict) -> dict:
+    # Day-by-day plant backlog against Daily_Capacity (orders carried forward when over capacity)
+    with step("plant backlog", rows_in=len(kpis["plant_daily"])) as metrics:
+        daily, summary = backlog_tables(kpis["plant_daily"], day=DAY)
+        metrics.rows_out = len(daily)
+    return {"plant_backlog_daily": daily, "plant_backlog": summary}
 
-    df["gross_margin_proxy"] = df["order_value_proxy"] * df["margin_pct"]
-    df["margin_at_risk"] = df["gross_margin_proxy"] * df["is_late"].astype(int)
 
-    kpi_mar = (
-        df.groupby(["mode_dsc", "lane", "carrier"], dropna=False)
-          .agg(
-              orders=("order_id", "count"),
-              late_rate=("is_late", "mean"),
-              total_freight_cost=("freight_cost_est", "sum"),
-              total_order_value_proxy=("order_value_proxy", "sum"),
-              total_margin_proxy=("gross_margin_proxy", "sum"),
-              total_margin_at_risk=("margin_at_risk", "sum"),
-          )
-          .reset_index()
-    )
+def _margin(kpis: dict) -> dict:
+    # -----------------------------------
+    # 5) Margin-at-risk proxy (consistent, explainable)
+    # -----------------------------------
+    # We do NOT invent "real revenue"; order value is proxied from freight cost (see 0).
+    kpi_mar = kpis["kpi_margin_at_risk"]
     kpi_mar["margin_at_risk_pct"] = kpi_mar["total_margin_at_risk"] / (kpi_mar["total_margin_proxy"] + 1e-9)
-    kpi_mar.to_csv(ANALYTICS_DIR / "kpi_margin_at_risk.csv", index=False)
+    return {"kpi_margin_at_risk": kpi_mar}
 
+
+def _inventory(kpis: dict) -> dict:
     # -----------------------------------
     # 6) Inventory risk proxy (warehouse cost + capacity + volume)
     # -----------------------------------
-    # We don't have warehouse_id; we proxy "node" using plant_code + dest_port_cd.
-    df["node"] = df["plant_code"].astype(str) + " @ " + df["dest_port_cd"].astype(str)
-
-    node = (
-        df.groupby("node", dropna=False)
-          .agg(
-              orders=("order_id", "count"),
-              avg_daily_capacity=("daily_capacity", "mean"),
-              avg_wh_cost_per_unit=("wh_cost_per_unit", "mean"),
-              avg_unit_qty=("unit_quantity", "mean"),
-              avg_weight=("weight", "mean"),
-              late_rate=("is_late", "mean"),
-          )
-          .reset_index()
-    )
+    node = kpis["inventory_risk"]
 
     # Risk score: demand pressure vs capacity + late rate + warehouse cost
     demand_scaled = (node["orders"] - node["orders"].min()) / (node["orders"].max() - node["orders"].min() + 1e-9)
@@ -199,27 +206,281 @@ def main() -> None:
 
     node["inventory_risk_score"] = (100 * (0.45 * demand_scaled + 0.30 * (1 - cap_scaled) + 0.15 * whc_scaled + 0.10 * node["late_rate"])).clip(0, 100)
     node["inventory_risk_band"] = pd.cut(node["inventory_risk_score"], [-1, 33, 66, 101], labels=["Low", "Medium", "High"])
-    node.to_csv(ANALYTICS_DIR / "inventory_risk.csv", index=False)
+    return {"inventory_risk": node}
+
 
+def _scenarios(scenarios: ScenarioAccumulator, **sim) -> dict:
     # -----------------------------------
-    # 7) Scenarios table (simple exec what-if)
+    # 7) Scenarios (Monte Carlo what-if)
     # -----------------------------------
-    baseline_cost = float(df["freight_cost_est"].sum())
-    baseline_on_time = float(df["is_on_time"].mean())
+    # Fuel, congestion and capacity shocks drawn per trial and per lane/carrier;
+    # orders are re-costed and re-checked for lateness in every trial
+    with step("scenarios") as metrics:
+        table = simulate(scenarios.inputs(), **sim)
+        metrics.rows_out = len(table)
+    return {"scenarios": table}
+
+
+def _sla(kpis: dict) -> dict:
+    # -----------------------------------
+    # 1) SLA layer (rule-based targets)
+    # -----------------------------------
+    kpi_sla = kpis["kpi_sla"]
+    kpi_sla["sla_breach_pp"] = ((kpi_sla["sla_target"] - kpi_sla["on_time_rate"]) * 100).clip(lower=0)
+    kpi_sla["sla_score"] = (kpi_sla["on_time_rate"] / kpi_sla["sla_target"]).clip(upper=1.25)
+    return {"kpi_sla": kpi_sla}
+
+
+def _save_state(daily: KpiAccumulator) -> None:
+    # Per-day partials plus the fact_orders day hashes they were built from
+    daily.save(STATE_DIR)
+    STATE_DAYS.write_text(json.dumps(day_hashes(FACT_TABLE, ANALYTICS_DIR), indent=2, sort_keys=True))
+
+
+def _summary_blocks(kpis: dict) -> dict:
+    # Output blocks that only read the finished aggregates, each returning its own tables.
+    # Scenarios are not among them: they fork a process pool, which must not
+    # happen while block threads are running, so callers run them first.
+    return {
+        "sla": partial(_sla, kpis),
+        "seasonality": partial(_seasonality, kpis),
+        "backlog": partial(_backlog, kpis),
+        "margin": partial(_margin, kpis),
+        "inventory": partial(_inventory, kpis),
+    }
+
+
+def _run_blocks(blocks: dict, jobs: int) -> list:
+    # Independent blocks run side by side in threads (Arrow writes and most
+    # numpy/pandas kernels release the GIL); the first failure is re-raised
+    if jobs <= 1:
+        return [block() for block in blocks.values()]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(block) for block in blocks.values()]
+    return [future.result() for future in futures]
+
+
+def _build_blocks(blocks: dict, jobs: int) -> dict:
+    # Each block returns its own tables; merged into one dict by name
+    return {name: table for result in _run_blocks(blocks, jobs) for name, table in result.items()}
+
+
+def _write_tables(tables: dict, export_csv: bool, jobs: int = 1) -> None:
+    writes = {name: partial(write_table, table, name, ANALYTICS_DIR, export_csv=export_csv) for name, table in tables.items()}
+    _run_blocks(writes, jobs)
+
+
+def _write_blocks(blocks: dict, export_csv: bool, jobs: int) -> None:
+    _write_tables(_build_blocks(blocks, jobs), export_csv, jobs)
 
-    scenarios = pd.DataFrame(
-        [
-            ("Baseline", 0.00, 0.00, baseline_cost, baseline_on_time),
-            ("Fuel +10% (cost +7%)", 0.10, 0.00, baseline_cost * 1.07, baseline_on_time),
-            ("Port congestion +20% (OT -2pp)", 0.00, 0.20, baseline_cost * 1.01, max(0.0, baseline_on_time - 0.02)),
-            ("Capacity constraint (OT -1pp, cost +3%)", 0.00, 0.00, baseline_cost * 1.03, max(0.0, baseline_on_time - 0.01)),
-        ],
-        columns=["scenario", "fuel_increase", "port_congestion", "total_freight_cost_est", "on_time_rate_est"]
-    )
-    scenarios.to_csv(ANALYTICS_DIR / "scenarios.csv", index=False)
+
+def _risk(df: pd.DataFrame, kpis: dict, top_exceptions: int) -> dict:
+    # -----------------------------------
+    # 2) Risk scoring (derived from your data)
+    # -----------------------------------
+    cost = df["freight_cost_est"].astype(float)
+    late_days = df["ship_late_day_count"].astype(float)
+    model = _fit_risk(kpis, df["is_late"].mean(), (cost.min(), cost.max()), (late_days.min(), late_days.max()))
+    # Scores go on a shallow copy so the blocks running alongside see the fact unchanged
+    with step("risk scoring", rows_in=len(df)) as metrics:
+        scored = model.score(df.copy(deep=False))
+        metrics.rows_out = len(scored)
+
+    # -----------------------------------
+    # 3) Exceptions queue (what ops teams work from)
+    # -----------------------------------
+    with step("exceptions", rows_in=len(scored)) as metrics:
+        exceptions = _top_exceptions(scored, model, top_exceptions)
+        metrics.rows_out = len(exceptions)
+    return {"risk_shipments": scored[RISK_COLS].copy(), "exceptions": exceptions, RISK_STATE: model}
+
+
+def build(
+    tables: dict[str, pd.DataFrame],
+    top_exceptions: int = TOP_EXCEPTIONS,
+    trials: int = SCENARIO_TRIALS,
+    seed: int = SCENARIO_SEED,
+    workers: int | None = None,
+    jobs: int | None = None,
+) -> dict:
+    """The control tower tables from ``fact_orders``. ``RISK_STATE`` and
+    ``DAILY_STATE`` hold the fitted risk model and the per-day partials
+    that ``save`` keeps for scoring new orders and --incremental runs."""
+    # Drivers go on a shallow copy: the caller's frame may feed other stages
+    df = tables[FACT_TABLE].copy(deep=False)
+    _check_columns(df.columns)
+
+    with step("drivers", rows_in=len(df)) as metrics:
+        df = _add_drivers(df, _margin_map(df["carrier_type"].dropna().unique().tolist()))
+        metrics.rows_out = len(df)
+
+    # One factorization of the shared keys feeds every aggregate below
+    derived = {DAY: df["order_date"].dt.normalize()}
+    kpis = compute_kpis(df, KPI_SPECS, derived=derived)
+
+    daily = KpiAccumulator(DAILY_SPECS, by=DAY)
+    daily.update(df, derived=derived)
+
+    scenarios = ScenarioAccumulator()
+    scenarios.update(df)
+    outputs = _scenarios(scenarios, trials=trials, seed=seed, workers=workers or os.cpu_count() or 1)
+
+    blocks = _summary_blocks(kpis)
+    blocks["risk"] = partial(_risk, df, kpis, top_exceptions)
+    outputs.update(_build_blocks(blocks, jobs or os.cpu_count() or 1))
+    outputs[DAILY_STATE] = daily
+    return outputs
+
+
+def save(outputs: dict, export_csv: bool = False, jobs: int | None = None) -> None:
+    # The state records fact_orders' stored day hashes, so the fact must be written first
+    tables = {name: table for name, table in outputs.items() if name not in (RISK_STATE, DAILY_STATE)}
+    _write_tables(tables, export_csv, jobs or os.cpu_count() or 1)
+    outputs[RISK_STATE].save(RISK_MODEL)
+    _save_state(outputs[DAILY_STATE])
+
+
+def main(
+    export_csv: bool = False,
+    chunked: bool = False,
+    batch_size: int = DEFAULT_BATCH_ROWS,
+    incremental: bool = False,
+    top_exceptions: int = TOP_EXCEPTIONS,
+    trials: int = SCENARIO_TRIALS,
+    seed: int = SCENARIO_SEED,
+    workers: int | None = None,
+    jobs: int | None = None,
+) -> None:
+    if not table_exists(FACT_TABLE, ANALYTICS_DIR):
+        raise FileNotFoundError(f"Missing {FACT_TABLE} in {ANALYTICS_DIR}. Run scripts/02_prepare_data.py first.")
+    if incremental:
+        return main_incremental(export_csv=export_csv)
+    if chunked:
+        return main_chunked(
+            export_csv=export_csv, batch_size=batch_size, top_exceptions=top_exceptions,
+            trials=trials, seed=seed, workers=workers, jobs=jobs,
+        )
+
+    tables = {FACT_TABLE: read_table(FACT_TABLE, ANALYTICS_DIR)}
+    outputs = build(tables, top_exceptions=top_exceptions, trials=trials, seed=seed, workers=workers, jobs=jobs)
+    save(outputs, export_csv, jobs)
+
+    print("Wrote v2 control tower tables to data/analytics/")
+
+
+def main_chunked(
+    export_csv: bool = False,
+    batch_size: int = DEFAULT_BATCH_ROWS,
+    top_exceptions: int = TOP_EXCEPTIONS,
+    trials: int = SCENARIO_TRIALS,
+    seed: int = SCENARIO_SEED,
+    workers: int | None = None,
+    jobs: int | None = None,
+) -> None:
+    # Out-of-core variant. Risk scores depend on dataset-wide late rates and
+    # scaling ranges, so the fact table is streamed twice: pass 1 folds the
+    # aggregates and ranges, pass 2 scores and appends each batch. Only KPI
+    # partials and the running top exceptions stay resident.
+    # The margin map is keyed on the sorted carrier types of the whole table
+    carrier_types = set()
+    for batch in iter_table(FACT_TABLE, ANALYTICS_DIR, columns=["carrier_type"], batch_size=batch_size):
+        carrier_types.update(batch["carrier_type"].dropna().unique().tolist())
+    margin_map = _margin_map(carrier_types)
+
+    # Pass 1: aggregates, scaling ranges and the scenario group sums
+    acc = KpiAccumulator(KPI_SPECS)
+    daily = KpiAccumulator(DAILY_SPECS, by=DAY)
+    cost_lo = late_lo = np.inf
+    cost_hi = late_hi = -np.inf
+    rows = late = 0
+    scenarios = ScenarioAccumulator()
+    for df in iter_table(FACT_TABLE, ANALYTICS_DIR, batch_size=batch_size):
+        _check_columns(df.columns)
+        df = _add_drivers(df, margin_map)
+        derived = {DAY: df["order_date"].dt.normalize()}
+        acc.update(df, derived=derived)
+        daily.update(df, derived=derived)
+        cost = df["freight_cost_est"].astype(float)
+        late_days = df["ship_late_day_count"].astype(float)
+        cost_lo, cost_hi = min(cost_lo, cost.min()), max(cost_hi, cost.max())
+        late_lo, late_hi = min(late_lo, late_days.min()), max(late_hi, late_days.max())
+        rows += len(df)
+        late += int(df["is_late"].sum())
+        scenarios.update(df)
+
+    kpis = acc.result()
+    _save_state(daily)
+    model = _fit_risk(kpis, late / rows if rows else np.nan, (cost_lo, cost_hi), (late_lo, late_hi))
+    model.save(RISK_MODEL)
+
+    _write_tables(_scenarios(scenarios, trials=trials, seed=seed, workers=workers or os.cpu_count() or 1), export_csv)
+
+    # The summary blocks only need the aggregates, so they run while pass 2 streams
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        block_jobs = max((jobs or os.cpu_count() or 1) - 1, 1)
+        summaries = pool.submit(_write_blocks, _summary_blocks(kpis), export_csv, block_jobs)
+
+        # Pass 2: score each batch, append it, and keep only the running top exceptions
+        exceptions = pd.DataFrame(columns=EXCEPTION_COLS)
+        with TableWriter("risk_shipments", ANALYTICS_DIR, export_csv=export_csv) as writer:
+            for df in iter_table(FACT_TABLE, ANALYTICS_DIR, batch_size=batch_size):
+                with step("risk scoring", rows_in=len(df)) as metrics:
+                    df = model.score(_add_drivers(df, margin_map))
+                    metrics.rows_out = len(df)
+                writer.write(df[RISK_COLS])
+                top = _top_exceptions(df, model, top_exceptions)
+                if not top.empty:
+                    merged = top if exceptions.empty else pd.concat([exceptions, top], ignore_index=True)
+                    exceptions = top_k(merged, "priority_score", top_exceptions)
+        write_table(exceptions, "exceptions", ANALYTICS_DIR, export_csv=export_csv)
+    summaries.result()
 
     print("Wrote v2 control tower tables to data/analytics/")
 
 
+def main_incremental(export_csv: bool = False) -> None:
+    # Daily refresh of the per-day aggregates (kpi_sla, seasonality_monthly):
+    # only fact_orders days whose hash changed since the last run are re-read
+    # and merged into the stored partials. Risk scores, exceptions, margin and
+    # inventory tables depend on dataset-wide rates and ranges, so they keep
+    # their last full-run values until the next full run.
+    if not STATE_DAYS.exists():
+        raise FileNotFoundError(f"Missing {STATE_DAYS}. Run a full build of this stage first.")
+    source = day_hashes(FACT_TABLE, ANALYTICS_DIR)
+    days = changed_days(source, json.loads(STATE_DAYS.read_text()))
+
+    daily = KpiAccumulator.load(DAILY_SPECS, STATE_DIR, by=DAY)
+    daily.drop(pd.to_datetime(days, errors="coerce"))
+    present = [d for d in days if d in source]
+    if present:
+        df = read_table(FACT_TABLE, ANALYTICS_DIR, days=present)
+        _check_columns(df.columns)
+        # Margin columns do not feed the daily aggregates, so no margin map is needed
+        df = _add_drivers(df, {})
+        daily.update(df, derived={DAY: df["order_date"].dt.normalize()})
+
+    kpis = daily.result()
+    _write_tables({**_sla(kpis), **_seasonality(kpis), **_backlog(kpis)}, export_csv)
+    _save_state(daily)
+
+    print(f"Incremental refresh: {len(days)} changed day(s) merged into kpi_sla, seasonality_monthly and plant backlog")
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Also export CSV copies of the control tower tables")
+    parser.add_argument("--chunked", action="store_true", help="Stream the fact table in row batches (bounded memory)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per batch with --chunked")
+    parser.add_argument("--incremental", action="store_true", help="Merge only changed fact_orders days into kpi_sla, seasonality and plant backlog")
+    parser.add_argument("--top-exceptions", type=int, default=TOP_EXCEPTIONS, help="Rows kept in the exceptions queue")
+    parser.add_argument("--trials", type=int, default=SCENARIO_TRIALS, help="Monte Carlo trials per scenario")
+    parser.add_argument("--seed", type=int, default=SCENARIO_SEED, help="Seed for the scenario draws")
+    parser.add_argument("--workers", type=int, default=None, help="Scenario simulation processes (default: CPU count)")
+    parser.add_argument("--jobs", type=int, default=None, help="Output blocks built in parallel threads (default: CPU count)")
+    args = parser.parse_args()
+    with instrument("control_tower"):
+        main(
+            export_csv=args.csv, chunked=args.chunked, batch_size=args.batch_size,
+            incremental=args.incremental, top_exceptions=args.top_exceptions,
+            trials=args.trials, seed=args.seed, workers=args.workers, jobs=args.jobs,
+        )
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from control_tower.bench import (
+    RESULTS_DIR, CaseResult, compare_results, environment, load_results, make_workspace, run_stage, save_results,
+    summarize, time_call,
+)
+from control_tower.bitmaps import FilterIndex
+from control_tower.dashboard import (
+    by_carrier, by_lane, cube_by_carrier, cube_by_lane, cube_kpis, filter_cube, summary_kpis, triage_queue,
+)
+from control_tower.metrics import new_run_id
+from control_tower.pipeline import STAGES
+from control_tower.risk import RiskModel
+from control_tower.storage import read_table
+
+ROOT = Path(__file__).resolve().parents[1]
+PROCESSED_DIR = ROOT / "data" / "processed"
+
+# Ingest parses the workbooks, whose size is fixed; every later stage is timed
+BENCH_STAGES = STAGES[1:]
+# Sidebar multiselects, in the order the app applies them, then the app's other indexed columns
+FILTER_COLS = ["carrier", "svc_cd", "mode_dsc", "plant_code"]
+INDEX_COLS = [*FILTER_COLS, "orig_port_cd", "dest_port_cd", "is_late"]
+
+def _stage_cases(workspace: Path, size: int, rows: int, repeat: int) -> list[CaseResult]:
+    # Whole pipeline passes, so each stage reads what the one before it wrote
+    runs = {stage.name: [] for stage in BENCH_STAGES}
+    for _ in range(repeat):
+        for stage in BENCH_STAGES:
+            runs[stage.name].append(run_stage(workspace, stage)["total"])
+    return [
+        summarize("stage", name, size, rows, [t["wall_s"] for t in totals],
+                  max((t["peak_rss_mb"] for t in totals if t["peak_rss_mb"] is not None), default=None))
+        for name, totals in runs.items()
+    ]
+
+def _app_cases(workspace: Path, size: int, repeat: int, queue_rows: int) -> list[CaseResult]:
+    analytics = workspace / "data" / "analytics"
+    fact = read_table("fact_orders", analytics)
+    model = analytics / "risk_model.json"
+    risk = RiskModel.load(model) if model.exists() else None
+    start, end = fact["order_date"].min().date(), fact["order_date"].max().date()
+
+    index = FilterIndex(fact, INDEX_COLS, "order_date")
+
+    # A user narrowing the view: the most common value of each filter in what is left
+    picks, narrowed = {}, fact
+    for col in FILTER_COLS:
+        if col in narrowed.columns and len(narrowed):
+            picks[col] = narrowed[col].value_counts().index[:1].tolist()
+            narrowed = narrowed[narrowed[col].isin(picks[col])]
+
+    def filter_chain() -> np.ndarray:
+        # Sidebar options and selections, as the app combines them on every rerun
+        bits = index.dates(start, end)
+        for col, selected in picks.items():
+            index.options(col, bits)
+            bits = index.narrow(bits, col, selected)
+        return index.positions(bits)
+
+    late = index.positions(index.narrow(index.dates(start, end), "is_late", [True]))
+
+    cube = read_table("kpi_cube", analytics)
+
+    def cube_roll_up() -> tuple:
+        # Tiles, alerts and driver charts of the narrowed view from the cube
+        cells = filter_cube(cube, start, end, picks)
+        return cube_kpis(cells), cube_by_carrier(cells), cube_by_lane(cells)
+
+    cases = {
+        "load_fact": lambda: read_table("fact_orders", analytics),
+        "filter index": lambda: FilterIndex(fact, INDEX_COLS, "order_date"),
+        "filter chain": filter_chain,
+        "summary kpis": lambda: summary_kpis(fact),
+        "carrier groupby": lambda: by_carrier(fact),
+        "lane groupby": lambda: by_lane(fact),
+        "triage queue": lambda: triage_queue(fact, risk, queue_rows, rows=late),
+        "cube roll-up": cube_roll_up,
+    }
+    results = []
+    for name, fn in cases.items():
+        seconds, peak = time_call(fn, repeat)
+        results.append(summarize("app", name, size, len(fact), seconds, peak))
+    return results
+
+def main(
+    sizes: list[int] = (0, 100_000, 1_000_000),
+    days: int = 90,
+    seed: int = 42,
+    repeat: int = 3,
+    app_repeat: int = 20,
+    suites: list[str] = ("stage", "app"),
+    queue_rows: int = 100,
+    out: Path | None = None,
+    compare: Path | None = None,
+    threshold: float = 0.2,
+) -> int:
+    run_id = new_run_id()
+    meta = {
+        "run_id": run_id,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **environment(),
+        "settings": {"sizes": list(sizes), "days": days, "seed": seed, "repeat": repeat, "app_repeat": app_repeat},
+    }
+    results: list[CaseResult] = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+            started = time.perf_counter()
+            workspace = make_workspace(Path(tmp), size, days, seed, PROCESSED_DIR)
+            rows = len(read_table("OrderList", workspace / "data" / "processed", columns=["Order_ID"]))
+            if "stage" in suites:
+                results += _stage_cases(workspace, size, rows, repeat)
+            else:
+                # The app cases read the stages' outputs
+                for stage in BENCH_STAGES:
+                    run_stage(workspace, stage)
+            if "app" in suites:
+                results += _app_cases(workspace, size, app_repeat, queue_rows)
+            print(f"[{size or 'sample'}] {rows:,} orders benchmarked in {time.perf_counter() - started:.1f}s")
+
+    path = save_results(results, meta, out or RESULTS_DIR / f"{run_id}.json")
+    table = pd.DataFrame(results)
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(table[["suite", "case", "size", "rows", "p50_s", "p90_s", "p99_s", "rows_per_s", "peak_mb"]]
+              .to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    print(f"Results: {path}")
+
+    if compare is None:
+        return 0
+    report = compare_results(load_results(compare), table, threshold)
+    regressions = report[report["regression"]]
+    print(f"Compared {len(report)} case(s) against {compare}")
+    if regressions.empty:
+        print(f"No regressions (threshold +{threshold:.0%})")
+        return 0
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(regressions.drop(columns=["regression"]).to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    print(f"{len(regressions)} regression(s) over +{threshold:.0%}")
+    return 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and dashboard data functions")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100_000, 1_000_000],
+                        help="Synthetic order counts to benchmark (0 = the ingested sample)")
+    parser.add_argument("--days", type=int, default=90, help="Order days the synthetic orders are spread over")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic orders")
+    parser.add_argument("--repeat", type=int, default=3, help="Pipeline passes per size")
+    parser.add_argument("--app-repeat", type=int, default=20, help="Timed calls per dashboard case")
+    parser.add_argument("--suite", nargs="+", choices=["stage", "app"], default=["stage", "app"], help="Suites to run")
+    parser.add_argument("--queue-rows", type=int, default=100, help="Triage queue size")
+    parser.add_argument("--out", type=Path, default=None, help="Results file (default: data/_bench/<run id>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Median slowdown flagged as a regression (0.2 = +20%%)")
+    args = parser.parse_args()
+    sys.exit(main(
+        sizes=args.sizes, days=args.days, seed=args.seed, repeat=args.repeat, app_repeat=args.app_repeat,
+        suites=args.suite, queue_rows=args.queue_rows, out=args.out, compare=args.compare, threshold=args.threshold,
+    ))
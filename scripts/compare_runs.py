@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import argparse
+import sys
+
+import pandas as pd
+
+from control_tower.metrics import BASELINE, MIN_MB, MIN_SECONDS, compare_runs, load_run, resolve_run, save_baseline
+
+def main(
+    current: str = "latest",
+    baseline: str = BASELINE,
+    threshold: float = 0.2,
+    min_seconds: float = MIN_SECONDS,
+    min_mb: float = MIN_MB,
+    set_baseline: bool = False,
+) -> int:
+    run_dir = resolve_run(current)
+    if set_baseline:
+        print(f"Baseline: {save_baseline(run_dir)} (from {run_dir.name})")
+        return 0
+
+    base_dir = resolve_run(baseline)
+    report = compare_runs(load_run(base_dir), load_run(run_dir), threshold, min_seconds, min_mb)
+    print(f"Comparing {run_dir.name} against {base_dir.name}: {report[['stage', 'step']].drop_duplicates().shape[0]} step(s)")
+
+    changed = report.loc[report["rows_changed"], ["stage", "step"]].drop_duplicates()
+    if len(changed):
+        print(f"Row counts differ in {len(changed)} step(s); their timings compare different work:")
+        print(changed.to_string(index=False))
+
+    regressions = report[report["regression"]]
+    if regressions.empty:
+        print(f"No regressions (threshold +{threshold:.0%})")
+        return 0
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(regressions.drop(columns=["regression"]).to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    print(f"{len(regressions)} regression(s) over +{threshold:.0%}")
+    return 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag stage metrics that regressed against a baseline run")
+    parser.add_argument("current", nargs="?", default="latest", help="Run id or directory (default: the latest run)")
+    parser.add_argument("--baseline", default=BASELINE, help="Run to compare against (default: the stored baseline)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative growth flagged as a regression (0.2 = +20%%)")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS, help="Ignore time changes smaller than this")
+    parser.add_argument("--min-mb", type=float, default=MIN_MB, help="Ignore memory and size changes smaller than this (MB)")
+    parser.add_argument("--set-baseline", action="store_true", help="Store the run as the baseline instead of comparing")
+    args = parser.parse_args()
+    sys.exit(main(
+        current=args.current, baseline=args.baseline, threshold=args.threshold,
+        min_seconds=args.min_seconds, min_mb=args.min_mb, set_baseline=args.set_baseline,
+    ))
@@ -0,0 +1 @@
+"""Shared building blocks for the control tower pipeline scripts."""
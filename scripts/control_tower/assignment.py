@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from control_tower.context import code_strings
+from control_tower.feasibility import PairIndex
+from control_tower.rates import DEFAULT_MAX_PAIRS, LaneRateIndex, shop_rates
+
+# Customer-referred freight: the customer books and pays the carrier, so only
+# the warehouse leg is costed and any port linked to the plant will do
+CUSTOMER_FREIGHT = {"CRF"}
+# Rounds of pairwise swaps after the greedy pass
+SEARCH_ROUNDS = 10
+# Improvements below this are float noise
+_EPS = 1e-9
+
+
+def _fan_out(start: np.ndarray, count: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # (owner, row) pairs: owner i expands to rows start[i] .. start[i] + count[i] - 1
+    owner = np.repeat(np.arange(len(count)), count)
+    first = np.cumsum(count) - count
+    return owner, np.arange(len(owner)) - np.repeat(first - start, count)
+
+
+def _grouped(owners: pd.Index, keys: pd.Index, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # CSR layout of ``values`` by key: the values of owners[i] are out[offsets[i]:offsets[i + 1]]
+    pos = np.asarray(owners.get_indexer(keys))
+    order = np.argsort(pos, kind="stable")
+    order = order[pos[order] >= 0]
+    offsets = np.searchsorted(pos[order], np.arange(len(owners) + 1))
+    return offsets, values[order]
+
+
+@dataclass
+class Network:
+    """Which plant may serve which order, and at what warehouse cost and capacity.
+
+    A plant is feasible for an order when it stocks the product
+    (ProductsPerPlant), is not a VMI plant reserved for other customers
+    (VmiCustomers) and ships through at least one port (PlantPorts).
+    ``capacity`` is WhCapacities' Daily_Capacity, in orders per day.
+    """
+
+    plants: pd.Index           # plants with both a capacity and a warehouse cost
+    capacity: np.ndarray       # orders per day, per plant
+    wh_cost: np.ndarray        # warehouse cost per unit, per plant
+    products: pd.Index         # product ids stocked anywhere
+    product_offsets: np.ndarray
+    product_plants: np.ndarray  # plant positions, CSR by product
+    port_offsets: np.ndarray
+    ports: np.ndarray          # port codes, CSR by plant
+    vmi: np.ndarray            # plant only serves its listed customers
+    vmi_customers: PairIndex   # allowed (plant, customer) pairs of VMI plants
+
+    @classmethod
+    def from_tables(
+        cls,
+        products: pd.DataFrame,
+        ports: pd.DataFrame,
+        vmi: pd.DataFrame,
+        capacities: pd.DataFrame,
+        costs: pd.DataFrame,
+    ) -> "Network":
+        """Build from the reference sheets with 02_prepare_data's column names
+        (``plant_code``, ``product_id``, ``port``, ``customers``, ``daily_capacity``,
+        ``wh_cost_per_unit``)."""
+        cap = pd.to_numeric(capacities.set_index(code_strings(capacities["plant_code"]))["daily_capacity"], errors="coerce")
+        cost = pd.to_numeric(costs.set_index(code_strings(costs["plant_code"]))["wh_cost_per_unit"], errors="coerce")
+        cap, cost = cap[~cap.index.duplicated()].dropna(), cost[~cost.index.duplicated()].dropna()
+        plants = pd.Index(sorted(set(cap.index) & set(cost.index)))
+
+        stocked = products.assign(plant=code_strings(products["plant_code"]), product=code_strings(products["product_id"]))
+        stocked = stocked[stocked["plant"].isin(plants)].drop_duplicates(["plant", "product"])
+        product_index = pd.Index(stocked["product"].unique())
+        product_offsets, product_plants = _grouped(
+            product_index, pd.Index(stocked["product"]), plants.get_indexer(stocked["plant"])
+        )
+
+        linked = ports.assign(plant=code_strings(ports["plant_code"]), port_cd=code_strings(ports["port"]))
+        linked = linked.drop_duplicates(["plant", "port_cd"])
+        port_offsets, port_codes = _grouped(plants, pd.Index(linked["plant"]), linked["port_cd"].to_numpy(dtype=object))
+
+        vmi_customers = PairIndex.build(vmi["plant_code"], vmi["customers"])
+        return cls(
+            plants=plants,
+            capacity=cap.reindex(plants).to_numpy(dtype=np.int64),
+            wh_cost=cost.reindex(plants).to_numpy(dtype=float),
+            products=product_index,
+            product_offsets=product_offsets,
+            product_plants=product_plants,
+            port_offsets=port_offsets,
+            ports=port_codes,
+            vmi=vmi_customers.has_left(pd.Series(plants)),
+            vmi_customers=vmi_customers,
+        )
+
+    def candidates(self, orders: pd.DataFrame, rates: LaneRateIndex, max_pairs: int = DEFAULT_MAX_PAIRS) -> pd.DataFrame:
+        """Cheapest way for each order to ship from each feasible plant.
+
+        One row per (order position, plant): the plant's best port and the
+        cheapest rate row on that port's lane for the order's service and
+        weight, costed as warehouse (units x cost/unit) plus freight.
+        """
+        # Plants that stock the product
+        prod = np.asarray(self.products.get_indexer(code_strings(orders["product_id"])))
+        start = np.where(prod >= 0, self.product_offsets[prod.clip(min=0)], 0)
+        count = np.where(prod >= 0, self.product_offsets[prod.clip(min=0) + 1] - start, 0)
+        o, r = _fan_out(start, count)
+        plant = self.product_plants[r]
+
+        # VMI plants only serve their own customers
+        restricted = self.vmi[plant]
+        if restricted.any():
+            customers = orders["customer"].reset_index(drop=True)
+            allowed = np.ones(len(o), dtype=bool)
+            allowed[restricted] = self.vmi_customers.contains(
+                pd.Series(self.plants[plant[restricted]]), customers.iloc[o[restricted]]
+            )
+            o, plant = o[allowed], plant[allowed]
+
+        # Every port the plant ships through
+        i, r = _fan_out(self.port_offsets[plant], self.port_offsets[plant + 1] - self.port_offsets[plant])
+        o, plant, port = o[i], plant[i], self.ports[r]
+
+        lanes = pd.DataFrame({
+            "orig_port_cd": port,
+            "dest_port_cd": code_strings(orders["dest_port_cd"]).to_numpy(dtype=object)[o],
+            "svc_cd": code_strings(orders["svc_cd"]).to_numpy(dtype=object)[o],
+            "weight": pd.to_numeric(orders["weight"], errors="coerce").to_numpy(dtype=float)[o],
+        })
+        referred = lanes["svc_cd"].isin(CUSTOMER_FREIGHT).to_numpy()
+        shop = shop_rates(lanes, rates, max_pairs=max_pairs)
+        freight = np.where(referred, 0.0, shop["cheapest_cost"].to_numpy(dtype=float))
+        carrier = np.where(referred, orders["carrier"].astype(object).to_numpy()[o], shop["cheapest_carrier"].astype(object).to_numpy())
+        mode = np.where(referred, orders["mode_dsc"].astype(object).to_numpy()[o], shop["cheapest_mode_dsc"].astype(object).to_numpy())
+
+        units = pd.to_numeric(orders["unit_quantity"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        cands = pd.DataFrame({
+            "order": o, "plant": plant, "port": port, "carrier": carrier, "mode_dsc": mode,
+            "freight_cost": freight, "wh_cost": self.wh_cost[plant] * units[o],
+        })
+        cands = cands[cands["freight_cost"].notna()]
+        cands["cost"] = cands["freight_cost"] + cands["wh_cost"]
+        # Best port per (order, plant); candidates end up sorted by order, then cost
+        cands = cands.sort_values(["order", "cost", "plant"], kind="stable")
+        return cands.drop_duplicates(["order", "plant"]).reset_index(drop=True)
+
+
+def greedy(o: np.ndarray, slot: np.ndarray, cost: np.ndarray, remaining: np.ndarray, n: int) -> np.ndarray:
+    """Regret-ordered greedy assignment; returns the chosen candidate per order (-1 = none).
+
+    Candidates must be sorted by order, then cost. Each round every open order
+    proposes its cheapest slot with room left; slots take proposals with the
+    largest regret (gap to the order's next-best open slot) first. A round
+    either places every proposal or fills a slot, so at most slots + 1 rounds.
+    """
+    remaining = remaining.copy()
+    choice = np.full(n, -1)
+    active = remaining[slot] > 0
+    while True:
+        idx = np.flatnonzero(active & (choice[o] < 0))
+        if not len(idx):
+            return choice
+        head = np.flatnonzero(np.r_[True, o[idx][1:] != o[idx][:-1]])
+        best = idx[head]
+        nxt = head + 1
+        has_next = nxt < len(idx)
+        has_next[has_next] = o[idx[nxt[has_next]]] == o[best[has_next]]
+        regret = np.full(len(best), np.inf)
+        regret[has_next] = cost[idx[nxt[has_next]]] - cost[best[has_next]]
+
+        # Rank proposals within each slot: regret desc, cost asc, order position
+        order = np.lexsort((o[best], cost[best], -regret, slot[best]))
+        ranked = best[order]
+        s = slot[ranked]
+        first = np.r_[0, np.flatnonzero(s[1:] != s[:-1]) + 1]
+        rank = np.arange(len(ranked)) - np.repeat(first, np.diff(np.r_[first, len(ranked)]))
+        taken = ranked[rank < remaining[s]]
+
+        choice[o[taken]] = taken
+        remaining -= np.bincount(slot[taken], minlength=len(remaining))
+        active &= remaining[slot] > 0
+
+
+def improve(o: np.ndarray, slot: np.ndarray, cost: np.ndarray, choice: np.ndarray, rounds: int = SEARCH_ROUNDS) -> np.ndarray:
+    """Pairwise-swap local search over a feasible assignment.
+
+    Swapping an order at slot A that has a candidate at B with one at B that
+    has a candidate at A keeps every slot's load. Per (A, B) pair the cheapest
+    moves each way are matched k-th with k-th, which is the best set of swaps
+    for that pair; improving swaps are applied largest gain first, each order
+    at most once per round, until a round finds none.
+    """
+    choice = choice.copy()
+    for _ in range(rounds):
+        cur = choice[o]
+        assigned = cur >= 0
+        m = np.flatnonzero(assigned & (slot != slot[cur.clip(min=0)]))
+        if not len(m):
+            break
+        moves = pd.DataFrame({
+            "cand": m, "order": o[m], "a": slot[cur[m]], "b": slot[m], "delta": cost[m] - cost[cur[m]],
+        })
+        moves["lo"] = np.minimum(moves["a"], moves["b"])
+        moves["hi"] = np.maximum(moves["a"], moves["b"])
+        moves = moves.sort_values(["lo", "hi", "a", "delta", "cand"], kind="stable")
+        moves["k"] = moves.groupby(["lo", "hi", "a"], sort=False).cumcount()
+        fwd = moves[moves["a"] == moves["lo"]]
+        back = moves[moves["a"] == moves["hi"]]
+        pairs = fwd.merge(back, on=["lo", "hi", "k"], suffixes=("_f", "_b"))
+        pairs["gain"] = -(pairs["delta_f"] + pairs["delta_b"])
+        pairs = pairs[pairs["gain"] > _EPS].sort_values("gain", ascending=False, kind="stable")
+        if pairs.empty:
+            break
+
+        used = set()
+        applied = 0
+        for of, ob, cf, cb in zip(pairs["order_f"], pairs["order_b"], pairs["cand_f"], pairs["cand_b"]):
+            if of in used or ob in used:
+                continue
+            used.update((of, ob))
+            choice[of], choice[ob] = cf, cb
+            applied += 1
+        if not applied:
+            break
+    return choice
+
+
+def solve(
+    orders: pd.DataFrame,
+    network: Network,
+    rates: LaneRateIndex,
+    rounds: int = SEARCH_ROUNDS,
+    max_pairs: int = DEFAULT_MAX_PAIRS,
+) -> pd.DataFrame:
+    """Capacity-feasible plan for ``orders``: greedy placement, then swap search.
+
+    Capacity applies per plant and order day. Orders with no feasible plant
+    are ``infeasible``; those whose feasible plants are full that day are
+    ``over_capacity``. Both keep empty plan columns.
+    """
+    n = len(orders)
+    cands = network.candidates(orders, rates, max_pairs=max_pairs)
+    o = cands["order"].to_numpy()
+    cost = cands["cost"].to_numpy(dtype=float)
+
+    # One capacity slot per (order day, plant); undated orders share one day
+    day, days = pd.factorize(pd.to_datetime(orders["order_date"], errors="coerce").dt.normalize(), use_na_sentinel=False)
+    slot = np.asarray(day)[o] * len(network.plants) + cands["plant"].to_numpy()
+    capacity = np.tile(network.capacity, len(days))
+
+    choice = greedy(o, slot, cost, capacity, n)
+    choice = improve(o, slot, cost, choice, rounds=rounds)
+
+    picked = cands.reindex(choice)
+    plan = pd.DataFrame(index=orders.index)
+    plan["plan_plant_code"] = network.plants.to_numpy(dtype=object)[picked["plant"].fillna(0).astype(np.int64).to_numpy()]
+    plan.loc[choice < 0, "plan_plant_code"] = None
+    for col in ["port", "carrier", "mode_dsc", "freight_cost", "wh_cost", "cost"]:
+        plan[f"plan_{col}"] = picked[col].to_numpy()
+    has_option = np.bincount(o, minlength=n) > 0
+    plan["status"] = np.select([choice >= 0, has_option], ["assigned", "over_capacity"], default="infeasible")
+    return plan
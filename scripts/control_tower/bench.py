@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from control_tower.metrics import RUN_ID_ENV, new_run_id
+from control_tower.pipeline import Stage
+
+ROOT = Path(__file__).resolve().parents[2]
+# One JSON file per benchmark run: data/_bench/<run id>.json
+RESULTS_DIR = ROOT / "data" / "_bench"
+PERCENTILES = [50, 90, 99]
+
+
+@dataclass
+class CaseResult:
+    """Timings of one case at one dataset size.
+
+    ``size`` is the number of generated orders (0 for the ingested sample)
+    and ``rows`` the rows the case processed per call. Stage peaks are the
+    stage process's peak RSS; app peaks are what one call allocated at its
+    high point, on top of what was already live (``peak_call_mb``).
+    """
+
+    suite: str
+    case: str
+    size: int
+    rows: int
+    repeat: int
+    mean_s: float
+    min_s: float
+    p50_s: float
+    p90_s: float
+    p99_s: float
+    rows_per_s: float
+    peak_mb: float | None
+
+
+def summarize(suite: str, case: str, size: int, rows: int, seconds: list[float], peak_mb: float | None) -> CaseResult:
+    p50, p90, p99 = np.percentile(seconds, PERCENTILES)
+    return CaseResult(
+        suite=suite, case=case, size=size, rows=rows, repeat=len(seconds),
+        mean_s=float(np.mean(seconds)), min_s=float(np.min(seconds)),
+        p50_s=float(p50), p90_s=float(p90), p99_s=float(p99),
+        rows_per_s=rows / p50 if p50 > 0 else float("inf"),
+        peak_mb=peak_mb,
+    )
+
+
+def peak_call_mb(fn: Callable[[], object]) -> float:
+    """Memory one call of ``fn`` needs at its high point, in MB.
+
+    tracemalloc sees NumPy and Python allocations; Arrow's own buffers
+    (columns read from Parquet) are not traced, so the Arrow memory the
+    result still holds is added on top.
+    """
+    arrow = pa.total_allocated_bytes()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    peak += max(pa.total_allocated_bytes() - arrow, 0)
+    del result
+    return peak / (1 << 20)
+
+
+def time_call(fn: Callable[[], object], repeat: int, warmup: int = 1) -> tuple[list[float], float]:
+    """Wall times of ``repeat`` calls after ``warmup`` untimed ones, and the
+    peak memory of one more call measured on its own."""
+    for _ in range(warmup):
+        fn()
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - started)
+    return seconds, peak_call_mb(fn)
+
+
+def make_workspace(directory: Path, size: int, days: int, seed: int, source: Path) -> Path:
+    """A copy of the scripts with its own data/: the ingested sample when
+    ``size`` is 0, else ``size`` synthetic orders fitted on it. Stages run
+    there leave the repository's data/ alone."""
+    directory = Path(directory)
+    shutil.copytree(ROOT / "scripts", directory / "scripts", ignore=shutil.ignore_patterns("__pycache__"))
+    processed = directory / "data" / "processed"
+    if size == 0:
+        shutil.copytree(source, processed)
+        return directory
+    proc = subprocess.run(
+        [sys.executable, "scripts/generate_synthetic_data.py", "--orders", str(size), "--days", str(days),
+         "--seed", str(seed), "--source", str(source), "--out", str(processed)],
+        cwd=directory, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Generating {size:,} orders failed:\n{proc.stdout}{proc.stderr}")
+    return directory
+
+
+def run_stage(workspace: Path, stage: Stage) -> dict:
+    """Run a stage script in ``workspace`` and return its metrics manifest."""
+    run_id = new_run_id()
+    proc = subprocess.run(
+        [sys.executable, f"scripts/{stage.script}"],
+        cwd=workspace, capture_output=True, text=True, env={**os.environ, RUN_ID_ENV: run_id},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"[{stage.name}] failed:\n{proc.stdout}{proc.stderr}")
+    return json.loads((workspace / "data" / "_runs" / run_id / f"{stage.name}.json").read_text())
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(results: list[CaseResult], meta: dict, path: Path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({**meta, "results": [asdict(r) for r in results]}, indent=2))
+    return path
+
+
+def load_results(path: Path) -> pd.DataFrame:
+    data = json.loads(Path(path).read_text())
+    return pd.DataFrame(data["results"], columns=list(CaseResult.__dataclass_fields__))
+
+
+def compare_results(
+    baseline: pd.DataFrame,
+    current: pd.DataFrame,
+    threshold: float = 0.2,
+    min_seconds: float = 0.005,
+) -> pd.DataFrame:
+    """Median latency and peak memory per case against a baseline file.
+
+    A case regressed when its median grew by more than ``threshold`` and
+    by more than ``min_seconds``; cases in only one file are left out.
+    """
+    keys = ["suite", "case", "size"]
+    both = baseline.merge(current, on=keys, suffixes=("_base", "_cur"))
+    change = both["p50_s_cur"] / both["p50_s_base"].where(both["p50_s_base"] > 0) - 1
+    return pd.DataFrame({
+        **{k: both[k] for k in keys},
+        "p50_s_base": both["p50_s_base"],
+        "p50_s_cur": both["p50_s_cur"],
+        "change": change,
+        "peak_mb_base": both["peak_mb_base"],
+        "peak_mb_cur": both["peak_mb_cur"],
+        "regression": (change > threshold) & (both["p50_s_cur"] - both["p50_s_base"] > min_seconds),
+    }).sort_values(keys, kind="stable").reset_index(drop=True)
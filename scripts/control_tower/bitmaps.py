@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    """Row bitmaps of a frame's filter columns and a sorted date index.
+
+    Every distinct value of an indexed column gets one packed bitmap (one
+    bit per row, ``np.packbits`` layout). A multiselect ORs its values'
+    bitmaps and filters AND together, so a selection stays a single n/8
+    byte bitmap however many filters are set; rows are only materialized,
+    as positions, when something needs them. Missing values have no
+    bitmap, as ``isin`` never matches them.
+
+    The date index is the row order sorted by day (kept only when the
+    frame is not in day order already) with the first position of each
+    day, so a date range is one slice of it.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: list[str], date_col: str = "order_date"):
+        self.n = len(df)
+        self.bitmaps: dict[str, dict] = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col], sort=True)
+            self.bitmaps[col] = {value: np.packbits(codes == i) for i, value in enumerate(uniques)}
+
+        day = df[date_col].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        order = np.argsort(day, kind="stable")
+        sorted_days = day[order]
+        dated = int((~np.isnat(sorted_days)).sum())    # NaT sorts last and matches no range
+        self.days, self.day_starts = np.unique(sorted_days[:dated], return_index=True)
+        self.dated = dated
+        self.order = None if np.array_equal(order, np.arange(self.n)) else order
+
+    def _bits(self, positions: slice | np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.n, dtype=bool)
+        mask[positions] = True
+        return np.packbits(mask)
+
+    def all(self) -> np.ndarray:
+        return np.packbits(np.ones(self.n, dtype=bool))
+
+    def dates(self, start: date, end: date) -> np.ndarray:
+        """Rows whose day falls in [start, end]."""
+        first = np.searchsorted(self.days, np.datetime64(start, "D"), side="left")
+        last = np.searchsorted(self.days, np.datetime64(end, "D"), side="right")
+        lo = self.day_starts[first] if first < len(self.days) else self.dated
+        hi = self.day_starts[last] if last < len(self.days) else self.dated
+        hi = max(lo, hi)
+        return self._bits(slice(lo, hi) if self.order is None else self.order[lo:hi])
+
+    def narrow(self, bits: np.ndarray, col: str, values: list) -> np.ndarray:
+        """``bits`` AND rows holding any of ``values`` (no values: no filter)."""
+        if not values:
+            return bits
+        bitmaps = self.bitmaps[col]
+        matched = [bitmaps[v] for v in values if v in bitmaps]
+        if not matched:
+            return np.zeros_like(bits)
+        return bits & np.bitwise_or.reduce(matched)
+
+    def options(self, col: str, bits: np.ndarray) -> list:
+        """Values of ``col`` present in the selected rows."""
+        return [value for value, bitmap in self.bitmaps[col].items() if np.bitwise_and(bitmap, bits).any()]
+
+    def count(self, bits: np.ndarray) -> int:
+        return int(np.unpackbits(bits, count=self.n).sum())
+
+    def positions(self, bits: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(bits, count=self.n))
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def simulate_backlog(arrivals: np.ndarray, capacity: np.ndarray) -> dict[str, np.ndarray]:
+    """Day-by-day order backlog of every plant at once.
+
+    ``arrivals`` is (plants, days) orders received per day and ``capacity`` the
+    orders each plant processes per day. Unprocessed orders carry forward:
+    B_t = max(0, B_{t-1} + a_t - c). Its closed form is
+    B_t = S_t - min(0, min_{s<=t} S_s) with S the running sum of a - c, so the
+    walk is a cumsum and a running minimum along the day axis, not a loop.
+    """
+    arrivals = np.asarray(arrivals, dtype=float)
+    s = np.cumsum(arrivals - np.asarray(capacity, dtype=float)[:, None], axis=1)
+    backlog = s - np.minimum(np.minimum.accumulate(s, axis=1), 0)
+    carried = np.concatenate([np.zeros((len(backlog), 1)), backlog[:, :-1]], axis=1)
+    processed = carried + arrivals - backlog
+
+    # Consecutive days ending with a backlog: running count reset at each clear day
+    spill = backlog > 0
+    count = np.cumsum(spill, axis=1)
+    streak = count - np.maximum.accumulate(np.where(spill, 0, count), axis=1)
+    return {"backlog": backlog, "processed": processed, "spillover": spill, "streak": streak}
+
+
+def backlog_tables(daily: pd.DataFrame, day: str = "day") -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Daily and per-plant backlog tables from per-(plant, day) order counts.
+
+    ``daily`` has ``plant_code``, ``day``, ``orders`` and ``daily_capacity``
+    columns. Every plant is walked over the same calendar (first to last order
+    day, no gaps) because idle days still work the backlog down; plants
+    without a capacity are left out.
+    """
+    daily = daily[daily["daily_capacity"].notna() & daily[day].notna()]
+    daily_cols = ["plant_code", "date", "orders", "daily_capacity", "processed", "backlog", "utilization", "is_spillover"]
+    if daily.empty:
+        return pd.DataFrame(columns=daily_cols), pd.DataFrame(columns=["plant_code"])
+
+    plant_codes, plants = pd.factorize(daily["plant_code"].astype(str), sort=True)
+    days = pd.date_range(daily[day].min(), daily[day].max(), freq="D")
+    arrivals = np.zeros((len(plants), len(days)))
+    np.add.at(arrivals, (plant_codes, days.get_indexer(pd.to_datetime(daily[day]))), daily["orders"].to_numpy(dtype=float))
+    capacity = daily.groupby(plant_codes)["daily_capacity"].max().to_numpy(dtype=float)
+
+    sim = simulate_backlog(arrivals, capacity)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        utilization = np.where(capacity[:, None] > 0, sim["processed"] / capacity[:, None], np.nan)
+    per_plant = pd.DataFrame(utilization)
+
+    out = pd.DataFrame({
+        "plant_code": np.repeat(plants.to_numpy(), len(days)),
+        "date": np.tile(days.to_numpy(), len(plants)),
+        "orders": arrivals.ravel().astype(np.int64),
+        "daily_capacity": np.repeat(capacity, len(days)),
+        "processed": sim["processed"].ravel(),
+        "backlog": sim["backlog"].ravel(),
+        "utilization": utilization.ravel(),
+        "is_spillover": sim["spillover"].ravel(),
+    })
+    summary = pd.DataFrame({
+        "plant_code": plants.to_numpy(),
+        "daily_capacity": capacity,
+        "days": len(days),
+        "orders": arrivals.sum(axis=1).astype(np.int64),
+        "overload_days": (arrivals > capacity[:, None]).sum(axis=1),
+        "spillover_days": sim["spillover"].sum(axis=1),
+        "longest_spillover_streak": sim["streak"].max(axis=1),
+        "peak_backlog": sim["backlog"].max(axis=1),
+        "end_backlog": sim["backlog"][:, -1],
+        "avg_utilization": per_plant.mean(axis=1).to_numpy(),
+        "peak_utilization": per_plant.max(axis=1).to_numpy(),
+    })
+    return out, summary
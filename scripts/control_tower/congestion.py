@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import heapq
+from collections import deque
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from control_tower.kpis import KpiSpec, compute_kpis
+
+DAY_MINUTES = 1440
+# Port handling per shipment, and the utilization baseline berths are sized for
+HANDLING_MINUTES = 30
+TARGET_UTILIZATION = 0.85
+
+# Events are packed into one int, time (minutes) | leg | shipment, so the
+# heap orders by time, then leg, then shipment with no tuple compares
+_SID_BITS = 32
+_TIME_SHIFT = _SID_BITS + 1
+_SID_MASK = (1 << _SID_BITS) - 1
+ORIGIN, DEST = 0, 1
+
+
+@dataclass(frozen=True)
+class CongestionSpec:
+    """A port congestion scenario: slower handling and/or fewer berths.
+
+    ``ports`` limits the change to those port codes (empty = every port).
+    """
+
+    name: str = "Port congestion"
+    handling_scale: float = 1.2
+    berth_scale: float = 1.0
+    ports: tuple[str, ...] = ()
+
+
+@dataclass
+class PortPlan:
+    ports: pd.Index          # port codes
+    berths: np.ndarray       # parallel handling slots per port
+    handling: np.ndarray     # minutes per shipment per port
+
+    @classmethod
+    def calibrate(
+        cls,
+        ports: pd.Index,
+        daily_peak: np.ndarray,
+        handling_minutes: int = HANDLING_MINUTES,
+        utilization: float = TARGET_UTILIZATION,
+    ) -> "PortPlan":
+        """Size each port for its busiest day at ``utilization`` of its berth time."""
+        berths = np.ceil(daily_peak * handling_minutes / (DAY_MINUTES * utilization))
+        return cls(
+            ports=ports,
+            berths=np.maximum(berths, 1).astype(np.int64),
+            handling=np.full(len(ports), int(handling_minutes), dtype=np.int64),
+        )
+
+    def scaled(self, spec: CongestionSpec) -> "PortPlan":
+        hit = self.ports.isin(spec.ports) if spec.ports else np.ones(len(self.ports), dtype=bool)
+        handling = np.where(hit, np.round(self.handling * spec.handling_scale), self.handling)
+        berths = np.where(hit, np.floor(self.berths * spec.berth_scale), self.berths)
+        return replace(self, berths=np.maximum(berths, 1).astype(np.int64), handling=np.maximum(handling, 1).astype(np.int64))
+
+
+def replay(
+    orig: np.ndarray,
+    dest: np.ndarray,
+    arrival: np.ndarray,
+    transit: np.ndarray,
+    plan: PortPlan,
+) -> dict[str, np.ndarray]:
+    """Replay shipments through their origin then destination port.
+
+    Each port is a FIFO queue in front of ``plan.berths`` parallel berths that
+    take ``plan.handling`` minutes per shipment; after origin handling a
+    shipment travels ``transit`` minutes to its destination port. Arrivals
+    are the only events: with FIFO berths and a fixed handling time, berths
+    free up in the order they were taken, so the k-th shipment at a port
+    starts at max(arrival, finish of shipment k - berths) and its departure
+    is known on arrival. Returns per-shipment wait minutes at each port and
+    the destination finish time.
+    """
+    n = len(arrival)
+    ports = (orig.tolist(), dest.tolist())
+    transit = transit.tolist()
+    handling = plan.handling.tolist()
+    berths = plan.berths.tolist()
+    busy = [deque() for _ in berths]      # finish times of each port's last ``berths`` shipments
+    waiting = [deque() for _ in berths]   # start times of shipments still queued
+    wait = ([0] * n, [0] * n)
+    finish = [0] * n
+    queued = [0] * len(berths)
+    peak = [0] * len(berths)
+
+    # Origin arrivals are known up front: stream them in sorted order and
+    # keep only shipments in transit on the heap, which stays small
+    stream = np.sort((arrival.astype(np.int64) << _TIME_SHIFT) | np.arange(n, dtype=np.int64)).tolist()
+    stream.append(1 << 62)
+    heap: list[int] = []
+    push, pop = heapq.heappush, heapq.heappop
+    i = 0
+    for _ in range(2 * n):
+        if heap and heap[0] < stream[i]:
+            key = pop(heap)
+        else:
+            key = stream[i]
+            i += 1
+        t = key >> _TIME_SHIFT
+        leg = (key >> _SID_BITS) & 1
+        sid = key & _SID_MASK
+        p = ports[leg][sid]
+
+        taken = busy[p]
+        start = t
+        if len(taken) == berths[p]:
+            free = taken.popleft()
+            if free > t:
+                start = free
+        done = start + handling[p]
+        taken.append(done)
+        if start > t:
+            wait[leg][sid] = start - t
+            queue = waiting[p]
+            while queue and queue[0] <= t:
+                queue.popleft()
+            queue.append(start)
+            queued[p] += 1
+            if len(queue) > peak[p]:
+                peak[p] = len(queue)
+
+        if leg == ORIGIN:
+            push(heap, ((done + transit[sid]) << _TIME_SHIFT) | (1 << _SID_BITS) | sid)
+        else:
+            finish[sid] = done
+
+    return {
+        "wait_orig": np.array(wait[ORIGIN], dtype=np.int64),
+        "wait_dest": np.array(wait[DEST], dtype=np.int64),
+        "finish": np.array(finish, dtype=np.int64),
+        "queued": np.array(queued, dtype=np.int64),
+        "peak_queue": np.array(peak, dtype=np.int64),
+        "events": np.int64(2 * n),
+    }
+
+
+@dataclass
+class Shipments:
+    """Orders as compact arrays for ``replay``."""
+
+    ports: pd.Index
+    rows: np.ndarray         # positions of the routed orders in the source frame
+    orig: np.ndarray
+    dest: np.ndarray
+    arrival: np.ndarray      # minutes since the first order day
+    transit: np.ndarray      # minutes from origin departure to destination arrival
+    daily_peak: np.ndarray   # busiest day's arrivals per port (both legs)
+
+    @classmethod
+    def from_orders(cls, df: pd.DataFrame) -> "Shipments":
+        ports = pd.Index(sorted(set(df["orig_port_cd"].dropna().astype(str)) | set(df["dest_port_cd"].dropna().astype(str))))
+        orig = np.asarray(ports.get_indexer(df["orig_port_cd"].astype(str)))
+        dest = np.asarray(ports.get_indexer(df["dest_port_cd"].astype(str)))
+        # A missing port is skipped (the other handles both legs); orders with
+        # neither port cannot be replayed and pass through with no delay
+        orig, dest = np.where(orig >= 0, orig, dest), np.where(dest >= 0, dest, orig)
+        rows = np.flatnonzero(orig >= 0)
+        orig, dest, df = orig[rows], dest[rows], df.iloc[rows]
+
+        day = df["order_date"].dt.normalize()
+        day_n = ((day - day.min()).dt.days.fillna(0)).to_numpy(dtype=np.int64)
+        # Orders only carry a date: space each port's arrivals evenly over their day
+        key = pd.Series(orig * (day_n.max(initial=0) + 1) + day_n)
+        rank = key.groupby(key).cumcount().to_numpy()
+        size = key.map(key.value_counts()).to_numpy()
+        arrival = day_n * DAY_MINUTES + rank * DAY_MINUTES // size
+
+        tpt = pd.to_numeric(df["tpt"], errors="coerce").fillna(0).clip(lower=0).to_numpy(dtype=np.int64)
+        transit = tpt * DAY_MINUTES
+
+        # Busiest day per port over origin arrivals and destination arrivals
+        legs = pd.DataFrame({"port": np.r_[orig, dest], "day": np.r_[day_n, day_n + tpt]})
+        peak = legs.groupby(["port", "day"]).size().groupby(level=0).max()
+        return cls(
+            ports=ports, rows=rows, orig=orig, dest=dest, arrival=arrival.astype(np.int64), transit=transit,
+            daily_peak=peak.reindex(range(len(ports)), fill_value=0).to_numpy(dtype=np.int64),
+        )
+
+
+IMPACT_SPEC = KpiSpec("port_congestion", ["orig_port_cd", "dest_port_cd", "carrier"], {
+    "orders": ("order_id", "count"),
+    "avg_delay_hours": ("delay_hours", "mean"),
+    "delayed_orders": ("is_delayed", "sum"),
+    "avg_late_day_shift": ("late_day_shift", "mean"),
+    "on_time_rate": ("is_on_time", "mean"),
+    "sim_on_time_rate": ("sim_is_on_time", "mean"),
+})
+
+
+def simulate_congestion(
+    df: pd.DataFrame,
+    spec: CongestionSpec = CongestionSpec(),
+    handling_minutes: int = HANDLING_MINUTES,
+    utilization: float = TARGET_UTILIZATION,
+) -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """Baseline and scenario replays of ``df``'s orders.
+
+    Delay is the scenario's destination finish minus the baseline's, so only
+    congestion the scenario adds counts. Each calendar day the finish slips
+    past shifts the order's schedule offset (late days, or minus days shipped
+    ahead); the order is late when the shifted offset is positive. Returns
+    per-order results, per-port stats and run counters.
+    """
+    ships = Shipments.from_orders(df)
+    base_plan = PortPlan.calibrate(ships.ports, ships.daily_peak, handling_minutes, utilization)
+    sim_plan = base_plan.scaled(spec)
+    base = replay(ships.orig, ships.dest, ships.arrival, ships.transit, base_plan)
+    sim = replay(ships.orig, ships.dest, ships.arrival, ships.transit, sim_plan)
+
+    delay = np.zeros(len(df), dtype=np.int64)
+    delay_days = np.zeros(len(df), dtype=np.int64)
+    delay[ships.rows] = np.maximum(sim["finish"] - base["finish"], 0)
+    delay_days[ships.rows] = np.maximum(sim["finish"] // DAY_MINUTES - base["finish"] // DAY_MINUTES, 0)
+    late = pd.to_numeric(df["ship_late_day_count"], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+    ahead = pd.to_numeric(df["ship_ahead_day_count"], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+    offset = np.where(late > 0, late, -ahead) + delay_days
+    sim_late = np.maximum(offset, 0)
+    on_time = df["is_on_time"].fillna(False).to_numpy(dtype=bool)
+
+    orders = pd.DataFrame({
+        "order_id": df["order_id"].to_numpy(),
+        "orig_port_cd": df["orig_port_cd"].to_numpy(),
+        "dest_port_cd": df["dest_port_cd"].to_numpy(),
+        "carrier": df["carrier"].to_numpy(),
+        "delay_hours": delay / 60,
+        "is_delayed": delay > 0,
+        "sim_ship_late_day_count": sim_late,
+        "late_day_shift": sim_late - late,
+        "is_on_time": on_time,
+        "sim_is_on_time": on_time & (offset <= 0),
+    })
+
+    handled = np.bincount(np.r_[ships.orig, ships.dest], minlength=len(ships.ports))
+    waits = {name: np.bincount(np.r_[ships.orig, ships.dest], weights=np.r_[run["wait_orig"], run["wait_dest"]],
+                               minlength=len(ships.ports)) for name, run in (("base", base), ("sim", sim))}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ports = pd.DataFrame({
+            "port": ships.ports,
+            "shipments": handled,
+            "berths": base_plan.berths,
+            "handling_minutes": base_plan.handling,
+            "sim_berths": sim_plan.berths,
+            "sim_handling_minutes": sim_plan.handling,
+            "avg_wait_hours": waits["base"] / handled / 60,
+            "sim_avg_wait_hours": waits["sim"] / handled / 60,
+            "queued": base["queued"],
+            "sim_queued": sim["queued"],
+            "peak_queue": base["peak_queue"],
+            "sim_peak_queue": sim["peak_queue"],
+        })
+    return orders, ports, {"events": int(base["events"] + sim["events"])}
+
+
+def congestion_impact(orders: pd.DataFrame) -> pd.DataFrame:
+    """Per lane and carrier: delay, late-day shift and on-time impact (pp)."""
+    impact = compute_kpis(orders, [IMPACT_SPEC])[IMPACT_SPEC.name]
+    impact["on_time_impact_pp"] = (impact["sim_on_time_rate"] - impact["on_time_rate"]) * 100
+    return impact
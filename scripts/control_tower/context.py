@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from control_tower.storage import read_table, table_file
+
+# Dimension tables under data/context, one row per code: an int surrogate
+# ``key`` (position in sorted-code order), the natural ``code`` and its ``name``.
+DIMENSIONS = ["carriers", "services", "ports", "plants", "products", "customers"]
+
+# fact code column -> (dimension table, label column it resolves to)
+LABELS = {
+    "carrier": ("carriers", "carrier_name"),
+    "svc_cd": ("services", "service_tier"),
+    "orig_port_cd": ("ports", "origin_port_name"),
+    "dest_port_cd": ("ports", "dest_port_name"),
+    "plant_code": ("plants", "plant_name"),
+    "product_id": ("products", "product_family"),
+    "customer": ("customers", "customer_segment"),
+}
+LANE_LABEL = "lane_name"
+LANE_SEP = " → "
+
+
+def code_strings(values) -> pd.Index:
+    # Natural codes are matched as strings; integral floats (ids read with gaps) drop the ".0"
+    values = pd.Index(values)
+    if pd.api.types.is_float_dtype(values.dtype):
+        return pd.Index([str(int(v)) if float(v).is_integer() else str(v) for v in values], dtype=object)
+    return values.astype(str)
+
+
+def _factorize(values: pd.Series) -> tuple[np.ndarray, pd.Index]:
+    # Categorical columns already carry codes; only their categories need mapping
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return np.asarray(values.cat.codes, dtype=np.int64), pd.Index(values.cat.categories)
+    codes, uniques = pd.factorize(values)
+    return np.asarray(codes, dtype=np.int64), pd.Index(uniques)
+
+
+def _take(table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    # table[codes] with -1 (missing) passed through
+    if not len(table):
+        return np.full(len(codes), -1, dtype=np.int64)
+    return np.where(codes >= 0, table[codes.clip(min=0)], -1)
+
+
+def code_positions(index: pd.Index, values: pd.Series) -> np.ndarray:
+    """Position of each value's code string in ``index`` (-1 when missing or absent).
+
+    Only distinct values are hashed into ``index``; rows are an integer take.
+    """
+    codes, uniques = _factorize(values)
+    return _take(np.asarray(index.get_indexer(code_strings(uniques))), codes)
+
+
+@dataclass
+class Dimension:
+    codes: pd.Index       # natural code of each surrogate key
+    names: pd.Index       # distinct labels (label dictionary)
+    name_codes: np.ndarray  # label dictionary position of each surrogate key
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "Dimension":
+        df = df.sort_values("key", kind="stable")
+        name_codes, names = pd.factorize(df["name"].astype(str))
+        return cls(codes=code_strings(df["code"]), names=pd.Index(names), name_codes=np.asarray(name_codes))
+
+    def keys(self, values: pd.Series) -> np.ndarray:
+        """Surrogate key of each value, -1 when the code is missing or unmapped."""
+        return code_positions(self.codes, values)
+
+    def labels(self, values: pd.Series) -> pd.Categorical:
+        """Label of each value as a categorical over the label dictionary."""
+        return pd.Categorical.from_codes(_take(self.name_codes, self.keys(values)), categories=self.names)
+
+
+def build_dimension(codes, names: list[str], fallback_prefix: str, cycle: bool = False) -> pd.DataFrame:
+    """Dimension rows for ``codes`` in sorted order, labelled from ``names``.
+
+    Codes past the end of ``names`` get ``<fallback_prefix> NN`` labels, or
+    reuse the pool from the start when ``cycle`` is set.
+    """
+    codes = sorted({str(c) for c in codes if pd.notna(c)})
+    labels = [
+        names[i % len(names)] if cycle and names else names[i] if i < len(names) else f"{fallback_prefix} {i+1:02d}"
+        for i in range(len(codes))
+    ]
+    return pd.DataFrame({"key": np.arange(len(codes), dtype=np.int64), "code": codes, "name": labels})
+
+
+def load_dimensions(directory: Path) -> dict[str, Dimension]:
+    dims = {}
+    for name in DIMENSIONS:
+        if not table_file(name, directory).exists():
+            raise FileNotFoundError(
+                f"Missing {name} in {directory}. Run scripts/02b_generate_context_mappings.py first."
+            )
+        dims[name] = Dimension.from_frame(read_table(name, directory))
+    return dims
+
+
+def lane_labels(orig: pd.Categorical, dest: pd.Categorical) -> pd.Categorical:
+    """``orig → dest`` labels, built once per distinct pair and taken per row."""
+    o = np.asarray(orig.codes, dtype=np.int64)
+    d = np.asarray(dest.codes, dtype=np.int64)
+    radix = len(dest.categories) + 1
+    pairs, inverse = np.unique((o + 1) * radix + (d + 1), return_inverse=True)
+    o_u, d_u = pairs // radix - 1, pairs % radix - 1
+    # Missing on either side leaves the lane missing, as string concatenation did
+    o_names, d_names = orig.categories.to_numpy(dtype=object), dest.categories.to_numpy(dtype=object)
+    text = [f"{o_names[a]}{LANE_SEP}{d_names[b]}" if a >= 0 and b >= 0 else None for a, b in zip(o_u, d_u)]
+    lane_codes, lanes = pd.factorize(pd.Series(text, dtype=object))
+    return pd.Categorical.from_codes(_take(np.asarray(lane_codes), np.asarray(inverse).ravel()), categories=lanes)
+
+
+def _with_fallback(labels: pd.Categorical, values: pd.Series) -> pd.Categorical:
+    # Unmapped codes show the code itself (only used for lane names)
+    missing = labels.isna() & values.notna().to_numpy()
+    if not missing.any():
+        return labels
+    filled = pd.Series(labels).astype(object)
+    filled[missing] = code_strings(values[missing]).to_numpy()
+    return pd.Categorical(filled)
+
+
+def resolve_labels(df: pd.DataFrame, dims: dict[str, Dimension], columns: list[str] | None = None) -> pd.DataFrame:
+    """Add label columns to ``df`` by key lookup on its code columns.
+
+    ``columns`` picks label columns (default: all, plus ``lane_name``); labels
+    are categoricals, so each distinct string is stored once.
+    """
+    wanted = columns or [label for _, label in LABELS.values()] + [LANE_LABEL]
+    out = {}
+    for col, (dim, label) in LABELS.items():
+        if col in df.columns and (label in wanted or (LANE_LABEL in wanted and col.endswith("_port_cd"))):
+            out[label] = dims[dim].labels(df[col])
+    if LANE_LABEL in wanted and {"orig_port_cd", "dest_port_cd"} <= set(df.columns):
+        out[LANE_LABEL] = lane_labels(
+            _with_fallback(out["origin_port_name"], df["orig_port_cd"]),
+            _with_fallback(out["dest_port_name"], df["dest_port_cd"]),
+        )
+    # Shallow copy: the label columns are added without duplicating the fact columns
+    df = df.copy(deep=False)
+    for label in wanted:
+        if label in out:
+            df[label] = out[label]
+    return df
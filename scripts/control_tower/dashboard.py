@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from control_tower.risk import RiskModel
+from control_tower.topk import top_k
+
+# Data side of the dashboard's filter-and-aggregate path. The app renders
+# what these return; the benchmark suite times them on the same fact.
+LANE_KEYS = ["orig_port_cd", "dest_port_cd"]
+BAND_ORDER = {"High": 0, "Medium": 1, "Low": 2}
+# Measures of the kpi_cube table (02_prepare_data.py); all of them add up
+CUBE_MEASURES = [
+    "rows", "orders", "units", "freight_cost", "late_orders", "late_n", "on_time", "on_time_n", "late_cost", "tpt", "tpt_n",
+]
+
+
+def _col(df: pd.DataFrame, name: str, default) -> pd.Series:
+    return df[name] if name in df.columns else pd.Series(default, index=df.index)
+
+
+def summary_kpis(f: pd.DataFrame) -> dict:
+    """KPI tiles and alert figures of the rows in view."""
+    orders = int(f["order_id"].nunique()) if "order_id" in f.columns else len(f)
+    late = _col(f, "is_late", False).fillna(False).astype(bool)
+    cost = _col(f, "freight_cost_est", 0).fillna(0)
+    return {
+        "orders": orders,
+        "units": float(_col(f, "unit_quantity", 0).fillna(0).sum()),
+        "late_orders": int(late.sum()),
+        "on_time_rate": float(_col(f, "is_on_time", False).fillna(False).mean()) if len(f) else 0.0,
+        "freight_cost": float(cost.sum()),
+        "late_cost": float(cost[late].sum()) if "freight_cost_est" in f.columns else 0.0,
+        "avg_tpt": float(f["tpt"].mean()) if "tpt" in f.columns and len(f) else None,
+    }
+
+
+def by_carrier(f: pd.DataFrame, carrier_col: str = "carrier") -> pd.DataFrame:
+    return (
+        f.groupby(carrier_col, observed=True)
+        .agg(
+            orders=("order_id", "nunique"),
+            on_time_rate=("is_on_time", "mean"),
+            late_orders=("is_late", "sum"),
+            late_rate=("is_late", "mean"),
+            freight_cost=("freight_cost_est", "sum"),
+        )
+        .reset_index()
+    )
+
+
+def by_lane(f: pd.DataFrame) -> pd.DataFrame:
+    # Lane risk = cost × (1 - on_time)
+    lanes = (
+        f.groupby(LANE_KEYS, observed=True)
+        .agg(
+            orders=("order_id", "nunique"),
+            freight_cost=("freight_cost_est", "sum"),
+            on_time_rate=("is_on_time", "mean"),
+        )
+        .reset_index()
+    )
+    lanes["risk_score"] = lanes["freight_cost"] * (1 - lanes["on_time_rate"])
+    return lanes
+
+
+def triage_queue(
+    f: pd.DataFrame,
+    risk: RiskModel | None,
+    k: int,
+    rows: np.ndarray | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Late orders with their priority score and band, and the top ``k`` of them.
+
+    ``rows`` are the positions of the late orders in ``f`` when the caller
+    already has them (a filter index selection); only those rows are copied.
+    The priority is the stored risk model's, as in the pipeline's exceptions
+    queue, or delay × cost exposure without one. Bands split at the 70th and
+    90th percentile of the queue's scores.
+    """
+    if rows is None:
+        rows = np.flatnonzero(_col(f, "is_late", False).fillna(False).astype(bool).to_numpy())
+    late_df = f.take(rows)
+    if late_df.empty:
+        return late_df, late_df
+
+    late_df["days_late"] = _col(late_df, "ship_late_day_count", 0).fillna(0).astype(float)
+    late_df["cost"] = _col(late_df, "freight_cost_est", 0).fillna(0).astype(float)
+    if risk is not None:
+        scored = risk.score(late_df.assign(freight_cost_est=late_df["cost"], ship_late_day_count=late_df["days_late"]))
+        late_df["priority_score"] = risk.priority(scored).astype(float)
+    else:
+        late_df["priority_score"] = (late_df["days_late"].clip(lower=0) * (late_df["cost"].clip(lower=0) + 1)).astype(float)
+
+    score = late_df["priority_score"]
+    q1, q2 = score.quantile(0.70), score.quantile(0.90)
+    late_df["priority_band"] = np.select([score >= q2, score >= q1], ["High", "Medium"], "Low")
+
+    late_df["_band_order"] = late_df["priority_band"].map(BAND_ORDER).fillna(9)
+    triage = top_k(late_df, ["_band_order", "priority_score"], k, ascending=[True, False]).drop(columns=["_band_order"])
+    return late_df.drop(columns=["_band_order"]), triage
+
+
+# Cube roll-ups: the same figures as above from kpi_cube cells, so their cost
+# follows the number of cells in view rather than the number of orders
+def filter_cube(cube: pd.DataFrame, start: date, end: date, selected: dict[str, list]) -> pd.DataFrame:
+    day = cube["date"].dt.date
+    mask = (day >= start) & (day <= end)
+    for col, values in selected.items():
+        if values:
+            mask &= cube[col].isin(values)
+    return cube[mask]
+
+
+def _rate(num, den) -> np.ndarray:
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def _roll_up(cells: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    return cells.groupby(keys, observed=True)[CUBE_MEASURES].sum().reset_index()
+
+
+def cube_kpis(cells: pd.DataFrame) -> dict:
+    """``summary_kpis`` of the orders behind these cube cells."""
+    totals = cells[CUBE_MEASURES].sum()
+    rows = int(totals["rows"])
+    return {
+        "orders": int(totals["orders"]),
+        "units": float(totals["units"]),
+        "late_orders": int(totals["late_orders"]),
+        "on_time_rate": float(totals["on_time"] / rows) if rows else 0.0,
+        "freight_cost": float(totals["freight_cost"]),
+        "late_cost": float(totals["late_cost"]),
+        "avg_tpt": float(_rate(totals["tpt"], totals["tpt_n"])) if rows else None,
+    }
+
+
+def cube_by_carrier(cells: pd.DataFrame, carrier_col: str = "carrier") -> pd.DataFrame:
+    g = _roll_up(cells, [carrier_col])
+    return pd.DataFrame({
+        carrier_col: g[carrier_col],
+        "orders": g["orders"],
+        "on_time_rate": _rate(g["on_time"], g["on_time_n"]),
+        "late_orders": g["late_orders"],
+        "late_rate": _rate(g["late_orders"], g["late_n"]),
+        "freight_cost": g["freight_cost"],
+    })
+
+
+def cube_by_lane(cells: pd.DataFrame) -> pd.DataFrame:
+    g = _roll_up(cells, LANE_KEYS)
+    lanes = g[LANE_KEYS + ["orders", "freight_cost"]].assign(on_time_rate=_rate(g["on_time"], g["on_time_n"]))
+    lanes["risk_score"] = lanes["freight_cost"] * (1 - lanes["on_time_rate"])
+    return lanes
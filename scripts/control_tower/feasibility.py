@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from control_tower.context import code_positions, code_strings
+
+# Violation bits of an order's network mask
+PRODUCT_NOT_STOCKED = 1   # plant does not stock the product (ProductsPerPlant)
+PORT_NOT_LINKED = 2       # origin port is not linked to the plant (PlantPorts)
+VMI_EXCLUSIVE = 4         # VMI plant shipping to a customer it does not list (VmiCustomers)
+
+VIOLATIONS = {
+    "product_not_stocked": PRODUCT_NOT_STOCKED,
+    "port_not_linked": PORT_NOT_LINKED,
+    "vmi_exclusive": VMI_EXCLUSIVE,
+}
+VIOLATION_LABELS = {
+    "product_not_stocked": "Product not stocked at plant",
+    "port_not_linked": "Origin port not linked to plant",
+    "vmi_exclusive": "VMI plant serving an unlisted customer",
+}
+
+
+@dataclass
+class PairIndex:
+    """Semi-join index over (left, right) code pairs.
+
+    Each side's distinct codes sit in a hash index; a pair is the integer
+    left_key * stride + right_key, and membership is a binary search in the
+    sorted pair keys. Strings are hashed once per distinct value, so a check
+    costs a few integer passes per row.
+    """
+
+    left: pd.Index
+    right: pd.Index
+    pairs: np.ndarray   # sorted unique pair keys
+
+    @classmethod
+    def build(cls, left: pd.Series, right: pd.Series) -> "PairIndex":
+        both = left.notna().to_numpy() & right.notna().to_numpy()
+        left_codes, right_codes = code_strings(left[both]), code_strings(right[both])
+        left_index, right_index = pd.Index(left_codes.unique()), pd.Index(right_codes.unique())
+        keys = left_index.get_indexer(left_codes) * (len(right_index) + 1) + right_index.get_indexer(right_codes)
+        return cls(left=left_index, right=right_index, pairs=np.unique(keys))
+
+    def _keys(self, left: pd.Series, right: pd.Series) -> np.ndarray:
+        a = code_positions(self.left, left)
+        b = code_positions(self.right, right)
+        return np.where((a >= 0) & (b >= 0), a * (len(self.right) + 1) + b, -1)
+
+    def has_left(self, left: pd.Series) -> np.ndarray:
+        """Whether each value appears on the left side at all."""
+        return code_positions(self.left, left) >= 0
+
+    def contains(self, left: pd.Series, right: pd.Series) -> np.ndarray:
+        """Whether each (left, right) row pair is in the index."""
+        keys = self._keys(left, right)
+        if not len(self.pairs):
+            return np.zeros(len(keys), dtype=bool)
+        pos = np.searchsorted(self.pairs, keys).clip(max=len(self.pairs) - 1)
+        return (keys >= 0) & (self.pairs[pos] == keys)
+
+
+@dataclass
+class NetworkRules:
+    """The network constraint sheets as semi-join indexes."""
+
+    plant_products: PairIndex
+    plant_ports: PairIndex
+    vmi_customers: PairIndex
+
+    @classmethod
+    def from_tables(cls, products: pd.DataFrame, ports: pd.DataFrame, vmi: pd.DataFrame) -> "NetworkRules":
+        """Build from the reference sheets with 02_prepare_data's column names
+        (``plant_code`` plus ``product_id``, ``port`` and ``customers``)."""
+        return cls(
+            plant_products=PairIndex.build(products["plant_code"], products["product_id"]),
+            plant_ports=PairIndex.build(ports["plant_code"], ports["port"]),
+            vmi_customers=PairIndex.build(vmi["plant_code"], vmi["customers"]),
+        )
+
+    def check(self, df: pd.DataFrame) -> np.ndarray:
+        """Violation bitmask of each order (0 = passes every check).
+
+        A check is skipped when its order columns are missing (NaN).
+        """
+        plant = df["plant_code"]
+        known = plant.notna().to_numpy()
+        mask = np.zeros(len(df), dtype=np.int64)
+
+        product = df["product_id"]
+        bad = known & product.notna().to_numpy() & ~self.plant_products.contains(plant, product)
+        mask |= np.where(bad, PRODUCT_NOT_STOCKED, 0)
+
+        port = df["orig_port_cd"]
+        bad = known & port.notna().to_numpy() & ~self.plant_ports.contains(plant, port)
+        mask |= np.where(bad, PORT_NOT_LINKED, 0)
+
+        # Only plants listed in VmiCustomers are exclusive; any other plant may serve anyone
+        customer = df["customer"]
+        bad = self.vmi_customers.has_left(plant) & customer.notna().to_numpy() & ~self.vmi_customers.contains(plant, customer)
+        mask |= np.where(bad, VMI_EXCLUSIVE, 0)
+        return mask
+
+
+def violation_names(mask) -> pd.Categorical:
+    """``product_not_stocked|port_not_linked``-style names of each mask value."""
+    mask = np.asarray(mask, dtype=np.int64)
+    values, inverse = np.unique(mask, return_inverse=True)
+    names = ["|".join(name for name, bit in VIOLATIONS.items() if v & bit) or None for v in values]
+    return pd.Categorical(pd.Series(names, dtype=object).to_numpy()[inverse.ravel()])
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import posixpath
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+from xml.etree import ElementTree as ET
+
+import openpyxl
+import pandas as pd
+
+from control_tower.storage import FrameHasher, TableWriter, apply_schema
+
+# Per-workbook and per-sheet content hashes from the last ingest, kept next to
+# the processed tables so unchanged sheets are not parsed again.
+MANIFEST_NAME = "_ingest_manifest.json"
+# Parsed sheets are cached per workbook, <processed>/_sheets/<workbook>/<sheet>.parquet,
+# and each processed table is the concatenation over workbooks.
+SHEET_CACHE = "_sheets"
+# Lineage column: the workbook file each processed row came from
+SOURCE_COL = "source_file"
+WORKBOOK_SUFFIXES = {".xlsx", ".xlsm", ".xls"}
+# Rows per streamed sheet batch. Cells arrive as Python objects, so this is
+# kept well below the columnar DEFAULT_BATCH_ROWS.
+SHEET_BATCH_ROWS = 100_000
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+# Parts every sheet depends on: cell strings and number formats (dates)
+_SHARED_PARTS = ["xl/sharedStrings.xml", "xl/styles.xml"]
+
+
+def file_hash(path: Path, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def sheet_hashes(path: Path) -> dict[str, str]:
+    """Hash each sheet's raw XML part (plus shared strings/styles) without parsing cells.
+
+    Non-zip workbooks (.xls) fall back to the whole-file hash for every sheet.
+    """
+    path = Path(path)
+    if not zipfile.is_zipfile(path):
+        digest = file_hash(path)
+        return {name: digest for name in pd.ExcelFile(path).sheet_names}
+
+    with zipfile.ZipFile(path) as z:
+        names = set(z.namelist())
+        shared = hashlib.sha256()
+        for part in _SHARED_PARTS:
+            if part in names:
+                shared.update(z.read(part))
+
+        rels = ET.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+        targets = {r.get("Id"): r.get("Target") for r in rels}
+        workbook = ET.fromstring(z.read("xl/workbook.xml"))
+
+        out = {}
+        for sheet in workbook.iter(f"{_NS_MAIN}sheet"):
+            target = targets[sheet.get(f"{_NS_REL}id")]
+            part = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            h = shared.copy()
+            with z.open(part) as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            out[sheet.get("name")] = h.hexdigest()
+        return out
+
+
+def resolve_sources(source: str | Path) -> list[Path]:
+    """Workbooks named by a file, a directory or a glob pattern, in name order."""
+    path = Path(source)
+    if path.is_dir():
+        found = path.iterdir()
+    elif path.exists():
+        found = [path]
+    else:
+        found = [Path(p) for p in glob.glob(str(source))]
+    # Skip Office lock files (~$book.xlsx) left behind by open workbooks
+    books = sorted(p for p in found if p.suffix.lower() in WORKBOOK_SUFFIXES and not p.name.startswith("~$"))
+    names = [p.name for p in books]
+    if len(set(names)) != len(names):
+        raise ValueError("Workbook file names must be unique; they key the lineage column and the sheet cache.")
+    return books
+
+
+def clean_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # basic column cleanup
+    df.columns = [str(c).strip().replace(" ", "_") for c in df.columns]
+    return df
+
+
+def iter_sheet(path: Path, sheet: str, batch_size: int = SHEET_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """Stream one sheet as row batches with openpyxl's read-only reader.
+
+    The first row is the header and blank rows are skipped, as in pd.read_excel.
+    Only ``batch_size`` rows (plus the shared strings table) are held at once.
+    Non-zip workbooks (.xls) are read whole, in one batch.
+    """
+    path = Path(path)
+    if not zipfile.is_zipfile(path):
+        yield clean_columns(pd.read_excel(path, sheet_name=sheet))
+        return
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet]
+        # Stored sheet dimensions can be stale; read whatever rows are there
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = [f"Unnamed: {i}" if h is None else h for i, h in enumerate(header)]
+        width = len(columns)
+        pad = (None,) * width
+
+        batch, yielded = [], False
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            batch.append(row[:width] if len(row) >= width else row + pad[len(row):])
+            if len(batch) == batch_size:
+                yield clean_columns(pd.DataFrame.from_records(batch, columns=columns))
+                batch, yielded = [], True
+        if batch or not yielded:
+            # A header-only sheet still yields one empty frame with its columns
+            yield clean_columns(pd.DataFrame.from_records(batch, columns=columns))
+    finally:
+        wb.close()
+
+
+def parse_sheet(path: Path, sheet: str, cache_dir: Path, source_hash: str, batch_size: int = SHEET_BATCH_ROWS) -> dict:
+    """Stream one sheet into its cache file; runs in a worker process.
+
+    Returns the sheet's manifest record rather than the frame, so only a few
+    bytes cross the process boundary.
+    """
+    path = Path(path)
+    start = time.perf_counter()
+    hasher = FrameHasher()
+    with TableWriter(sheet, Path(cache_dir) / path.name) as writer:
+        for df in iter_sheet(path, sheet, batch_size):
+            df[SOURCE_COL] = path.name
+            df = apply_schema(df, sheet)
+            writer.write(df)
+            hasher.update(df)
+    seconds = time.perf_counter() - start
+    return table_record(
+        hasher, workbook=path.name, source_hash=source_hash,
+        seconds=round(seconds, 3), rows_per_sec=round(hasher.rows / seconds) if seconds else None,
+    )
+
+
+def drop_repeated_sources(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop the lineage column and reference rows repeated across workbooks.
+
+    The same reference sheet (rates, capacities) often arrives in every
+    workbook; each row is kept from the first workbook it appears in, while
+    duplicates within one workbook are left alone.
+    """
+    if SOURCE_COL not in df.columns:
+        return df
+    content = pd.util.hash_pandas_object(df.drop(columns=SOURCE_COL), index=False).to_numpy()
+    first = df[SOURCE_COL].astype(str).groupby(content).transform("first")
+    return df[df[SOURCE_COL].astype(str) == first].drop(columns=SOURCE_COL).reset_index(drop=True)
+
+
+def read_manifest(directory: Path) -> dict:
+    path = Path(directory) / MANIFEST_NAME
+    manifest = json.loads(path.read_text()) if path.exists() else {}
+    for key in ("workbooks", "sheets", "tables"):
+        manifest.setdefault(key, {})
+    return manifest
+
+
+def write_manifest(directory: Path, manifest: dict) -> None:
+    path = Path(directory) / MANIFEST_NAME
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def table_record(hasher: FrameHasher, **extra) -> dict:
+    return {
+        **extra,
+        "table_hash": hasher.hexdigest(),
+        "rows": int(hasher.rows),
+        "cols": len(hasher.columns or []),
+        "updated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def changed_tables(directory: Path) -> list[str]:
+    """Processed tables whose content changed in the last ingest run."""
+    return sorted(name for name, meta in read_manifest(directory)["tables"].items() if meta.get("changed"))
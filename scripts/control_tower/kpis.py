@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from control_tower.metrics import step
+
+AGGS = ("sum", "count", "size", "mean", "nunique")
+
+# Group-id spaces up to this many cells (or 2x the row count) are compressed
+# with a bincount lookup table; larger, sparser spaces go through np.unique.
+DENSE_LIMIT = 1 << 20
+
+
+@dataclass(frozen=True)
+class KpiSpec:
+    # measures use pandas named-aggregation shape: out_col -> (column, agg)
+    name: str
+    keys: list[str]
+    measures: dict[str, tuple[str, str]] = field(default_factory=dict)
+    dropna: bool = True
+
+
+@dataclass
+class _Groups:
+    g: np.ndarray               # group index of each kept row
+    rows: np.ndarray | None     # kept-row mask, None when every row is kept
+    group_ids: np.ndarray       # mixed-radix composite id of each group
+
+
+class _Scan:
+    """Per-run caches so shared key/value columns are encoded only once."""
+
+    def __init__(self, df: pd.DataFrame, derived: dict | None):
+        self.df = df
+        self.derived = derived or {}
+        self._codes: dict[str, tuple[np.ndarray, pd.Index]] = {}
+        self._values: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._distinct: dict[str, bool] = {}
+        self._groups: dict[tuple, _Groups] = {}
+
+    def column(self, name: str) -> pd.Series:
+        return self.derived[name] if name in self.derived else self.df[name]
+
+    def codes(self, name: str) -> tuple[np.ndarray, pd.Index]:
+        if name not in self._codes:
+            codes, uniques = pd.factorize(self.column(name), sort=True)
+            self._codes[name] = (np.asarray(codes, dtype=np.int64), pd.Index(uniques))
+        return self._codes[name]
+
+    def values(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        # (values with NaN as 0, presence as 0/1 weights) for bincount reductions
+        if name not in self._values:
+            v = pd.to_numeric(self.column(name), errors="coerce").to_numpy(dtype=float)
+            present = ~np.isnan(v)
+            self._values[name] = (np.where(present, v, 0.0), present.astype(float))
+        return self._values[name]
+
+    def all_distinct(self, name: str) -> bool:
+        # Unique ids (e.g. order_id) make nunique a plain non-null count
+        if name not in self._distinct:
+            self._distinct[name] = bool(self.column(name).dropna().is_unique)
+        return self._distinct[name]
+
+    def groups(self, keys: list[str], dropna: bool) -> _Groups:
+        cache_key = (tuple(keys), dropna)
+        if cache_key in self._groups:
+            return self._groups[cache_key]
+
+        # Mixed-radix composite of the per-key codes keeps groupby's sorted order.
+        # Missing keys take the slot after the last value, like dropna=False does.
+        n = len(self.df)
+        gid = np.zeros(n, dtype=np.int64)
+        valid = np.ones(n, dtype=bool)
+        space = 1
+        for k in keys:
+            codes, uniques = self.codes(k)
+            if dropna:
+                valid &= codes >= 0
+            gid = gid * (len(uniques) + 1) + np.where(codes >= 0, codes, len(uniques))
+            space *= len(uniques) + 1
+
+        rows = None if valid.all() else valid
+        kept = gid if rows is None else gid[rows]
+        if space <= max(DENSE_LIMIT, 2 * n):
+            group_ids = np.flatnonzero(np.bincount(kept, minlength=space))
+            remap = np.empty(space, dtype=np.int64)
+            remap[group_ids] = np.arange(len(group_ids))
+            g = remap[kept]
+        else:
+            group_ids, g = np.unique(kept, return_inverse=True)
+
+        self._groups[cache_key] = _Groups(g=g, rows=rows, group_ids=group_ids)
+        return self._groups[cache_key]
+
+    def key_frame(self, keys: list[str], group_ids: np.ndarray) -> pd.DataFrame:
+        out = {}
+        rest = group_ids.copy()
+        for k in reversed(keys):
+            uniques = self.codes(k)[1]
+            radix = len(uniques) + 1
+            codes = rest % radix
+            rest //= radix
+            codes = np.where(codes == len(uniques), -1, codes)
+            values = uniques.array if isinstance(uniques.dtype, pd.api.extensions.ExtensionDtype) else uniques.to_numpy()
+            out[k] = pd.api.extensions.take(values, codes, allow_fill=True)
+        return pd.DataFrame({k: out[k] for k in keys})
+
+    def reduce(self, grp: _Groups, column: str, agg: str) -> np.ndarray:
+        n = len(grp.group_ids)
+
+        def kept(a: np.ndarray) -> np.ndarray:
+            return a if grp.rows is None else a[grp.rows]
+
+        if agg == "size":
+            return np.bincount(grp.g, minlength=n)
+        if agg == "count" or (agg == "nunique" and self.all_distinct(column)):
+            present = kept(self.column(column).notna().to_numpy())
+            return np.bincount(grp.g, weights=present, minlength=n).astype(np.int64)
+        if agg == "nunique":
+            vcodes, vuniques = self.codes(column)
+            vcodes = kept(vcodes)
+            ok = vcodes >= 0
+            radix = len(vuniques) + 1
+            pairs = np.unique(grp.g[ok] * radix + vcodes[ok])
+            return np.bincount(pairs // radix, minlength=n)
+
+        filled, present = self.values(column)
+        total = np.bincount(grp.g, weights=kept(filled), minlength=n)
+        if agg == "sum":
+            src = self.column(column)
+            if pd.api.types.is_bool_dtype(src) or pd.api.types.is_integer_dtype(src):
+                return total.round().astype(np.int64)
+            return total
+        count = np.bincount(grp.g, weights=kept(present), minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, total / count, np.nan)
+
+
+def compute_kpis(df: pd.DataFrame, specs: list[KpiSpec], derived: dict | None = None) -> dict[str, pd.DataFrame]:
+    """Evaluate every spec over one shared encoding of ``df``.
+
+    ``derived`` supplies extra key/value columns (name -> Series aligned to df)
+    without having to copy them into the frame first.
+    """
+    scan = _Scan(df, derived)
+    tables = {}
+    for spec in specs:
+        with step(f"kpi {spec.name}", rows_in=len(df)) as metrics:
+            grp = scan.groups(spec.keys, spec.dropna)
+            out = scan.key_frame(spec.keys, grp.group_ids)
+            for out_col, (column, agg) in spec.measures.items():
+                if agg not in AGGS:
+                    raise ValueError(f"Unsupported aggregation {agg!r} in KPI spec {spec.name!r}")
+                out[out_col] = scan.reduce(grp, column, agg)
+            metrics.rows_out = len(out)
+        tables[spec.name] = out
+    return tables
+
+
+class KpiAccumulator:
+    """Fold compute_kpis over row batches and merge the partial aggregates.
+
+    Sums, counts and sizes add across batches; means are carried as sum/count
+    pairs. nunique also adds, which is exact only when a value never repeats
+    across batches (order ids after the pipeline's dedupe).
+
+    With ``by`` (e.g. the order day) partials are kept per value of that key,
+    so a refresh can ``drop`` the days it rebuilds and ``update`` with their
+    new rows; ``save``/``load`` persist the partials between runs.
+    """
+
+    def __init__(self, specs: list[KpiSpec], by: str | None = None):
+        self.specs = specs
+        self.by = by
+        self._partial = [
+            KpiSpec(s.name, self._keys(s), {
+                f"{out}__{part}": (column, part_agg)
+                for out, (column, agg) in s.measures.items()
+                for part, part_agg in _PARTS.get(agg, [("v", agg)])
+            }, dropna=False)
+            for s in specs
+        ]
+        self._state: dict[str, pd.DataFrame] = {}
+
+    def _keys(self, spec: KpiSpec) -> list[str]:
+        return spec.keys if self.by is None else [self.by] + [k for k in spec.keys if k != self.by]
+
+    def update(self, df: pd.DataFrame, derived: dict | None = None) -> None:
+        parts = compute_kpis(df, self._partial, derived).values()
+        for orig, spec, part in zip(self.specs, self._partial, parts):
+            # Partials keep missing keys so a missing ``by`` value never drops rows;
+            # the spec's own dropna applies to its own keys only
+            if orig.dropna:
+                part = part.dropna(subset=orig.keys).reset_index(drop=True)
+            prev = self._state.get(spec.name)
+            if prev is not None and len(prev):
+                part = _merge_partials(pd.concat([prev, part], ignore_index=True), spec.keys)
+            self._state[spec.name] = part
+
+    def drop(self, values) -> None:
+        # Forget the partials of these ``by`` values (e.g. days about to be rebuilt)
+        values = pd.Index(values)
+        for name, state in self._state.items():
+            self._state[name] = state[~state[self.by].isin(values)].reset_index(drop=True)
+
+    def result(self) -> dict[str, pd.DataFrame]:
+        tables = {}
+        for spec, partial in zip(self.specs, self._partial):
+            state = self._state.get(spec.name)
+            if state is None or state.empty:
+                tables[spec.name] = pd.DataFrame(columns=spec.keys + list(spec.measures))
+                continue
+            if self.by is not None:
+                state = _merge_partials(state.drop(columns=[c for c in partial.keys if c not in spec.keys]), spec.keys)
+            out = state[spec.keys].copy()
+            for out_col, (_, agg) in spec.measures.items():
+                if agg == "mean":
+                    n = state[f"{out_col}__n"].to_numpy(dtype=float)
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        out[out_col] = np.where(n > 0, state[f"{out_col}__sum"] / n, np.nan)
+                else:
+                    out[out_col] = state[f"{out_col}__v"].to_numpy()
+            tables[spec.name] = out
+        return tables
+
+    def save(self, directory: Path) -> None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, state in self._state.items():
+            state.to_parquet(directory / f"{name}.parquet", index=False)
+
+    @classmethod
+    def load(cls, specs: list[KpiSpec], directory: Path, by: str | None = None) -> "KpiAccumulator":
+        acc = cls(specs, by=by)
+        for spec in specs:
+            path = Path(directory) / f"{spec.name}.parquet"
+            if not path.exists():
+                raise FileNotFoundError(f"Missing KPI state {path}. Run a full build first.")
+            acc._state[spec.name] = pd.read_parquet(path)
+        return acc
+
+
+# How each aggregation is carried between batches
+_PARTS = {"mean": [("sum", "sum"), ("n", "count")]}
+
+
+def _merge_partials(parts: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    # Categories differ per batch, so merge on plain values; sort matches compute_kpis
+    keyed = parts.assign(**{k: parts[k].astype(object) for k in keys
+                            if isinstance(parts[k].dtype, pd.CategoricalDtype)})
+    return keyed.groupby(keys, sort=True, dropna=False).sum().reset_index()
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is left out of the metrics
+    resource = None
+
+ROOT = Path(__file__).resolve().parents[2]
+# One directory per run, one manifest per stage: data/_runs/<run id>/<stage>.json
+RUNS_DIR = ROOT / "data" / "_runs"
+BASELINE = "baseline"
+# Set by the pipeline runner so every stage it starts records into the same run
+RUN_ID_ENV = "CONTROL_TOWER_RUN_ID"
+
+METRICS = ["wall_s", "cpu_s", "peak_rss_mb", "bytes_written"]
+# Regression floors: changes smaller than these are noise whatever their ratio
+MIN_SECONDS = 0.05
+MIN_MB = 8.0
+
+
+def new_run_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+
+def peak_rss_mb() -> float | None:
+    """Process peak resident set size so far, in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def file_bytes(*paths: Path) -> int:
+    return sum(p.stat().st_size for p in paths if p is not None and p.exists())
+
+
+@dataclass
+class StepMetrics:
+    """Totals of one named step; repeated calls (batches, days) add up.
+
+    CPU time is the process's, so steps running side by side in threads
+    each count the CPU spent by all of them. Peak RSS is the process
+    high-water mark when the step ended.
+    """
+
+    step: str
+    calls: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_rss_mb: float | None = None
+    rows_in: int | None = None
+    rows_out: int | None = None
+    bytes_written: int = 0
+
+
+class Step:
+    """A running step; the caller fills in what it produced."""
+
+    __slots__ = ("rows_in", "rows_out", "bytes_written")
+
+    def __init__(self, rows_in: int | None = None):
+        self.rows_in = rows_in
+        self.rows_out: int | None = None
+        self.bytes_written = 0
+
+
+def _add(a: int | None, b: int | None) -> int | None:
+    return a if b is None else b if a is None else a + b
+
+
+class Recorder:
+    """Collects the steps of one stage. Nested steps are named by their path
+    (``build/kpi kpi_daily``); steps started in worker threads are top level."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.steps: dict[str, StepMetrics] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def step(self, name: str, rows_in: int | None = None) -> Iterator[Step]:
+        stack = self._local.__dict__.setdefault("stack", [])
+        path = "/".join([*stack, name])
+        stack.append(name)
+        handle = Step(rows_in)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield handle
+        finally:
+            stack.pop()
+            self._record(path, handle, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def _record(self, path: str, handle: Step, wall: float, cpu: float) -> None:
+        rss = peak_rss_mb()
+        with self._lock:
+            m = self.steps.setdefault(path, StepMetrics(path))
+            m.calls += 1
+            m.wall_s += wall
+            m.cpu_s += cpu
+            m.peak_rss_mb = rss if m.peak_rss_mb is None else max(m.peak_rss_mb, rss)
+            m.rows_in = _add(m.rows_in, handle.rows_in)
+            m.rows_out = _add(m.rows_out, handle.rows_out)
+            m.bytes_written += handle.bytes_written
+
+
+_active: Recorder | None = None
+
+
+@contextmanager
+def step(name: str, rows_in: int | None = None) -> Iterator[Step]:
+    """Time a step of the running stage (a no-op outside ``instrument``)."""
+    recorder = _active
+    if recorder is None:
+        yield Step(rows_in)
+        return
+    with recorder.step(name, rows_in) as handle:
+        yield handle
+
+
+@contextmanager
+def instrument(stage: str, run_id: str | None = None, runs_dir: Path = RUNS_DIR) -> Iterator[Recorder]:
+    """Record ``stage``'s steps while the block runs, then write its manifest.
+
+    The run id comes from the pipeline runner (``RUN_ID_ENV``) when there is
+    one, so all stages of a run land in one directory; a script run on its
+    own starts a run of its own. The manifest is written on failure too.
+    """
+    global _active
+    run_id = run_id or os.environ.get(RUN_ID_ENV) or new_run_id()
+    recorder = Recorder(stage)
+    previous, _active = _active, recorder
+    started = time.strftime("%Y-%m-%dT%H:%M:%S")
+    wall, cpu = time.perf_counter(), time.process_time()
+    status = "failed"
+    try:
+        yield recorder
+        status = "ok"
+    finally:
+        _active = previous
+        steps = sorted(recorder.steps.values(), key=lambda m: m.step)
+        manifest = {
+            "run_id": run_id,
+            "stage": stage,
+            "argv": sys.argv[1:],
+            "started": started,
+            "status": status,
+            "total": asdict(StepMetrics(
+                "total", calls=1,
+                wall_s=time.perf_counter() - wall,
+                cpu_s=time.process_time() - cpu,
+                peak_rss_mb=peak_rss_mb(),
+                bytes_written=sum(m.bytes_written for m in steps),
+            )),
+            "steps": [asdict(m) for m in steps],
+        }
+        path = Path(runs_dir) / run_id / f"{stage}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(manifest, indent=2))
+        print(f"Metrics: {path}")
+
+
+def resolve_run(name: str, runs_dir: Path = RUNS_DIR) -> Path:
+    """A run directory by path or id; ``latest`` is the newest run other than the baseline."""
+    if name == "latest":
+        runs = sorted(p for p in Path(runs_dir).iterdir() if p.is_dir() and p.name != BASELINE) if Path(runs_dir).is_dir() else []
+        if not runs:
+            raise FileNotFoundError(f"No runs recorded in {runs_dir}")
+        return runs[-1]
+    path = Path(name)
+    path = path if path.is_dir() else Path(runs_dir) / name
+    if not path.is_dir():
+        raise FileNotFoundError(f"No run {name!r} in {runs_dir}")
+    return path
+
+
+def load_run(run_dir: Path) -> pd.DataFrame:
+    """Every stage's total and steps in a run, one row per (stage, step)."""
+    rows = []
+    for path in sorted(Path(run_dir).glob("*.json")):
+        manifest = json.loads(path.read_text())
+        for m in [manifest["total"], *manifest["steps"]]:
+            rows.append({"stage": manifest["stage"], "status": manifest["status"], **m})
+    return pd.DataFrame(rows, columns=["stage", "status", *StepMetrics.__dataclass_fields__])
+
+
+def save_baseline(run_dir: Path, runs_dir: Path = RUNS_DIR) -> Path:
+    target = Path(runs_dir) / BASELINE
+    if target.exists():
+        shutil.rmtree(target)
+    shutil.copytree(run_dir, target)
+    return target
+
+
+def compare_runs(
+    baseline: pd.DataFrame,
+    current: pd.DataFrame,
+    threshold: float = 0.2,
+    min_seconds: float = MIN_SECONDS,
+    min_mb: float = MIN_MB,
+) -> pd.DataFrame:
+    """Per (stage, step, metric): baseline, current, relative change and
+    whether it is a regression, i.e. grew by more than ``threshold`` and by
+    more than the metric's floor. Steps missing from either run are left
+    out; ``rows_changed`` marks steps whose row counts differ, whose
+    timings then compare different work."""
+    keys = ["stage", "step"]
+    both = baseline.merge(current, on=keys, suffixes=("_base", "_cur"))
+    floors = {"wall_s": min_seconds, "cpu_s": min_seconds, "peak_rss_mb": min_mb, "bytes_written": min_mb * (1 << 20)}
+    rows_changed = (
+        both["rows_in_base"].fillna(-1).ne(both["rows_in_cur"].fillna(-1))
+        | both["rows_out_base"].fillna(-1).ne(both["rows_out_cur"].fillna(-1))
+    )
+    parts = []
+    for metric in METRICS:
+        base = pd.to_numeric(both[f"{metric}_base"], errors="coerce")
+        cur = pd.to_numeric(both[f"{metric}_cur"], errors="coerce")
+        change = (cur - base) / base.where(base > 0)
+        parts.append(pd.DataFrame({
+            "stage": both["stage"],
+            "step": both["step"],
+            "metric": metric,
+            "baseline": base,
+            "current": cur,
+            "change": change,
+            "regression": (cur - base > floors[metric]) & ((change > threshold) | base.le(0)),
+            "rows_changed": rows_changed,
+        }))
+    return pd.concat(parts, ignore_index=True).sort_values(keys + ["metric"], kind="stable").reset_index(drop=True)
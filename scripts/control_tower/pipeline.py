@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+from control_tower.ingest import file_hash
+from control_tower.metrics import RUN_ID_ENV, instrument, new_run_id, step
+from control_tower.storage import as_stored, read_table
+
+ROOT = Path(__file__).resolve().parents[2]
+SCRIPTS_DIR = ROOT / "scripts"
+DATA_DIR = ROOT / "data"
+# Fingerprints of the last successful run of each stage, plus a digest cache
+STATE_FILE = DATA_DIR / "_pipeline_state.json"
+
+REFERENCE = ["FreightRates", "WhCapacities", "WhCosts", "PlantPorts", "ProductsPerPlant", "VmiCustomers"]
+DIMENSIONS = ["carriers", "services", "ports", "plants", "products", "customers"]
+FACT = "analytics/fact_orders"
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One pipeline script with the tables it reads and writes.
+
+    Inputs and outputs are paths under ``data/`` without suffix: a table is
+    its Parquet file, CSV export or partition directory. Inputs may be globs.
+    ``flags`` are the runner options the script accepts.
+    """
+
+    name: str
+    script: str
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+    flags: frozenset[str] = frozenset({"csv", "chunked"})
+
+    def args(self, export_csv: bool = False, chunked: bool = False) -> list[str]:
+        chosen = {"csv": export_csv, "chunked": chunked}
+        return [f"--{flag}" for flag in sorted(self.flags) if chosen[flag]]
+
+
+STAGES = [
+    Stage(
+        "ingest", "01_ingest_dataset.py",
+        ("raw/*.xls*",),
+        tuple(f"processed/{name}" for name in ["OrderList", *REFERENCE]),
+        flags=frozenset({"csv"}),
+    ),
+    Stage(
+        "prepare", "02_prepare_data.py",
+        ("processed/OrderList", "processed/FreightRates", "processed/WhCapacities", "processed/WhCosts"),
+        (FACT, "analytics/kpi_daily", "analytics/kpi_lane", "analytics/kpi_carrier", "analytics/kpi_plant",
+         "analytics/kpi_cube", "analytics/rate_band_issues"),
+    ),
+    Stage(
+        "context", "02b_generate_context_mappings.py",
+        (FACT,),
+        tuple(f"context/{name}" for name in DIMENSIONS),
+        flags=frozenset({"chunked"}),
+    ),
+    Stage(
+        "apply_context", "02c_apply_context_mappings.py",
+        (FACT, "context/*"),
+        ("analytics/fact_orders_enriched",),
+    ),
+    Stage(
+        "rate_shopping", "02d_rate_shopping.py",
+        (FACT, "processed/FreightRates"),
+        ("analytics/rate_shop_orders", "analytics/kpi_rate_savings"),
+    ),
+    Stage(
+        "assignment", "02e_optimize_assignment.py",
+        (FACT, *(f"processed/{name}" for name in REFERENCE)),
+        ("analytics/assignment_plan", "analytics/assignment_summary"),
+    ),
+    Stage(
+        "network", "02f_check_network.py",
+        (FACT, "processed/PlantPorts", "processed/ProductsPerPlant", "processed/VmiCustomers"),
+        ("analytics/network_violations", "analytics/network_violation_summary"),
+    ),
+    Stage(
+        "congestion", "02g_simulate_port_congestion.py",
+        (FACT,),
+        ("analytics/port_congestion", "analytics/port_congestion_ports"),
+        flags=frozenset({"csv"}),
+    ),
+    Stage(
+        "control_tower", "03_build_control_tower_v2.py",
+        (FACT,),
+        tuple(f"analytics/{name}" for name in [
+            "kpi_sla", "risk_shipments", "exceptions", "seasonality_monthly", "kpi_margin_at_risk",
+            "inventory_risk", "scenarios", "plant_backlog", "plant_backlog_daily",
+        ]),
+    ),
+]
+
+
+def table_files(spec: str, data_dir: Path = DATA_DIR) -> list[Path]:
+    """Files behind a stage input/output spec (empty when it does not exist)."""
+    if any(ch in spec for ch in "*?["):
+        return sorted(p for p in data_dir.glob(spec) if p.is_file())
+    path = data_dir / spec
+    if path.is_dir():
+        return sorted(p for p in path.rglob("*") if p.is_file())
+    return [p for p in (path.parent / f"{path.name}.parquet", path.parent / f"{path.name}.csv") if p.exists()]
+
+
+def upstream(stages: list[Stage]) -> dict[str, set[str]]:
+    """Stages whose outputs each stage reads (within ``stages``)."""
+    return {
+        stage.name: {
+            other.name for other in stages
+            if other is not stage and any(fnmatch.fnmatch(out, spec) for out in other.outputs for spec in stage.inputs)
+        }
+        for stage in stages
+    }
+
+
+class Fingerprints:
+    """Content fingerprints of stage inputs.
+
+    Files are hashed in full, but each digest is cached against the file's
+    size and mtime, so unchanged inputs are not re-read on the next run.
+    """
+
+    def __init__(self, cache: dict | None = None, data_dir: Path = DATA_DIR):
+        # The caller's dict is filled in place (the runner saves it with its state)
+        self.cache = {} if cache is None else cache
+        self.data_dir = data_dir
+
+    def digest(self, path: Path) -> str:
+        key = str(path.relative_to(self.data_dir))
+        stat = path.stat()
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        cached = self.cache.get(key)
+        if cached and cached[:2] == stamp:
+            return cached[2]
+        digest = file_hash(path)
+        self.cache[key] = [*stamp, digest]
+        return digest
+
+    def stage(self, stage: Stage, args: list[str], code: str) -> str:
+        # Script + package code, arguments, then every input file's path and content
+        h = hashlib.sha256()
+        h.update(code.encode())
+        h.update(file_hash(SCRIPTS_DIR / stage.script).encode())
+        h.update(json.dumps(args).encode())
+        for spec in stage.inputs:
+            for path in table_files(spec, self.data_dir):
+                h.update(str(path.relative_to(self.data_dir)).encode())
+                h.update(self.digest(path).encode())
+        return h.hexdigest()
+
+
+def code_hash() -> str:
+    # Any change to the shared package invalidates every stage
+    h = hashlib.sha256()
+    for path in sorted((SCRIPTS_DIR / "control_tower").glob("*.py")):
+        h.update(file_hash(path).encode())
+    return h.hexdigest()
+
+
+def _read_state(path: Path) -> dict:
+    return json.loads(path.read_text()) if path.exists() else {"stages": {}, "files": {}}
+
+
+def _write_state(path: Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(state, indent=2, sort_keys=True))
+
+
+def _execute(stage: Stage, args: list[str], run_id: str) -> tuple[int, str, float]:
+    # Scripts resolve data/ relative to the repo root, so they run from there;
+    # the run id makes every stage record its metrics into the same run
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, str(SCRIPTS_DIR / stage.script), *args],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, RUN_ID_ENV: run_id},
+    )
+    return proc.returncode, proc.stdout + proc.stderr, time.perf_counter() - started
+
+
+def run(
+    only: list[str] | None = None,
+    force: bool = False,
+    jobs: int = 4,
+    export_csv: bool = False,
+    chunked: bool = False,
+    dry_run: bool = False,
+    stages: list[Stage] = STAGES,
+    state_file: Path = STATE_FILE,
+    run_id: str | None = None,
+) -> dict[str, str]:
+    """Run the pipeline as a DAG and return each stage's status.
+
+    A stage waits for the stages producing its inputs; stages whose inputs
+    are ready run in parallel (up to ``jobs``). A stage is skipped when its
+    fingerprint (code, arguments and input contents) matches its last
+    successful run and its outputs exist, unless ``force``. A stage with no
+    upstream stage and no input files is skipped when its outputs exist,
+    even with ``force``, since there is nothing to run it on. ``only`` limits
+    the run to the named stages; the others are taken as they are on disk.
+    Statuses: ran, skipped, failed, blocked (an upstream stage failed) and,
+    with ``dry_run``, stale. Stages that run record their metrics under
+    ``run_id`` (see control_tower.metrics).
+    """
+    names = {stage.name for stage in stages}
+    unknown = set(only or []) - names
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {sorted(unknown)}. Stages: {[s.name for s in stages]}")
+    selected = [stage for stage in stages if not only or stage.name in only]
+    deps = upstream(selected)
+
+    run_id = run_id or os.environ.get(RUN_ID_ENV) or new_run_id()
+    state = _read_state(state_file)
+    prints = Fingerprints(state["files"])
+    code = code_hash()
+    status: dict[str, str] = {}
+    pending = list(selected)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        while pending or running:
+            # Declared order is topological, so one pass settles every skip chain
+            for stage in list(pending):
+                before = [status.get(name) for name in deps[stage.name]]
+                if any(s in ("failed", "blocked") for s in before):
+                    status[stage.name] = "blocked"
+                elif all(s in ("ran", "skipped", "stale") for s in before):
+                    args = stage.args(export_csv, chunked)
+                    fingerprint = prints.stage(stage, args, code)
+                    built = all(table_files(spec) for spec in stage.outputs)
+                    fresh = (
+                        not force
+                        and "stale" not in before
+                        and state["stages"].get(stage.name, {}).get("fingerprint") == fingerprint
+                        and built
+                    )
+                    if built and not deps[stage.name] and not any(table_files(spec) for spec in stage.inputs):
+                        # Nothing to rebuild from, e.g. a clone that ships the
+                        # processed tables but not the raw workbooks
+                        status[stage.name] = "skipped"
+                        print(f"[{stage.name}] no inputs on disk, using its existing outputs")
+                    elif fresh:
+                        status[stage.name] = "skipped"
+                        print(f"[{stage.name}] up to date, skipped")
+                    elif dry_run:
+                        status[stage.name] = "stale"
+                        print(f"[{stage.name}] would run: {stage.script} {' '.join(args)}".rstrip())
+                    else:
+                        print(f"[{stage.name}] running {stage.script} {' '.join(args)}".rstrip())
+                        running[pool.submit(_execute, stage, args, run_id)] = (stage, fingerprint)
+                        status[stage.name] = "running"
+                else:
+                    continue
+                pending.remove(stage)
+
+            if not running:
+                if pending:
+                    raise RuntimeError(f"Unresolvable stage dependencies: {[s.name for s in pending]}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, fingerprint = running.pop(future)
+                returncode, output, seconds = future.result()
+                for line in output.rstrip().splitlines():
+                    print(f"[{stage.name}] {line}")
+                if returncode == 0:
+                    status[stage.name] = "ran"
+                    # Recorded against the inputs it ran on; the run itself may
+                    # have refreshed cached digests, so the state is saved per stage
+                    state["stages"][stage.name] = {"fingerprint": fingerprint, "seconds": round(seconds, 3)}
+                    _write_state(state_file, state)
+                    print(f"[{stage.name}] done in {seconds:.1f}s")
+                else:
+                    status[stage.name] = "failed"
+                    print(f"[{stage.name}] FAILED (exit {returncode})")
+
+    if not dry_run:
+        _write_state(state_file, state)
+    return status
+
+
+def _table_names(specs) -> list[str]:
+    # Input/output specs to table names; "context/*" stands for every dimension
+    names = []
+    for spec in specs:
+        name = Path(spec).name
+        names.extend(DIMENSIONS if name == "*" else [name])
+    return names
+
+
+def _load_stage(stage: Stage):
+    # Stage scripts are not a package (their names start with digits), so each is loaded by path
+    spec = importlib.util.spec_from_file_location(f"stage_{stage.name}", SCRIPTS_DIR / stage.script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_in_memory(
+    export_csv: bool = False,
+    stages: list[Stage] = STAGES,
+    state_file: Path = STATE_FILE,
+) -> dict[str, str]:
+    """Run every stage in one process, passing frames between them.
+
+    Ingest runs as usual (skipped when its workbooks are unchanged) and the
+    processed tables are read once. Each later stage's ``build`` then gets
+    its input frames straight from the stages before it, typed and ordered
+    as a disk round-trip would leave them (``as_stored``). Nothing is written
+    until every stage has built; then each stage's ``save`` writes its
+    artifacts in stage order and the stage fingerprints are recorded, so a
+    following ``run`` skips them. The builds and saves are recorded as
+    steps of one ``in_memory`` metrics manifest. Statuses as for ``run``.
+    """
+    first, rest = stages[0], stages[1:]
+    run_id = os.environ.get(RUN_ID_ENV) or new_run_id()
+    status = run(only=[first.name], export_csv=export_csv, stages=stages, state_file=state_file, run_id=run_id)
+    if status[first.name] == "failed":
+        return {**status, **{stage.name: "blocked" for stage in rest}}
+
+    # Frames later stages read; other outputs are only kept for saving
+    needed = set(_table_names(spec for stage in rest for spec in stage.inputs))
+    seconds = {}
+    built = []
+    cwd = os.getcwd()
+    # Some scripts resolve data/ relative to the working directory
+    os.chdir(ROOT)
+    try:
+        with instrument("in_memory", run_id=run_id):
+            frames = {name: read_table(name, DATA_DIR / "processed") for name in _table_names(first.outputs)}
+            for stage in rest:
+                started = time.perf_counter()
+                try:
+                    module = _load_stage(stage)
+                    with step(f"build {stage.name}"):
+                        outputs = module.build({name: frames[name] for name in _table_names(stage.inputs)})
+                except Exception:
+                    for line in traceback.format_exc().rstrip().splitlines():
+                        print(f"[{stage.name}] {line}")
+                    print(f"[{stage.name}] FAILED, nothing written")
+                    status[stage.name] = "failed"
+                    status.update({s.name: "blocked" for s in rest if s.name not in status})
+                    return status
+                for name in _table_names(stage.outputs):
+                    if name in needed:
+                        frames[name] = as_stored(outputs[name], name)
+                built.append((stage, module, outputs))
+                seconds[stage.name] = time.perf_counter() - started
+                print(f"[{stage.name}] built in {seconds[stage.name]:.1f}s")
+
+            # Stage order: later saves may record the stored days of earlier outputs
+            started = time.perf_counter()
+            for stage, module, outputs in built:
+                with step(f"save {stage.name}"):
+                    module.save(outputs, export_csv)
+                status[stage.name] = "ran"
+            print(f"Saved {len(built)} stage(s) in {time.perf_counter() - started:.1f}s")
+    finally:
+        os.chdir(cwd)
+
+    state = _read_state(state_file)
+    prints = Fingerprints(state["files"])
+    code = code_hash()
+    for stage in rest:
+        fingerprint = prints.stage(stage, stage.args(export_csv), code)
+        state["stages"][stage.name] = {"fingerprint": fingerprint, "seconds": round(seconds[stage.name], 3)}
+    _write_state(state_file, state)
+    return status
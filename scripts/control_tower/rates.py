@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from control_tower.metrics import step
+
+# A rate card row applies to an order when the lane/carrier/service matches
+# and the order weight falls in [minm_wgh_qty, max_wgh_qty].
+RATE_KEYS = ["carrier", "orig_port_cd", "dest_port_cd", "svc_cd"]
+RATE_COLS = ["minimum_cost", "rate", "mode_dsc", "carrier_type"]
+
+# Rate cards are published in cents (e.g. 65.00-69.99, 70.00-74.99), so a
+# 0.01 step between bands is contiguous, not a gap.
+GAP_TOLERANCE = 0.01
+
+
+@dataclass
+class RateCardIndex:
+    rates: pd.DataFrame       # freight rows, positional index
+    keys: pd.MultiIndex       # unique (carrier, orig, dest, svc) keys
+    key_first: np.ndarray     # first freight row per key (fallback when no band matches)
+    breakpoints: np.ndarray   # sorted unique band boundaries across all keys
+    seg_key: np.ndarray       # key code of each elementary weight segment
+    seg_pos: np.ndarray       # composite (key, boundary rank) sort key of each segment
+    seg_band: np.ndarray      # winning freight row for each segment, -1 = no band
+
+    def lookup(self, keys: pd.DataFrame, weight) -> np.ndarray:
+        """Return the freight row for each order, -1 when the lane has no rate card."""
+        code = self.keys.get_indexer(pd.MultiIndex.from_frame(keys[RATE_KEYS]))
+        w = pd.to_numeric(pd.Series(weight), errors="coerce").to_numpy(dtype=float)
+
+        # Binary search the order weight into the segment table of its own key.
+        stride = len(self.breakpoints) + 1
+        rank = np.searchsorted(self.breakpoints, w, side="right")
+        pos = np.searchsorted(self.seg_pos, code.astype(np.int64) * stride + rank, side="right") - 1
+        pos_c = pos.clip(min=0)
+
+        has_key = code >= 0
+        in_band = has_key & ~np.isnan(w) & (pos >= 0)
+        if len(self.seg_key):
+            in_band &= self.seg_key[pos_c] == code
+            band = np.where(in_band, self.seg_band[pos_c], -1)
+        else:
+            band = np.full(len(code), -1)
+
+        # Outside every band: keep the lane's first rate row, as the old merge did.
+        fallback = np.where(has_key, self.key_first[code.clip(min=0)], -1)
+        return np.where(band >= 0, band, fallback)
+
+
+def build_rate_index(freight: pd.DataFrame) -> RateCardIndex:
+    rates = freight.reset_index(drop=True)
+    key_codes, keys = pd.MultiIndex.from_frame(rates[RATE_KEYS]).factorize()
+    key_codes = np.asarray(key_codes)
+    _, key_first = np.unique(key_codes, return_index=True)
+
+    lo = pd.to_numeric(rates["minm_wgh_qty"], errors="coerce").to_numpy(dtype=float)
+    hi = pd.to_numeric(rates["max_wgh_qty"], errors="coerce").to_numpy(dtype=float)
+    valid = ~np.isnan(lo) & ~np.isnan(hi) & (lo <= hi) & (key_codes >= 0)
+    # Half-open [lo, hi_excl) is the same test as the closed lo <= w <= hi.
+    hi_excl = np.nextafter(hi, np.inf)
+
+    rows = np.flatnonzero(valid)
+    order = np.lexsort((rows, key_codes[rows]))
+    rows = rows[order]
+    bounds = np.flatnonzero(np.diff(key_codes[rows])) + 1
+
+    seg_key, seg_start, seg_band = [], [], []
+    for grp in np.split(rows, bounds):
+        if not len(grp):
+            continue
+        starts = np.unique(np.concatenate([lo[grp], hi_excl[grp]]))
+        # Overlapping bands: the earliest rate card row wins, matching the
+        # stable sort + drop_duplicates the merge-based costing relied on.
+        cover = (lo[grp][None, :] <= starts[:, None]) & (starts[:, None] < hi_excl[grp][None, :])
+        winner = np.where(cover.any(axis=1), grp[cover.argmax(axis=1)], -1)
+        seg_key.append(np.full(len(starts), key_codes[grp[0]]))
+        seg_start.append(starts)
+        seg_band.append(winner)
+
+    if seg_key:
+        seg_key = np.concatenate(seg_key)
+        seg_start = np.concatenate(seg_start)
+        seg_band = np.concatenate(seg_band)
+    else:
+        seg_key = np.empty(0, dtype=np.int64)
+        seg_start = np.empty(0, dtype=float)
+        seg_band = np.empty(0, dtype=np.int64)
+
+    breakpoints = np.unique(seg_start)
+    stride = len(breakpoints) + 1
+    seg_pos = seg_key.astype(np.int64) * stride + np.searchsorted(breakpoints, seg_start, side="right")
+
+    return RateCardIndex(
+        rates=rates,
+        keys=keys,
+        key_first=key_first,
+        breakpoints=breakpoints,
+        seg_key=seg_key,
+        seg_pos=seg_pos,
+        seg_band=seg_band,
+    )
+
+
+def apply_rates(orders: pd.DataFrame, index: RateCardIndex, weight_col: str = "weight") -> pd.DataFrame:
+    df = orders.copy()
+    with step("band lookup", rows_in=len(df)) as metrics:
+        row = index.lookup(df, df[weight_col])
+        metrics.rows_out = int((row >= 0).sum())
+    with step("freight merge", rows_in=len(df)) as metrics:
+        matched = index.rates[RATE_COLS].reindex(row)
+        for col in RATE_COLS:
+            df[col] = matched[col].to_numpy()
+
+        # cost = max(minimum_cost, weight * rate)
+        df["freight_cost_est"] = np.where(
+            df["rate"].notna() & df[weight_col].notna(),
+            np.maximum(df["minimum_cost"].fillna(0), df[weight_col] * df["rate"]),
+            np.nan
+        )
+        metrics.rows_out = len(df)
+    return df
+
+
+def band_issues(freight: pd.DataFrame, tolerance: float = GAP_TOLERANCE) -> pd.DataFrame:
+    cols = RATE_KEYS + ["issue", "prev_max_wgh_qty", "minm_wgh_qty", "max_wgh_qty"]
+    bands = freight[RATE_KEYS + ["minm_wgh_qty", "max_wgh_qty"]].dropna(subset=["minm_wgh_qty", "max_wgh_qty"])
+    if bands.empty:
+        return pd.DataFrame(columns=cols)
+
+    bands = bands.sort_values(RATE_KEYS + ["minm_wgh_qty", "max_wgh_qty"], kind="stable").reset_index(drop=True)
+    grp = bands.groupby(RATE_KEYS, sort=False, dropna=False, observed=True)
+    bands["prev_max_wgh_qty"] = grp["max_wgh_qty"].cummax().groupby([bands[k] for k in RATE_KEYS], dropna=False, observed=True).shift()
+
+    gap = (bands["minm_wgh_qty"] - bands["prev_max_wgh_qty"]).round(6)
+    bands["issue"] = np.select([gap <= 0, gap > tolerance], ["overlap", "gap"], default="")
+    return bands.loc[bands["issue"] != "", cols].reset_index(drop=True)
+
+
+# ---------- Rate shopping: every eligible rate row per order ----------
+
+SHOP_KEYS = ["orig_port_cd", "dest_port_cd"]
+# Order x rate-row pairs materialized at once; bounds the fan-out's memory
+DEFAULT_MAX_PAIRS = 5_000_000
+
+
+@dataclass
+class LaneRateIndex:
+    rates: pd.DataFrame     # freight rows grouped by lane, positional index
+    keys: list[str]         # columns that make a lane (SHOP_KEYS, optionally + svc_cd)
+    lanes: pd.MultiIndex    # unique lanes
+    offsets: np.ndarray     # rows of lane i are rates[offsets[i]:offsets[i + 1]]
+    lo: np.ndarray
+    hi: np.ndarray
+    minimum_cost: np.ndarray
+    rate: np.ndarray
+    tpt: np.ndarray
+
+
+def build_lane_index(freight: pd.DataFrame, keys: list[str] = SHOP_KEYS) -> LaneRateIndex:
+    lane_codes, lanes = pd.MultiIndex.from_frame(freight[keys]).factorize()
+    lane_codes = np.asarray(lane_codes)
+    order = np.argsort(lane_codes, kind="stable")
+    order = order[lane_codes[order] >= 0]
+    rates = freight.iloc[order].reset_index(drop=True)
+    offsets = np.searchsorted(lane_codes[order], np.arange(len(lanes) + 1))
+
+    def num(col: str) -> np.ndarray:
+        return pd.to_numeric(rates[col], errors="coerce").to_numpy(dtype=float)
+
+    return LaneRateIndex(
+        rates=rates, keys=list(keys), lanes=lanes, offsets=offsets,
+        lo=num("minm_wgh_qty"), hi=num("max_wgh_qty"),
+        minimum_cost=np.nan_to_num(num("minimum_cost")), rate=num("rate"), tpt=num("tpt_day_cnt"),
+    )
+
+
+def _first_per_order(o: np.ndarray, keys: list[np.ndarray], n: int) -> np.ndarray:
+    # Candidate row of each order that sorts first on ``keys`` (-1 when none)
+    best = np.full(n, -1)
+    if len(o):
+        order = np.lexsort(list(reversed(keys)) + [o])
+        first = np.flatnonzero(np.r_[True, np.diff(o[order]) != 0])
+        best[o[order][first]] = order[first]
+    return best
+
+
+def shop_rates(orders: pd.DataFrame, index: LaneRateIndex, max_pairs: int = DEFAULT_MAX_PAIRS) -> pd.DataFrame:
+    """Cheapest and fastest eligible rate row for every order.
+
+    Eligible rows share the order's lane (``index.keys``), with the weight inside
+    [minm_wgh_qty, max_wgh_qty], across all carriers (and service codes unless
+    the lane keys include ``svc_cd``). The order x row fan-out is built in
+    slices of at most ``max_pairs`` pairs.
+    Ties go to the faster (cheapest) or cheaper (fastest) row, then rate card order.
+    """
+    n = len(orders)
+    code = index.lanes.get_indexer(pd.MultiIndex.from_frame(orders[index.keys]))
+    weight = pd.to_numeric(orders["weight"], errors="coerce").to_numpy(dtype=float)
+    start = np.where(code >= 0, index.offsets[code.clip(min=0)], 0)
+    count = np.where(code >= 0, index.offsets[(code + 1).clip(min=1)] - start, 0)
+
+    picks = {"cheapest": np.full(n, -1), "fastest": np.full(n, -1)}
+    costs = {"cheapest": np.full(n, np.nan), "fastest": np.full(n, np.nan)}
+    options = np.zeros(n, dtype=np.int64)
+    cum = np.cumsum(count)
+    cuts = np.searchsorted(cum, np.arange(max_pairs, cum[-1] if n else 0, max_pairs), side="right")
+    for a, b in zip(np.r_[0, cuts], np.r_[cuts, n]):
+        if a >= b:
+            continue
+        # Fan out orders a..b against every rate row of their lane
+        c = count[a:b]
+        o = np.repeat(np.arange(b - a), c)
+        first = np.cumsum(c) - c
+        r = np.arange(len(o)) - np.repeat(first - start[a:b], c)
+
+        w = weight[a:b][o]
+        ok = (index.lo[r] <= w) & (w <= index.hi[r])
+        o, r, w = o[ok], r[ok], w[ok]
+        cost = np.maximum(index.minimum_cost[r], w * index.rate[r])
+        tpt = index.tpt[r]
+
+        options[a:b] = np.bincount(o, minlength=b - a)
+        for name, keys in (("cheapest", [cost, tpt, r]), ("fastest", [tpt, cost, r])):
+            pick = _first_per_order(o, keys, b - a)
+            hit = pick >= 0
+            picks[name][a:b][hit] = r[pick[hit]]
+            costs[name][a:b][hit] = cost[pick[hit]]
+
+    out = pd.DataFrame({"options": options}, index=orders.index)
+    for name, rows in picks.items():
+        matched = index.rates.reindex(rows)
+        out[f"{name}_carrier"] = matched["carrier"].to_numpy()
+        out[f"{name}_svc_cd"] = matched["svc_cd"].to_numpy()
+        out[f"{name}_mode_dsc"] = matched["mode_dsc"].to_numpy()
+        out[f"{name}_cost"] = costs[name]
+        out[f"{name}_tpt"] = pd.to_numeric(matched["tpt_day_cnt"], errors="coerce").to_numpy(dtype=float)
+    return out
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from control_tower.context import lane_labels
+
+# Mode risk factor: keep it lightweight
+MODE_RISK = {"AIR": 0.25, "SEA": 0.60, "TRUCK": 0.40, "RAIL": 0.50}
+DEFAULT_MODE_RISK = 0.40
+
+# risk_score = 100 * weighted sum of the components, clipped to [0, 100]
+WEIGHTS = {
+    "lane_late_rate": 0.35,
+    "carrier_late_rate": 0.30,
+    "late_days_scaled": 0.20,
+    "cost_scaled": 0.10,
+    "mode_risk": 0.05,
+}
+# Bands are right-closed: (-1, 33] Low, (33, 66] Medium, (66, 101] High
+BAND_EDGES = [-1, 33, 66, 101]
+BANDS = ["Low", "Medium", "High"]
+# Exceptions are ranked on risk plus cost exposure
+PRIORITY_WEIGHTS = {"risk_score": 0.65, "cost_scaled": 0.35}
+
+_EPS = 1e-9
+
+
+def _fill(a: np.ndarray, value: float) -> np.ndarray:
+    return np.where(np.isnan(a), value, a)
+
+
+def _categorical(values) -> pd.Categorical:
+    if isinstance(values, pd.Categorical):
+        return values
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.array
+    return pd.Categorical(values)
+
+
+def _lanes(df: pd.DataFrame) -> pd.Categorical:
+    # Lane strings are only built per distinct port pair
+    if "lane" in df.columns:
+        return _categorical(df["lane"])
+    return lane_labels(_categorical(df["orig_port_cd"]), _categorical(df["dest_port_cd"]))
+
+
+def _lookup(values, table: dict) -> np.ndarray:
+    # Map the distinct values once, then take per row (NaN when unknown)
+    cat = _categorical(values)
+    mapped = pd.Series(cat.categories.astype(str)).map(table).to_numpy(dtype=float)
+    codes = np.asarray(cat.codes)
+    if not len(mapped):
+        return np.full(len(codes), np.nan)
+    return np.where(codes >= 0, mapped[codes.clip(min=0)], np.nan)
+
+
+@dataclass
+class RiskModel:
+    """Shipment risk model: learned late rates and scaling ranges plus fixed weights.
+
+    ``fit`` learns from a history frame; ``score`` is the vectorized batch
+    path and ``score_one``/``score_batch`` score new orders from the stored
+    parameters alone. ``save``/``load`` persist it as a small JSON artifact.
+    """
+
+    late_mean: float
+    lane_late: dict[str, float]
+    carrier_late: dict[str, float]
+    cost_range: tuple[float, float]
+    late_days_range: tuple[float, float]
+    mode_risk: dict[str, float] = field(default_factory=lambda: dict(MODE_RISK))
+
+    @classmethod
+    def fit(cls, df: pd.DataFrame) -> "RiskModel":
+        """Learn lane/carrier late rates and scaling ranges from a fact frame."""
+        late = df["is_late"].astype(float)
+        lane = pd.Series(_lanes(df), index=df.index)
+        cost = df["freight_cost_est"].astype(float)
+        late_days = df["ship_late_day_count"].astype(float)
+        return cls.from_stats(
+            late_mean=late.mean(),
+            lane_late=late.groupby(lane, observed=True).mean(),
+            carrier_late=late.groupby(df["carrier"], observed=True).mean(),
+            cost_range=(cost.min(), cost.max()),
+            late_days_range=(late_days.min(), late_days.max()),
+        )
+
+    @classmethod
+    def from_stats(cls, late_mean, lane_late, carrier_late, cost_range, late_days_range) -> "RiskModel":
+        """Build from precomputed aggregates (e.g. KPI partials folded over batches)."""
+        def rates(s) -> dict[str, float]:
+            s = pd.Series(s).dropna()
+            return {str(k): float(v) for k, v in s.items()}
+
+        return cls(
+            late_mean=float(late_mean),
+            lane_late=rates(lane_late),
+            carrier_late=rates(carrier_late),
+            cost_range=(float(cost_range[0]), float(cost_range[1])),
+            late_days_range=(float(late_days_range[0]), float(late_days_range[1])),
+        )
+
+    # ---------- batch ----------
+    def components(self, df: pd.DataFrame) -> dict[str, np.ndarray]:
+        cost = pd.to_numeric(df["freight_cost_est"], errors="coerce").to_numpy(dtype=float)
+        late_days = pd.to_numeric(df["ship_late_day_count"], errors="coerce").to_numpy(dtype=float)
+        return {
+            "lane_late_rate": _fill(_lookup(_lanes(df), self.lane_late), self.late_mean),
+            "carrier_late_rate": _fill(_lookup(df["carrier"], self.carrier_late), self.late_mean),
+            "mode_risk": _fill(_lookup(df["mode_dsc"], self.mode_risk), DEFAULT_MODE_RISK),
+            "cost_scaled": (cost - self.cost_range[0]) / (self.cost_range[1] - self.cost_range[0] + _EPS),
+            "late_days_scaled": (late_days - self.late_days_range[0]) / (self.late_days_range[1] - self.late_days_range[0] + _EPS),
+        }
+
+    def score(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add the risk components, ``risk_score`` and ``risk_band`` to ``df``."""
+        parts = self.components(df)
+        for col, values in parts.items():
+            df[col] = values
+        df["risk_score"] = np.clip(100 * sum(w * parts[c] for c, w in WEIGHTS.items()), 0, 100)
+        df["risk_band"] = pd.cut(df["risk_score"], BAND_EDGES, labels=BANDS)
+        return df
+
+    def priority(self, df: pd.DataFrame) -> pd.Series:
+        """Exception priority of scored rows (needs ``risk_score`` and ``cost_scaled``)."""
+        return (
+            PRIORITY_WEIGHTS["risk_score"] * df["risk_score"]
+            + PRIORITY_WEIGHTS["cost_scaled"] * (df["cost_scaled"] * 100)
+        ).clip(0, 100)
+
+    # ---------- single orders ----------
+    def score_one(
+        self,
+        lane: str,
+        carrier: str,
+        mode_dsc: str | None = None,
+        freight_cost_est: float = 0.0,
+        ship_late_day_count: float = 0.0,
+    ) -> float:
+        """Risk score of one order from plain Python values; no pandas involved."""
+        cost_lo, cost_hi = self.cost_range
+        late_lo, late_hi = self.late_days_range
+        score = 100 * (
+            WEIGHTS["lane_late_rate"] * self.lane_late.get(lane, self.late_mean)
+            + WEIGHTS["carrier_late_rate"] * self.carrier_late.get(carrier, self.late_mean)
+            + WEIGHTS["late_days_scaled"] * (ship_late_day_count - late_lo) / (late_hi - late_lo + _EPS)
+            + WEIGHTS["cost_scaled"] * (freight_cost_est - cost_lo) / (cost_hi - cost_lo + _EPS)
+            + WEIGHTS["mode_risk"] * self.mode_risk.get(mode_dsc, DEFAULT_MODE_RISK)
+        )
+        return min(max(score, 0.0), 100.0)
+
+    def score_batch(self, orders) -> np.ndarray:
+        """Scores for a small list of order dicts (``score_one`` keyword arguments)."""
+        return np.fromiter((self.score_one(**o) for o in orders), dtype=float, count=len(orders))
+
+    @staticmethod
+    def band(score: float) -> str:
+        for edge, name in zip(BAND_EDGES[1:], BANDS):
+            if score <= edge:
+                return name
+        return BANDS[-1]
+
+    # ---------- persistence ----------
+    def save(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(asdict(self), indent=2, sort_keys=True))
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "RiskModel":
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Missing {path}. Run scripts/03_build_control_tower_v2.py first.")
+        meta = json.loads(path.read_text())
+        meta["cost_range"] = tuple(meta["cost_range"])
+        meta["late_days_range"] = tuple(meta["late_days_range"])
+        return cls(**meta)
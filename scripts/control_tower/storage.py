@@ -0,0 +1,593 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from control_tower.metrics import file_bytes, step
+
+# Declared column types per table. Codes are dictionary-encoded (category),
+# dates are datetime64 and performance flags are real bools, so readers never
+# have to re-parse strings. Columns not listed pass through as written.
+CAT, DATE, BOOL, FLOAT, INT, STR = "category", "datetime", "bool", "float", "int", "str"
+
+# Row batch size for --chunked stages; bounds peak memory per stage.
+DEFAULT_BATCH_ROWS = 1_000_000
+
+# Tables stored as one directory per day, <name>/<YYYY-MM-DD>/part-NNNNN.parquet,
+# so a daily refresh rewrites only the days it touches. <name>/_manifest.json
+# keeps a content hash and row count per day for downstream change detection.
+PARTITIONED = {"fact_orders": "order_date", "fact_orders_enriched": "order_date"}
+UNDATED = "undated"
+
+_FACT = {
+    "order_id": FLOAT, "order_date": DATE,
+    "orig_port_cd": CAT, "dest_port_cd": CAT, "carrier": CAT,
+    "plant_code": CAT, "customer": CAT, "product_id": INT,
+    "unit_quantity": INT, "weight": FLOAT,
+    "tpt": INT, "svc_cd": CAT,
+    "ship_ahead_day_count": INT, "ship_late_day_count": INT,
+    "is_on_time": BOOL, "is_late": BOOL, "is_early": BOOL,
+    "mode_dsc": CAT, "carrier_type": CAT,
+    "minimum_cost": FLOAT, "rate": FLOAT, "freight_cost_est": FLOAT,
+    "daily_capacity": INT, "wh_cost_per_unit": FLOAT,
+}
+
+_LABELS = {
+    "carrier_name": CAT, "service_tier": CAT, "origin_port_name": CAT, "dest_port_name": CAT,
+    "plant_name": CAT, "product_family": CAT, "customer_segment": CAT, "lane_name": CAT,
+}
+
+# Context dimensions: int surrogate key, natural code, readable label
+_DIMENSION = {"key": INT, "code": STR, "name": STR}
+
+SCHEMAS: dict[str, dict[str, str]] = {
+    # ---------- data/processed (raw sheet column names) ----------
+    "OrderList": {
+        "Order_ID": FLOAT, "Order_Date": DATE, "Origin_Port": CAT, "Carrier": CAT,
+        "TPT": INT, "Service_Level": CAT, "Ship_ahead_day_count": INT, "Ship_Late_Day_count": INT,
+        "Customer": CAT, "Product_ID": INT, "Plant_Code": CAT, "Destination_Port": CAT,
+        "Unit_quantity": INT, "Weight": FLOAT,
+    },
+    "FreightRates": {
+        "Carrier": CAT, "orig_port_cd": CAT, "dest_port_cd": CAT,
+        "minm_wgh_qty": FLOAT, "max_wgh_qty": FLOAT, "svc_cd": CAT,
+        "minimum_cost": FLOAT, "rate": FLOAT, "mode_dsc": CAT, "tpt_day_cnt": INT, "Carrier_type": CAT,
+    },
+    "PlantPorts": {"Plant_Code": CAT, "Port": CAT},
+    "ProductsPerPlant": {"Plant_Code": CAT, "Product_ID": INT},
+    "VmiCustomers": {"Plant_Code": CAT, "Customers": CAT},
+    "WhCapacities": {"Plant_ID": CAT, "Daily_Capacity": INT},
+    "WhCosts": {"WH": CAT, "Cost/unit": FLOAT},
+
+    # ---------- data/context (dimension tables) ----------
+    **{name: _DIMENSION for name in ("carriers", "services", "ports", "plants", "products", "customers")},
+
+    # ---------- data/analytics ----------
+    "fact_orders": _FACT,
+    "fact_orders_enriched": {**_FACT, **_LABELS},
+    "kpi_daily": {"date": DATE, "orders": INT, "late_orders": INT},
+    "kpi_lane": {"orig_port_cd": CAT, "dest_port_cd": CAT, "orders": INT},
+    "kpi_carrier": {"carrier": CAT, "mode_dsc": CAT, "carrier_type": CAT, "orders": INT},
+    "kpi_plant": {"plant_code": CAT, "orders": INT},
+    "kpi_cube": {
+        "date": DATE, "carrier": CAT, "svc_cd": CAT, "mode_dsc": CAT, "plant_code": CAT,
+        "orig_port_cd": CAT, "dest_port_cd": CAT, "rows": INT, "orders": INT, "late_orders": INT, "late_n": INT,
+        "on_time": INT, "on_time_n": INT, "tpt_n": INT,
+    },
+    "kpi_sla": {"mode_dsc": CAT, "carrier": CAT, "lane": CAT, "orders": INT},
+    "kpi_margin_at_risk": {"mode_dsc": CAT, "lane": CAT, "carrier": CAT, "orders": INT},
+    "risk_shipments": {
+        "order_id": FLOAT, "order_date": DATE, "lane": CAT, "orig_port_cd": CAT, "dest_port_cd": CAT,
+        "carrier": CAT, "mode_dsc": CAT, "is_on_time": BOOL, "is_late": BOOL,
+        "ship_late_day_count": INT, "freight_cost_est": FLOAT, "risk_score": FLOAT, "risk_band": CAT,
+    },
+    "exceptions": {
+        "order_id": FLOAT, "order_date": DATE, "lane": CAT, "carrier": CAT, "mode_dsc": CAT,
+        "risk_band": CAT, "priority_score": FLOAT,
+    },
+    "rate_shop_orders": {
+        "order_id": FLOAT, "order_date": DATE, "orig_port_cd": CAT, "dest_port_cd": CAT,
+        "carrier": CAT, "svc_cd": CAT, "weight": FLOAT, "freight_cost_est": FLOAT, "tpt": INT, "options": INT,
+        "cheapest_carrier": CAT, "cheapest_svc_cd": CAT, "cheapest_mode_dsc": CAT,
+        "cheapest_cost": FLOAT, "cheapest_tpt": FLOAT,
+        "fastest_carrier": CAT, "fastest_svc_cd": CAT, "fastest_mode_dsc": CAT,
+        "fastest_cost": FLOAT, "fastest_tpt": FLOAT, "savings": FLOAT, "fastest_days_saved": FLOAT,
+    },
+    "kpi_rate_savings": {
+        "orig_port_cd": CAT, "dest_port_cd": CAT, "carrier": CAT, "orders": INT, "shopped_orders": INT,
+        "orders_with_savings": INT, "savings": FLOAT, "savings_pct": FLOAT,
+    },
+    "assignment_plan": {
+        "order_id": FLOAT, "order_date": DATE, "customer": CAT, "product_id": INT, "svc_cd": CAT,
+        "plant_code": CAT, "orig_port_cd": CAT, "carrier": CAT, "actual_cost": FLOAT,
+        "plan_plant_code": CAT, "plan_port": CAT, "plan_carrier": CAT, "plan_mode_dsc": CAT,
+        "plan_freight_cost": FLOAT, "plan_wh_cost": FLOAT, "plan_cost": FLOAT, "cost_delta": FLOAT, "status": CAT,
+    },
+    "assignment_summary": {
+        "plant_code": CAT, "daily_capacity": INT, "actual_orders": INT, "unassigned_orders": INT,
+        "actual_peak_day_orders": INT, "plan_orders": INT, "plan_peak_day_orders": INT,
+    },
+    "network_violations": {
+        "order_id": FLOAT, "order_date": DATE, "plant_code": CAT, "product_id": INT, "orig_port_cd": CAT,
+        "dest_port_cd": CAT, "customer": CAT, "carrier": CAT, "svc_cd": CAT, "freight_cost_est": FLOAT,
+        "violation_mask": INT, "violations": CAT,
+    },
+    "network_violation_summary": {
+        "plant_code": CAT, "orders": INT, "violating_orders": INT,
+        "product_not_stocked": INT, "port_not_linked": INT, "vmi_exclusive": INT, "violation_rate": FLOAT,
+    },
+    "plant_backlog_daily": {
+        "plant_code": CAT, "date": DATE, "orders": INT, "daily_capacity": FLOAT, "processed": FLOAT,
+        "backlog": FLOAT, "utilization": FLOAT, "is_spillover": BOOL,
+    },
+    "plant_backlog": {
+        "plant_code": CAT, "daily_capacity": FLOAT, "days": INT, "orders": INT, "overload_days": INT,
+        "spillover_days": INT, "longest_spillover_streak": INT, "peak_backlog": FLOAT, "end_backlog": FLOAT,
+    },
+    "port_congestion": {
+        "orig_port_cd": CAT, "dest_port_cd": CAT, "carrier": CAT, "orders": INT, "avg_delay_hours": FLOAT,
+        "delayed_orders": INT, "avg_late_day_shift": FLOAT, "on_time_rate": FLOAT, "sim_on_time_rate": FLOAT,
+        "on_time_impact_pp": FLOAT,
+    },
+    "port_congestion_ports": {
+        "port": CAT, "shipments": INT, "berths": INT, "handling_minutes": INT, "sim_berths": INT,
+        "sim_handling_minutes": INT, "avg_wait_hours": FLOAT, "sim_avg_wait_hours": FLOAT,
+        "queued": INT, "sim_queued": INT, "peak_queue": INT, "sim_peak_queue": INT,
+    },
+    "seasonality_monthly": {"month": STR, "orders": INT},
+    "inventory_risk": {"node": CAT, "orders": INT, "inventory_risk_band": CAT},
+    "scenarios": {"scenario": STR},
+    "rate_band_issues": {
+        "carrier": CAT, "orig_port_cd": CAT, "dest_port_cd": CAT, "svc_cd": CAT, "issue": CAT,
+    },
+}
+
+
+def _coerce(s: pd.Series, kind: str) -> pd.Series:
+    if kind == CAT:
+        return s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+    if kind == DATE:
+        return s if pd.api.types.is_datetime64_any_dtype(s) else pd.to_datetime(s, errors="coerce")
+    if kind == BOOL:
+        if pd.api.types.is_bool_dtype(s):
+            return s.astype(bool)
+        return s.astype(str).str.lower().isin(["true", "1", "yes"])
+    if kind in (FLOAT, INT):
+        s = pd.to_numeric(s, errors="coerce")
+        # Integers with gaps stay float rather than failing the cast
+        return s.astype("int64") if kind == INT and s.notna().all() else s.astype(float)
+    if kind == STR:
+        return s.astype(str).where(s.notna())
+    return s
+
+
+def apply_schema(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    schema = SCHEMAS.get(name, {})
+    df = df.copy()
+    for col in df.columns:
+        if col in schema:
+            df[col] = _coerce(df[col], schema[col])
+        elif df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+            # Parquet needs one type per column; raw sheets can mix ints and strings
+            df[col] = _coerce(df[col], STR)
+    return df
+
+
+def table_path(name: str, directory: Path, suffix: str = ".parquet") -> Path:
+    return Path(directory) / f"{name}{suffix}"
+
+
+def partition_dir(name: str, directory: Path) -> Path:
+    return Path(directory) / name
+
+
+def table_file(name: str, directory: Path) -> Path:
+    # What a read would use: the partition directory, the Parquet file, else the CSV export
+    root = partition_dir(name, directory)
+    if name in PARTITIONED and root.is_dir():
+        return root
+    path = table_path(name, directory)
+    return path if path.exists() else table_path(name, directory, ".csv")
+
+
+def table_exists(name: str, directory: Path) -> bool:
+    return table_file(name, directory).exists()
+
+
+def _arrow_schema(schema: pa.Schema, name: str) -> pa.Schema:
+    # Pin types that pandas would otherwise vary per batch: dictionary indices
+    # widen to int32, declared integer columns stay int64 (gaps become nulls)
+    # and all-null columns become strings.
+    declared = SCHEMAS.get(name, {})
+    fields = []
+    for f in schema:
+        t = f.type
+        if pa.types.is_dictionary(t):
+            value = pa.string() if pa.types.is_null(t.value_type) else t.value_type
+            t = pa.dictionary(pa.int32(), value)
+        elif pa.types.is_null(t):
+            t = pa.string()
+        elif declared.get(f.name) == INT and pa.types.is_floating(t):
+            t = pa.int64()
+        fields.append(f.with_type(t))
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _to_arrow(df: pd.DataFrame, name: str, schema: pa.Schema | None = None) -> pa.Table:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = schema or _arrow_schema(table.schema, name)
+    return table.select(schema.names).cast(schema)
+
+
+def partition_keys(dates: pd.Series) -> pd.Series:
+    return pd.to_datetime(dates).dt.strftime("%Y-%m-%d").fillna(UNDATED)
+
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    # Numerics hash as float so int/float storage of the same values agree
+    cols = {
+        c: s.astype(float) if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s) else s
+        for c, s in df.items()
+    }
+    return pd.util.hash_pandas_object(pd.DataFrame(cols), index=False).to_numpy()
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """Content hash of a frame's column names and rows (row order ignored)."""
+    return FrameHasher().update(df).hexdigest()
+
+
+class FrameHasher:
+    """frame_hash folded over row batches; equals frame_hash of their concatenation."""
+
+    def __init__(self):
+        self.columns: list | None = None
+        self.rows = 0
+        self._sum: str | None = None
+
+    def update(self, df: pd.DataFrame) -> "FrameHasher":
+        if self.columns is None:
+            self.columns = list(df.columns)
+        self._sum = _add_hash(self._sum, int(_row_hashes(df).sum(dtype=np.uint64)))
+        self.rows += len(df)
+        return self
+
+    def hexdigest(self) -> str:
+        rows = _add_hash(self._sum, 0)
+        return hashlib.sha256("\x1f".join(map(str, self.columns or [])).encode() + rows.encode()).hexdigest()[:16]
+
+
+def _add_hash(a: str | None, b: int) -> str:
+    # Day hashes are sums of row hashes mod 2**64: order-free and additive over parts
+    return f"{(int(a or '0', 16) + b) % (1 << 64):016x}"
+
+
+def _day_positions(df: pd.DataFrame, name: str) -> dict[str, np.ndarray]:
+    keys = partition_keys(df[PARTITIONED[name]]).to_numpy()
+    return pd.Series(np.arange(len(df))).groupby(keys, sort=True).indices
+
+
+def partition_hashes(df: pd.DataFrame, name: str) -> dict[str, str]:
+    """Per-day content hashes of ``df`` as write_partitions would record them."""
+    df = apply_schema(df, name).reset_index(drop=True)
+    hashes = _row_hashes(df)
+    return {day: _add_hash(None, int(hashes[pos].sum(dtype=np.uint64))) for day, pos in _day_positions(df, name).items()}
+
+
+def as_stored(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """``df`` as read_table returns it after write_table: declared types and,
+    for a partitioned table, rows grouped by day in partition order."""
+    df = apply_schema(df, name).reset_index(drop=True)
+    if name in PARTITIONED and len(df):
+        positions = _day_positions(df, name)
+        df = df.take(np.concatenate([positions[day] for day in sorted(positions)])).reset_index(drop=True)
+    return df
+
+
+def read_manifest(name: str, directory: Path) -> dict:
+    path = partition_dir(name, directory) / "_manifest.json"
+    return json.loads(path.read_text()) if path.exists() else {"days": {}}
+
+
+def write_manifest(name: str, directory: Path, manifest: dict) -> None:
+    path = partition_dir(name, directory) / "_manifest.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def changed_days(source: dict, consumed: dict) -> list[str]:
+    """Days whose source hash differs from the one a stage last consumed, or that are gone."""
+    return sorted(d for d in set(source) | set(consumed) if source.get(d) != consumed.get(d))
+
+
+def day_hashes(name: str, directory: Path) -> dict[str, str]:
+    return {day: meta["hash"] for day, meta in read_manifest(name, directory)["days"].items()}
+
+
+def write_partitions(
+    df: pd.DataFrame,
+    name: str,
+    directory: Path,
+    mode: str = "overwrite",
+    part: int = 0,
+    export_csv: bool = False,
+) -> Path:
+    """Write ``df`` as one file per day under ``<directory>/<name>/``.
+
+    ``mode`` is "overwrite" (replace the table), "replace" (replace only the
+    days present in ``df``) or "append" (add part ``part`` to each day).
+    ``export_csv`` rewrites ``<name>.csv`` from the whole table afterwards.
+    """
+    with step(f"write {name}", rows_in=len(df)) as metrics:
+        root = partition_dir(name, directory)
+        if mode == "overwrite" and root.exists():
+            shutil.rmtree(root)
+        root.mkdir(parents=True, exist_ok=True)
+        # A partitioned write supersedes any single-file copy of the table
+        table_path(name, directory).unlink(missing_ok=True)
+
+        manifest = read_manifest(name, directory)
+        df = apply_schema(df, name).reset_index(drop=True)
+        hashes = _row_hashes(df)
+        for day, pos in _day_positions(df, name).items():
+            day_dir = root / day
+            if mode == "replace" and day_dir.exists():
+                shutil.rmtree(day_dir)
+            day_dir.mkdir(exist_ok=True)
+
+            rows = df.iloc[pos]
+            out = day_dir / f"part-{part:05d}.parquet"
+            pq.write_table(_to_arrow(rows, name), out)
+            metrics.bytes_written += file_bytes(out)
+
+            prev = manifest["days"].get(day, {}) if mode == "append" else {}
+            manifest["days"][day] = {
+                "hash": _add_hash(prev.get("hash"), int(hashes[pos].sum(dtype=np.uint64))),
+                "rows": prev.get("rows", 0) + len(pos),
+            }
+        write_manifest(name, directory, manifest)
+    if export_csv:
+        export_partitions_csv(name, directory)
+    return root
+
+
+def export_partitions_csv(name: str, directory: Path) -> Path:
+    """Rewrite ``<name>.csv`` from every partition, in day order.
+
+    The CSV copy of a partitioned table is one file, so readers without the
+    partition directory (the CSV fallback) see the same table.
+    """
+    with step(f"export {name} csv") as metrics:
+        csv = table_path(name, directory, ".csv")
+        tmp = csv.with_suffix(".csv.tmp")
+        header = True
+        for path in _partition_files(name, directory):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=DEFAULT_BATCH_ROWS):
+                batch.to_pandas().to_csv(tmp, mode="w" if header else "a", header=header, index=False)
+                header = False
+        if header:
+            # No rows: just the table's columns
+            pd.DataFrame(columns=_read_partitions(name, directory).columns).to_csv(tmp, index=False)
+        tmp.replace(csv)
+        metrics.bytes_written = file_bytes(csv)
+    return csv
+
+
+def drop_partitions(name: str, directory: Path, days) -> None:
+    root = partition_dir(name, directory)
+    manifest = read_manifest(name, directory)
+    for day in days:
+        shutil.rmtree(root / day, ignore_errors=True)
+        manifest["days"].pop(day, None)
+    write_manifest(name, directory, manifest)
+
+
+def _partition_files(name: str, directory: Path, days=None, start=None, end=None) -> list[Path]:
+    # Day directories are pruned by name before any file is opened
+    lo = None if start is None else pd.Timestamp(start).strftime("%Y-%m-%d")
+    hi = None if end is None else pd.Timestamp(end).strftime("%Y-%m-%d")
+    files = []
+    for day_dir in sorted(p for p in partition_dir(name, directory).iterdir() if p.is_dir()):
+        day = day_dir.name
+        if days is not None and day not in days:
+            continue
+        if (lo or hi) and (day == UNDATED or (lo and day < lo) or (hi and day > hi)):
+            continue
+        files.extend(sorted(day_dir.glob("*.parquet")))
+    return files
+
+
+def _read_partitions(name: str, directory: Path, columns=None, days=None, start=None, end=None) -> pd.DataFrame:
+    files = _partition_files(name, directory, days=days, start=start, end=end)
+    if files:
+        return pq.read_table(files, columns=columns).to_pandas()
+    # Nothing selected: an empty frame that still carries the table's columns and types
+    any_file = next(partition_dir(name, directory).glob("*/*.parquet"), None)
+    if any_file is None:
+        return pd.DataFrame(columns=columns or list(SCHEMAS.get(name, {})))
+    schema = pq.read_schema(any_file)
+    return schema.empty_table().select(columns or schema.names).to_pandas()
+
+
+def write_table(df: pd.DataFrame, name: str, directory: Path, export_csv: bool = False) -> Path:
+    if name in PARTITIONED:
+        return write_partitions(df, name, directory, export_csv=export_csv)
+
+    with step(f"write {name}", rows_in=len(df)) as metrics:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        df = apply_schema(df, name)
+
+        out = table_path(name, directory)
+        df.to_parquet(out, engine="pyarrow", index=False)
+        csv = table_path(name, directory, ".csv") if export_csv else None
+        if csv is not None:
+            df.to_csv(csv, index=False)
+        metrics.bytes_written = file_bytes(out, csv)
+    return out
+
+
+def read_table(
+    name: str,
+    directory: Path,
+    columns: list[str] | None = None,
+    start=None,
+    end=None,
+    date_col: str = "order_date",
+    days: list[str] | None = None,
+) -> pd.DataFrame:
+    """Load a table, Parquet first; ``start``/``end`` are inclusive day bounds on ``date_col``.
+
+    ``days`` selects partitions (``YYYY-MM-DD`` or ``undated``) of a partitioned table.
+    """
+    with step(f"read {name}") as metrics:
+        df = _read_table(name, directory, columns, start, end, date_col, days)
+        metrics.rows_out = len(df)
+    return df
+
+
+def _read_table(name: str, directory: Path, columns, start, end, date_col: str, days) -> pd.DataFrame:
+    if name in PARTITIONED and partition_dir(name, directory).is_dir():
+        return _read_partitions(name, directory, columns=columns, days=days, start=start, end=end)
+
+    path = table_path(name, directory)
+    if path.exists():
+        # Projection and the date predicate are pushed down into the Parquet scan
+        filters = []
+        if start is not None:
+            filters.append((date_col, ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append((date_col, "<", pd.Timestamp(end) + pd.Timedelta(days=1)))
+        return pd.read_parquet(path, engine="pyarrow", columns=columns, filters=filters or None)
+
+    # CSV fallback for trees built before the Parquet layer
+    csv = table_path(name, directory, ".csv")
+    if not csv.exists():
+        raise FileNotFoundError(f"Missing {path} (or {csv.name}).")
+    df = pd.read_csv(csv, usecols=(lambda c: c in columns) if columns else None)
+    df = apply_schema(df, name)
+    if columns:
+        df = df[[c for c in columns if c in df.columns]]
+    if start is not None:
+        df = df[df[date_col] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df[date_col] < pd.Timestamp(end) + pd.Timedelta(days=1)]
+    return df.reset_index(drop=True)
+
+
+def iter_table(
+    name: str,
+    directory: Path,
+    columns: list[str] | None = None,
+    batch_size: int = DEFAULT_BATCH_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """Yield a table in row batches of at most ``batch_size`` rows, Parquet first."""
+    if name in PARTITIONED and partition_dir(name, directory).is_dir():
+        files = _partition_files(name, directory)
+    else:
+        files = [table_path(name, directory)] if table_path(name, directory).exists() else []
+    if files:
+        for path in files:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+                yield batch.to_pandas()
+        return
+
+    csv = table_path(name, directory, ".csv")
+    if not csv.exists():
+        raise FileNotFoundError(f"Missing {table_path(name, directory)} (or {csv.name}).")
+    usecols = (lambda c: c in columns) if columns else None
+    for chunk in pd.read_csv(csv, usecols=usecols, chunksize=batch_size):
+        yield apply_schema(chunk, name).reset_index(drop=True)
+
+
+class TableWriter:
+    """Append row batches to one table, as write_table would write the concatenation.
+
+    The Arrow schema is fixed by the first batch (see _arrow_schema), so later
+    batches with other categories or missing values still fit. Partitioned
+    tables get one part file per batch in each day they touch.
+    """
+
+    def __init__(self, name: str, directory: Path, export_csv: bool = False):
+        self.name = name
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.export_csv = export_csv
+        self.partitioned = name in PARTITIONED
+        self.path = partition_dir(name, self.directory) if self.partitioned else table_path(name, self.directory)
+        self.csv_path = table_path(name, self.directory, ".csv") if export_csv and not self.partitioned else None
+        self.rows = 0
+        self.batches = 0
+        # Write next to the target and swap in on close, so readers never see half a table:
+        # a .tmp file, or for a partitioned table a staging directory holding its own copy
+        self._tmp = self.path.with_suffix(".parquet.tmp")
+        self._staging = self.directory / f"{name}.tmp"
+        self._schema: pa.Schema | None = None
+        self._writer: pq.ParquetWriter | None = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.partitioned:
+            write_partitions(df, self.name, self._staging, mode="append" if self.batches else "overwrite",
+                             part=self.batches)
+        else:
+            with step(f"write {self.name}", rows_in=len(df)) as metrics:
+                # Row groups go straight to the file; only the footer is left for close()
+                before = file_bytes(self._tmp, self.csv_path) if self.rows else 0
+                df = apply_schema(df, self.name)
+                table = _to_arrow(df, self.name, self._schema)
+                if self._writer is None:
+                    self._schema = table.schema
+                    self._writer = pq.ParquetWriter(self._tmp, self._schema)
+                self._writer.write_table(table)
+
+                if self.csv_path is not None:
+                    df.to_csv(self.csv_path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+                metrics.bytes_written = file_bytes(self._tmp, self.csv_path) - before
+        self.rows += len(df)
+        self.batches += 1
+
+    def close(self) -> Path:
+        if self.partitioned:
+            if not self.batches:
+                write_partitions(pd.DataFrame(columns=list(SCHEMAS.get(self.name, {}))), self.name, self._staging)
+            old = self.directory / f"{self.name}.old"
+            shutil.rmtree(old, ignore_errors=True)
+            if self.path.exists():
+                self.path.replace(old)
+            partition_dir(self.name, self._staging).replace(self.path)
+            shutil.rmtree(old, ignore_errors=True)
+            shutil.rmtree(self._staging, ignore_errors=True)
+            # As in write_partitions, the partitions supersede any single-file copy
+            table_path(self.name, self.directory).unlink(missing_ok=True)
+            if self.export_csv:
+                # One CSV for the whole table, written once the last part is in
+                export_partitions_csv(self.name, self.directory)
+            return self.path
+        if self._writer is None:
+            # No batches at all: still leave an (empty) table behind
+            self.write(pd.DataFrame(columns=list(SCHEMAS.get(self.name, {}))))
+        self._writer.close()
+        self._tmp.replace(self.path)
+        return self.path
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        elif self.partitioned:
+            shutil.rmtree(self._staging, ignore_errors=True)
+        elif self._writer is not None:
+            self._writer.close()
+            self._tmp.unlink(missing_ok=True)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from control_tower.ingest import SOURCE_COL
+from control_tower.metrics import step
+
+# An order's routing, customer and product are drawn together, as one of the
+# combinations seen in the sample, so every synthetic order has a rate card
+# lane and passes the same network rules as the orders it was fitted on
+ROUTE_COLS = [
+    "Plant_Code", "Origin_Port", "Carrier", "Service_Level", "TPT", "Destination_Port", "Customer", "Product_ID",
+]
+ORDER_COLS = [
+    "Order_ID", "Order_Date", "Origin_Port", "Carrier", "TPT", "Service_Level", "Ship_ahead_day_count",
+    "Ship_Late_Day_count", "Customer", "Product_ID", "Plant_Code", "Destination_Port", "Unit_quantity", "Weight",
+]
+# Spread of the multiplicative noise on bootstrapped quantity/weight pairs
+SIZE_JITTER = 0.1
+# Gamma shape of the daily volume weights: 1/sqrt(shape) is the day-to-day
+# coefficient of variation (the sample covers a single day, so it is a knob)
+DAY_SHAPE = 25.0
+
+
+@dataclass
+class OrderProfile:
+    """Empirical distributions of an OrderList sample.
+
+    Routes are sampled by frequency; (Unit_quantity, Weight) pairs are
+    bootstrapped within the order's carrier, so weight bands stay as in the
+    sample; schedule offsets are bootstrapped separately for late and
+    not-late orders so the late rate can be set freely.
+    """
+
+    routes: pd.DataFrame      # distinct ROUTE_COLS combinations
+    route_p: np.ndarray       # their frequencies
+    size_start: np.ndarray    # per route: first row of its carrier's sizes
+    size_count: np.ndarray    # per route: number of sizes of its carrier
+    units: np.ndarray         # sample sizes grouped by carrier
+    weight: np.ndarray
+    late_days: np.ndarray     # Ship_Late_Day_count of late sample orders
+    ahead_days: np.ndarray    # Ship_ahead_day_count of the others
+    late_rate: float
+    first_id: float
+    first_day: pd.Timestamp
+
+    @classmethod
+    def fit(cls, orders: pd.DataFrame) -> "OrderProfile":
+        orders = orders.dropna(subset=["Plant_Code", "Carrier"])
+        if orders.empty:
+            raise ValueError("OrderList sample has no orders with a plant and carrier to fit on")
+        routes = orders.groupby(ROUTE_COLS, observed=True, dropna=False).size().rename("n").reset_index()
+
+        carrier = orders["Carrier"].astype(str).to_numpy()
+        order = np.argsort(carrier, kind="stable")
+        carriers, start, count = np.unique(carrier[order], return_index=True, return_counts=True)
+        pos = np.searchsorted(carriers, routes["Carrier"].astype(str).to_numpy())
+
+        late = orders["Ship_Late_Day_count"].fillna(0).to_numpy(dtype=np.int64)
+        ahead = orders["Ship_ahead_day_count"].fillna(0).to_numpy(dtype=np.int64)
+        is_late = late > 0
+        return cls(
+            routes=routes[ROUTE_COLS],
+            route_p=(routes["n"] / routes["n"].sum()).to_numpy(),
+            size_start=start[pos],
+            size_count=count[pos],
+            units=orders["Unit_quantity"].fillna(1).to_numpy(dtype=np.int64)[order],
+            weight=orders["Weight"].fillna(0).to_numpy(dtype=float)[order],
+            late_days=late[is_late] if is_late.any() else np.ones(1, dtype=np.int64),
+            ahead_days=ahead[~is_late] if (~is_late).any() else np.zeros(1, dtype=np.int64),
+            late_rate=float(is_late.mean()),
+            first_id=float(orders["Order_ID"].max()) + 1,
+            first_day=pd.Timestamp(orders["Order_Date"].min()).normalize(),
+        )
+
+    def sample(self, rng: np.random.Generator, n: int, late_rate: float | None = None) -> pd.DataFrame:
+        """``n`` orders without ids or dates."""
+        route = rng.choice(len(self.routes), size=n, p=self.route_p)
+        df = self.routes.iloc[route].reset_index(drop=True)
+
+        size = self.size_start[route] + (rng.random(n) * self.size_count[route]).astype(np.int64)
+        jitter = np.exp(rng.normal(0.0, SIZE_JITTER, n))
+        df["Unit_quantity"] = np.maximum(np.rint(self.units[size] * jitter), 1).astype(np.int64)
+        df["Weight"] = np.round(self.weight[size] * jitter, 2)
+
+        late = rng.random(n) < (self.late_rate if late_rate is None else late_rate)
+        df["Ship_Late_Day_count"] = np.where(late, rng.choice(self.late_days, n), 0)
+        df["Ship_ahead_day_count"] = np.where(late, 0, rng.choice(self.ahead_days, n))
+        return df
+
+
+def day_bounds(rng: np.random.Generator, orders: int, days: int) -> np.ndarray:
+    """End row (exclusive) of each day when ``orders`` rows are spread over ``days``."""
+    weights = rng.gamma(DAY_SHAPE, 1 / DAY_SHAPE, days)
+    bounds = np.rint(np.cumsum(weights) / weights.sum() * orders).astype(np.int64)
+    bounds[-1] = orders
+    return bounds
+
+
+def generate_orders(
+    profile: OrderProfile,
+    orders: int,
+    days: int,
+    seed: int,
+    late_rate: float | None = None,
+    start: pd.Timestamp | None = None,
+    batch_size: int = 1_000_000,
+    source: str = "synthetic",
+) -> Iterator[pd.DataFrame]:
+    """Yield an OrderList of ``orders`` rows over ``days`` days in row batches.
+
+    Rows are in date order with increasing order ids. Batch ``i`` draws from
+    its own generator seeded with (seed, i), so a seed and batch size always
+    give the same data and batches never depend on each other.
+    """
+    start = profile.first_day if start is None else pd.Timestamp(start).normalize()
+    bounds = day_bounds(np.random.default_rng([seed]), orders, days)
+    for i, lo in enumerate(range(0, orders, batch_size)):
+        rows = np.arange(lo, min(lo + batch_size, orders), dtype=np.int64)
+        with step("generate orders", rows_in=len(rows)) as metrics:
+            df = profile.sample(np.random.default_rng([seed, i]), len(rows), late_rate)
+            df["Order_ID"] = profile.first_id + rows
+            df["Order_Date"] = start + pd.to_timedelta(np.searchsorted(bounds, rows, side="right"), unit="D")
+            df[SOURCE_COL] = source
+            df = df[ORDER_COLS + [SOURCE_COL]]
+            metrics.rows_out = len(df)
+        yield df
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from control_tower.ingest import SOURCE_COL, read_manifest, table_record, write_manifest
+from control_tower.metrics import instrument
+from control_tower.storage import (
+    DEFAULT_BATCH_ROWS, FrameHasher, TableWriter, apply_schema, iter_table, read_table, write_table,
+)
+from control_tower.synthetic import OrderProfile, generate_orders
+
+ROOT = Path(__file__).resolve().parents[1]
+PROCESSED_DIR = ROOT / "data" / "processed"
+
+SYNTHETIC = "synthetic"
+REFERENCE = ["FreightRates", "WhCapacities", "WhCosts", "PlantPorts", "ProductsPerPlant", "VmiCustomers"]
+
+def _fit(source: Path, batch_size: int) -> OrderProfile:
+    # One batch is plenty to fit on and keeps memory bounded whatever the source size
+    sample = next(iter_table("OrderList", source, batch_size=batch_size), None)
+    if sample is None or sample.empty:
+        raise FileNotFoundError(f"Missing OrderList in {source}. Run scripts/01_ingest_dataset.py first.")
+    # Refitting on generated orders would drift from the sample with every run
+    # (the sample's CSV in the repository predates the source column)
+    if SOURCE_COL in sample and sample[SOURCE_COL].astype(str).str.startswith(SYNTHETIC).any():
+        raise ValueError(
+            f"OrderList in {source} is synthetic. Delete {source / 'OrderList.parquet'} to go back to the "
+            "sample's CSV (or run scripts/01_ingest_dataset.py with the workbook), or pass --source with a "
+            "directory holding it."
+        )
+    return OrderProfile.fit(sample)
+
+def main(
+    out: Path,
+    orders: int = 1_000_000,
+    days: int = 90,
+    seed: int = 42,
+    late_rate: float | None = None,
+    start: str | None = None,
+    source: Path = PROCESSED_DIR,
+    batch_size: int = DEFAULT_BATCH_ROWS,
+) -> None:
+    source, out = Path(source), Path(out)
+    started = time.perf_counter()
+    profile = _fit(source, batch_size)
+    label = f"{SYNTHETIC} seed={seed}"
+
+    # Sources recorded in the ingest manifest differ from any workbook's, so
+    # the next 01_ingest_dataset.py run writes the workbook tables back
+    manifest = read_manifest(out)
+    if out.resolve() != source.resolve():
+        for name in REFERENCE:
+            table = read_table(name, source)
+            write_table(table, name, out)
+            hasher = FrameHasher().update(apply_schema(table, name))
+            manifest["tables"][name] = table_record(hasher, sources=[label], sheet_hashes=[], changed=True)
+
+    hasher = FrameHasher()
+    late = 0
+    with TableWriter("OrderList", out) as writer:
+        batches = generate_orders(profile, orders, days, seed, late_rate=late_rate, start=start,
+                                  batch_size=batch_size, source=label)
+        for df in batches:
+            writer.write(df)
+            hasher.update(apply_schema(df, "OrderList"))
+            late += int((df["Ship_Late_Day_count"] > 0).sum())
+    manifest["tables"]["OrderList"] = table_record(hasher, sources=[label], sheet_hashes=[], changed=True)
+    write_manifest(out, manifest)
+
+    seconds = time.perf_counter() - started
+    print(f"Generated {writer.rows:,} orders over {days} day(s) in {seconds:.1f}s "
+          f"({writer.rows / max(seconds, 1e-9):,.0f} rows/s); late rate {late / max(writer.rows, 1):.2%}")
+    print(f"Fitted on {len(profile.routes):,} route(s) from {source / 'OrderList'}")
+    print(f"Wrote: {writer.path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic OrderList fitted on the processed sample")
+    parser.add_argument("--orders", type=int, default=1_000_000, help="Orders to generate")
+    parser.add_argument("--days", type=int, default=90, help="Order days the orders are spread over")
+    parser.add_argument("--seed", type=int, default=42, help="Seed; the same seed and batch size give the same data")
+    parser.add_argument("--late-rate", type=float, default=None, help="Share of late orders (default: the sample's)")
+    parser.add_argument("--start", default=None, help="First order day, YYYY-MM-DD (default: the sample's)")
+    parser.add_argument("--source", type=Path, default=PROCESSED_DIR, help="Processed tables to fit on")
+    # No default: writing into data/processed replaces the sample, which should be asked for
+    parser.add_argument("--out", type=Path, required=True,
+                        help="Directory the generated tables are written to (data/processed to rebuild on them)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_ROWS, help="Rows generated and written per batch")
+    args = parser.parse_args()
+    with instrument("synthetic"):
+        main(
+            orders=args.orders, days=args.days, seed=args.seed, late_rate=args.late_rate, start=args.start,
+            source=args.source, out=args.out, batch_size=args.batch_size,
+        )
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import argparse
+import sys
+
+from control_tower.pipeline import STAGES, run, run_in_memory
+
+def main(
+    only: list[str] | None = None,
+    force: bool = False,
+    jobs: int = 4,
+    export_csv: bool = False,
+    chunked: bool = False,
+    dry_run: bool = False,
+    in_memory: bool = False,
+) -> int:
+    if in_memory:
+        status = run_in_memory(export_csv=export_csv)
+    else:
+        status = run(only=only, force=force, jobs=jobs, export_csv=export_csv, chunked=chunked, dry_run=dry_run)
+    counts = {}
+    for value in status.values():
+        counts[value] = counts.get(value, 0) + 1
+    print("Pipeline:", ", ".join(f"{n} {value}" for value, n in counts.items()))
+    return 1 if any(value in ("failed", "blocked") for value in status.values()) else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline stages, skipping those whose inputs are unchanged")
+    parser.add_argument("--only", nargs="+", choices=[s.name for s in STAGES], help="Run just these stages")
+    parser.add_argument("--force", action="store_true", help="Run stages even when their inputs are unchanged")
+    parser.add_argument("--jobs", type=int, default=4, help="Stages run in parallel")
+    parser.add_argument("--csv", action="store_true", help="Pass --csv to the stages that accept it")
+    parser.add_argument("--chunked", action="store_true", help="Pass --chunked to the stages that accept it")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Run every stage in one process, passing frames between stages and writing only at the end")
+    args = parser.parse_args()
+    if args.in_memory and (args.only or args.chunked or args.dry_run):
+        parser.error("--in-memory runs the whole pipeline at once; it cannot be combined with --only, --chunked or --dry-run")
+    sys.exit(main(
+        only=args.only, force=args.force, jobs=args.jobs,
+        export_csv=args.csv, chunked=args.chunked, dry_run=args.dry_run, in_memory=args.in_memory,
+    ))
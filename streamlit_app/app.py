@@ -1,11 +1,25 @@
 # streamlit_app/app.py
 from __future__ import annotations
 
+import sys
 from pathlib import Path
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 
+# Pipeline helpers live under scripts/ (shared storage layer)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from control_tower.congestion import CongestionSpec, congestion_impact, simulate_congestion  # noqa: E402
+from control_tower.bitmaps import FilterIndex  # noqa: E402
+from control_tower.context import LABELS, LANE_LABEL, load_dimensions, resolve_labels  # noqa: E402
+from control_tower.dashboard import (  # noqa: E402
+    by_carrier, by_lane, cube_by_carrier, cube_by_lane, cube_kpis, filter_cube, summary_kpis, triage_queue,
+)
+from control_tower.feasibility import VIOLATION_LABELS, VIOLATIONS  # noqa: E402
+from control_tower.risk import RiskModel  # noqa: E402
+from control_tower.storage import read_table, table_exists, table_file  # noqa: E402
+from control_tower.topk import top_k  # noqa: E402
+
 # Plotly template is set dynamically after the theme toggle
 
 
@@ -321,16 +335,35 @@ div[data-testid="stAlert"] * {{
 BASE = Path(__file__).resolve().parents[1]
 DATA_DIR = BASE / "data"
 ANALYTICS_DIR = DATA_DIR / "analytics"
-
-FACT_RAW = ANALYTICS_DIR / "fact_orders.csv"
-FACT_ENRICHED = ANALYTICS_DIR / "fact_orders_enriched.csv"
-FACT = FACT_ENRICHED if FACT_ENRICHED.exists() else FACT_RAW
+CONTEXT_DIR = DATA_DIR / "context"
+RISK_MODEL = ANALYTICS_DIR / "risk_model.json"
+
+# Tables are read through the storage layer (Parquet, CSV fallback).
+# Only the coded fact is loaded; readable labels are resolved from the
+# context dimensions for the rows and aggregates actually displayed.
+FACT = "fact_orders"
+# Fact columns with a bitmap per value: the sidebar filters, the ports and the late flag
+INDEX_COLS = ["carrier", "svc_cd", "mode_dsc", "plant_code", "orig_port_cd", "dest_port_cd", "is_late"]
+# Pre-aggregated measures behind the KPI tiles, alerts and driver charts
+CUBE = "kpi_cube"
 
 # Optional v2 analytics tables (if you generated them)
-RISK_SHIPMENTS = ANALYTICS_DIR / "risk_shipments.csv"
-EXCEPTIONS = ANALYTICS_DIR / "exceptions.csv"
-SEASONALITY = ANALYTICS_DIR / "seasonality_monthly.csv"
-SCENARIOS = ANALYTICS_DIR / "scenarios.csv"
+RISK_SHIPMENTS = "risk_shipments"
+EXCEPTIONS = "exceptions"
+SEASONALITY = "seasonality_monthly"
+SCENARIOS = "scenarios"
+RATE_SAVINGS = "kpi_rate_savings"
+NETWORK_VIOLATIONS = "network_violations"
+
+# Exception types of the exceptions queue: the pipeline's risk priority list,
+# or orders breaking a network rule (bit of their violation mask; any = all bits)
+RISK_PRIORITY = "Risk priority"
+ANY_VIOLATION = "Any network violation"
+VIOLATION_BITS = {ANY_VIOLATION: sum(VIOLATIONS.values())}
+VIOLATION_BITS.update({VIOLATION_LABELS[name]: bit for name, bit in VIOLATIONS.items()})
+
+# Default size of the triage / risk / exceptions queues (top-K, no full sort)
+QUEUE_ROWS = 100
 
 
 # =========================
@@ -364,14 +397,11 @@ def fmt_pct(x) -> str:
         return "—"
 
 
-def to_date_range(df: pd.DataFrame) -> str:
-    if df.empty or "order_date" not in df.columns:
+def to_date_range(dates: pd.Series) -> str:
+    dates = dates.dropna()
+    if dates.empty:
         return "—"
-    return f"{df['order_date'].min().date()} to {df['order_date'].max().date()}"
-
-
-def col_if_exists(df: pd.DataFrame, preferred: str, fallback: str) -> str:
-    return preferred if preferred in df.columns else fallback
+    return f"{dates.min().date()} to {dates.max().date()}"
 
 
 def pill(label: str, status: str) -> str:
@@ -392,28 +422,76 @@ def kpi_card(title: str, value: str, sub: str = "") -> None:
     )
 
 
+@st.cache_resource(show_spinner=False)
+def load_fact(name: str) -> pd.DataFrame:
+    # Dates, flags and codes arrive typed from the declared schema. Shared
+    # across reruns without a copy: the app only reads it, by row position.
+    return read_table(name, ANALYTICS_DIR)
+
+
+@st.cache_resource(show_spinner=False)
+def load_index(name: str) -> FilterIndex:
+    # Built once per loaded fact; the sidebar filters only combine its bitmaps
+    return FilterIndex(load_fact(name), INDEX_COLS, "order_date")
+
+
 @st.cache_data(show_spinner=False)
-def load_fact(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path, parse_dates=["order_date"])
-    for bcol in ["is_on_time", "is_late", "is_early"]:
-        if bcol in df.columns and df[bcol].dtype == object:
-            df[bcol] = df[bcol].astype(str).str.lower().isin(["true", "1", "yes"])
-    return df
+def load_table(name: str, start=None, end=None) -> pd.DataFrame:
+    return read_table(name, ANALYTICS_DIR, start=start, end=end)
+
+
+@st.cache_data(show_spinner=False)
+def load_context():
+    # Small integer-keyed dimension tables; None when no mappings were generated
+    try:
+        return load_dimensions(CONTEXT_DIR)
+    except FileNotFoundError:
+        return None
 
 
 @st.cache_data(show_spinner=False)
-def load_csv(path: Path, parse_dates: list[str] | None = None) -> pd.DataFrame:
-    return pd.read_csv(path, parse_dates=parse_dates) if parse_dates else pd.read_csv(path)
+def load_risk_model():
+    # Fitted by 03_build_control_tower_v2.py; None falls back to delay × cost
+    try:
+        return RiskModel.load(RISK_MODEL)
+    except FileNotFoundError:
+        return None
+
+
+def label_of(col: str) -> str:
+    # Display column for a code column: its label when context mapping is active
+    return LABELS[col][1] if DIMS is not None and col in LABELS else col
+
+
+def with_labels(df: pd.DataFrame, columns: list[str] | None = None) -> pd.DataFrame:
+    # Resolve labels for just these (already filtered / aggregated / top-K) rows
+    return df if DIMS is None else resolve_labels(df, DIMS, columns)
+
+
+def lane_column(df: pd.DataFrame) -> pd.Series:
+    if DIMS is not None:
+        return with_labels(df, [LANE_LABEL])[LANE_LABEL].astype(str)
+    return df["orig_port_cd"].astype(str) + " → " + df["dest_port_cd"].astype(str)
+
+
+def code_options(codes: list, col: str) -> tuple[list, callable]:
+    # Filter options stay codes (bitmap lookups); only the option list is labelled
+    if DIMS is None or col not in LABELS:
+        return sorted(codes), str
+    labels = DIMS[LABELS[col][0]].labels(pd.Series(codes))
+    names = {c: str(c) if pd.isna(label) else label for c, label in zip(codes, labels)}
+    return sorted(codes, key=lambda c: (names[c], str(c))), lambda c: names.get(c, str(c))
 
 
 def require_fact() -> None:
-    if not FACT.exists():
+    if not table_exists(FACT, ANALYTICS_DIR):
         st.error(
             "Missing analytics files.\n\n"
-            "Run these in order:\n"
-            "1) python scripts/02_prepare_data.py\n"
-            "2) python scripts/02b_generate_context_mappings.py\n"
-            "3) python scripts/02c_apply_context_mappings.py\n\n"
+            "Run the pipeline:\n"
+            "python scripts/run_pipeline.py\n\n"
+            "(or the stages the dashboard reads, in order: 02_prepare_data.py, 02b_generate_context_mappings.py, "
+            "02d_rate_shopping.py, 02f_check_network.py and 03_build_control_tower_v2.py, "
+            "after 01_ingest_dataset.py if data/processed is empty)\n\n"
             "Then refresh this page."
         )
         st.stop()
@@ -440,6 +518,11 @@ st.caption("Daily Ops Snapshot (single-day dataset): exceptions, hotspots, and c
 
 require_fact()
 fact = load_fact(FACT)
+INDEX = load_index(FACT)
+DIMS = load_context()
+RISK = load_risk_model()
+# Older analytics builds have no cube; the tiles then aggregate the fact
+KPI_CUBE = load_table(CUBE) if table_exists(CUBE, ANALYTICS_DIR) else None
 
 # Single-day detector
 is_single_day = False
@@ -465,9 +548,9 @@ with st.expander("Definitions, assumptions, and limitations", expanded=False):
 
 **Mapping layer (readability for interviews)**
 The public dataset uses coded identifiers. To make the dashboard readable, the pipeline can generate
-`fact_orders_enriched.csv` with readable fields:
+context dimension tables in `data/context/` that give readable fields:
 `carrier_name`, `service_tier`, `origin_port_name`, `dest_port_name`, `plant_name`, `product_family`, `customer_segment`, `lane_name`.
-The app automatically uses these fields if the enriched file exists.
+The app resolves these labels on demand (chart axes, queues, filter options) when the context tables exist.
 """
     )
 
@@ -494,31 +577,40 @@ else:
     date_range = st.sidebar.date_input("Order date range", (min_date, max_date))
     start, end = (date_range if isinstance(date_range, tuple) and len(date_range) == 2 else (min_date, max_date))
 
-f = fact[(fact["order_date"].dt.date >= start) & (fact["order_date"].dt.date <= end)].copy()
+# Each filter ANDs into one row bitmap over the fact; no frame is built or copied
+in_view = INDEX.dates(start, end)
 
-carrier_col = col_if_exists(f, "carrier_name", "carrier")
-service_col = col_if_exists(f, "service_tier", "svc_cd")
-plant_col = col_if_exists(f, "plant_name", "plant_code")
-mode_col = "mode_dsc" if "mode_dsc" in f.columns else None
-cust_col = col_if_exists(f, "customer_segment", "customer")
-prod_col = col_if_exists(f, "product_family", "product_id")
+# Filters and groupings run on the codes; labels are display-only
+carrier_col = "carrier"
+service_col = "svc_cd"
+plant_col = "plant_code"
+mode_col = "mode_dsc" if "mode_dsc" in fact.columns else None
+cust_col = "customer"
+prod_col = "product_id"
 
-carrier_sel = st.sidebar.multiselect("Carrier", sorted(f[carrier_col].dropna().unique().tolist()))
-if carrier_sel:
-    f = f[f[carrier_col].isin(carrier_sel)]
+options, label = code_options(INDEX.options(carrier_col, in_view), carrier_col)
+carrier_sel = st.sidebar.multiselect("Carrier", options, format_func=label)
+in_view = INDEX.narrow(in_view, carrier_col, carrier_sel)
 
-service_sel = st.sidebar.multiselect("Service", sorted(f[service_col].dropna().unique().tolist()))
-if service_sel:
-    f = f[f[service_col].isin(service_sel)]
+options, label = code_options(INDEX.options(service_col, in_view), service_col)
+service_sel = st.sidebar.multiselect("Service", options, format_func=label)
+in_view = INDEX.narrow(in_view, service_col, service_sel)
 
 if mode_col:
-    mode_sel = st.sidebar.multiselect("Mode", sorted(f[mode_col].dropna().unique().tolist()))
-    if mode_sel:
-        f = f[f[mode_col].isin(mode_sel)]
+    mode_sel = st.sidebar.multiselect("Mode", sorted(INDEX.options(mode_col, in_view)))
+    in_view = INDEX.narrow(in_view, mode_col, mode_sel)
 
-plant_sel = st.sidebar.multiselect("Plant", sorted(f[plant_col].dropna().unique().tolist()))
-if plant_sel:
-    f = f[f[plant_col].isin(plant_sel)]
+options, label = code_options(INDEX.options(plant_col, in_view), plant_col)
+plant_sel = st.sidebar.multiselect("Plant", options, format_func=label)
+in_view = INDEX.narrow(in_view, plant_col, plant_sel)
+rows_in_view = INDEX.count(in_view)
+
+# Selections by code column (an empty list is no filter)
+selected = {carrier_col: carrier_sel, service_col: service_sel, plant_col: plant_sel}
+if mode_col:
+    selected[mode_col] = mode_sel
+
+queue_k = st.sidebar.number_input("Rows per queue", min_value=10, max_value=5000, value=QUEUE_ROWS, step=10)
 
 st.sidebar.divider()
 st.sidebar.caption("Tip: filter to a carrier/service and the risk drivers + exception queue will update.")
@@ -535,16 +627,19 @@ TARGET_LATE_RATE = 0.02
 with tab_exec:
     st.subheader("Executive summary (scan-and-decide)")
 
-    orders = int(f["order_id"].nunique()) if "order_id" in f.columns else len(f)
-    units = float(f.get("unit_quantity", pd.Series([0] * len(f))).fillna(0).sum())
-    late_orders = int(f.get("is_late", pd.Series([False] * len(f))).fillna(False).sum())
-    on_time_rate = float(f.get("is_on_time", pd.Series([False] * len(f))).fillna(False).mean()) if len(f) else 0.0
-    freight_cost = float(f.get("freight_cost_est", pd.Series([0] * len(f))).fillna(0).sum())
+    if KPI_CUBE is not None:
+        cells = filter_cube(KPI_CUBE, start, end, selected)
+        kpis, base = cube_kpis(cells), cube_kpis(KPI_CUBE)
+    else:
+        # Only older builds without a cube copy the rows in view
+        f = fact.take(INDEX.positions(in_view))
+        kpis, base = summary_kpis(f), summary_kpis(fact)
+    orders, units, late_orders = kpis["orders"], kpis["units"], kpis["late_orders"]
+    on_time_rate, freight_cost = kpis["on_time_rate"], kpis["freight_cost"]
     late_rate = (late_orders / orders) if orders else 0.0
     cost_per_order = (freight_cost / orders) if orders else 0.0
 
-    base_orders = int(fact["order_id"].nunique()) if "order_id" in fact.columns else len(fact)
-    base_cost = float(fact.get("freight_cost_est", pd.Series([0] * len(fact))).fillna(0).sum())
+    base_orders, base_cost = base["orders"], base["freight_cost"]
     base_cost_per_order = (base_cost / base_orders) if base_orders else 0.0
 
     # KPI tiles
@@ -556,7 +651,7 @@ with tab_exec:
     with c5: kpi_card("Freight cost", fmt_compact(freight_cost), "Estimated total")
     with c6: kpi_card("Cost / order", fmt_money(cost_per_order), "Vs baseline")
 
-    st.caption(f"Data range in view: {to_date_range(f)}")
+    st.caption(f"Data range in view: {to_date_range(cells['date'] if KPI_CUBE is not None else f['order_date'])}")
 
     # Status pills
     on_time_status = "ok" if on_time_rate >= TARGET_ON_TIME else ("warn" if on_time_rate >= TARGET_ON_TIME - 0.01 else "bad")
@@ -576,51 +671,21 @@ with tab_exec:
     st.divider()
     st.subheader("Alerts (where to act first)")
 
-    # Carrier performance
-    carrier_stats = (
-        f.groupby(carrier_col)
-        .agg(
-            orders=("order_id", "nunique"),
-            on_time_rate=("is_on_time", "mean"),
-            late_orders=("is_late", "sum"),
-            freight_cost=("freight_cost_est", "sum"),
-        )
-        .reset_index()
-    )
+    # Carrier and lane performance, shared by the alerts and the driver charts
+    if KPI_CUBE is not None:
+        carrier_stats, lane_stats = cube_by_carrier(cells, carrier_col), cube_by_lane(cells)
+    else:
+        carrier_stats, lane_stats = by_carrier(f, carrier_col), by_lane(f)
 
     worst_carrier_name = "—"
     worst_carrier_sub = "No data"
     if not carrier_stats.empty:
-        worst = carrier_stats.sort_values(["on_time_rate", "orders"], ascending=[True, False]).head(1)
-        worst_carrier_name = str(worst.iloc[0][carrier_col])
+        worst = with_labels(carrier_stats.sort_values(["on_time_rate", "orders"], ascending=[True, False]).head(1))
+        worst_carrier_name = str(worst.iloc[0][label_of(carrier_col)])
         worst_carrier_sub = f"On-time: {fmt_pct(float(worst.iloc[0]['on_time_rate']))} | Orders: {int(worst.iloc[0]['orders'])}"
 
-    # Lane risk = cost × (1 - on_time)
-    if "lane_name" in f.columns:
-        lane_stats = (
-            f.groupby("lane_name")
-            .agg(
-                orders=("order_id", "nunique"),
-                freight_cost=("freight_cost_est", "sum"),
-                on_time_rate=("is_on_time", "mean"),
-            )
-            .reset_index()
-            .rename(columns={"lane_name": "lane"})
-        )
-    else:
-        lane_stats = (
-            f.groupby(["orig_port_cd", "dest_port_cd"])
-            .agg(
-                orders=("order_id", "nunique"),
-                freight_cost=("freight_cost_est", "sum"),
-                on_time_rate=("is_on_time", "mean"),
-            )
-            .reset_index()
-        )
-        lane_stats["lane"] = lane_stats["orig_port_cd"].astype(str) + " → " + lane_stats["dest_port_cd"].astype(str)
-
-    lane_stats["risk_score"] = lane_stats["freight_cost"] * (1 - lane_stats["on_time_rate"])
-    top_lane = lane_stats.sort_values("risk_score", ascending=False).head(1)
+    top_lane = lane_stats.sort_values("risk_score", ascending=False).head(1).copy()
+    top_lane["lane"] = lane_column(top_lane)
 
     top_lane_name = "—"
     top_lane_sub = "No data"
@@ -628,12 +693,12 @@ with tab_exec:
         top_lane_name = str(top_lane.iloc[0]["lane"])
         top_lane_sub = f"Risk: {fmt_compact(float(top_lane.iloc[0]['risk_score']))} | On-time: {fmt_pct(float(top_lane.iloc[0]['on_time_rate']))}"
 
-    late_queue = int(f.get("is_late", pd.Series([False] * len(f))).fillna(False).sum())
-    late_cost = float(f.loc[f.get("is_late", False), "freight_cost_est"].fillna(0).sum()) if "freight_cost_est" in f.columns else 0.0
+    late_queue = late_orders
+    late_cost = kpis["late_cost"]
 
     avg_tpt = "—"
-    if "tpt" in f.columns and len(f):
-        avg_tpt = f"{float(f['tpt'].mean()):.1f} days"
+    if kpis["avg_tpt"] is not None:
+        avg_tpt = f"{kpis['avg_tpt']:.1f} days"
 
     a1, a2, a3, a4, a5 = st.columns(5)
     with a1: kpi_card("Worst carrier", worst_carrier_name, worst_carrier_sub)
@@ -667,29 +732,19 @@ with tab_exec:
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         chart_header("Worst carriers (service reliability)")
 
-        if len(f):
-            carrier_stats = (
-                f.groupby(carrier_col)
-                .agg(
-                    orders=("order_id", "nunique"),
-                    on_time_rate=("is_on_time", "mean"),
-                    late_rate=("is_late", "mean"),
-                    freight_cost=("freight_cost_est", "sum"),
-                )
-                .reset_index()
-            )
-            carrier_stats = carrier_stats[carrier_stats["orders"] >= 50].copy()
+        if rows_in_view:
+            ranked = carrier_stats[carrier_stats["orders"] >= 50]
 
-            if carrier_stats.empty:
+            if ranked.empty:
                 st.info("Not enough volume under current filters to rank carriers.")
             else:
-                worst = carrier_stats.sort_values(["on_time_rate", "orders"], ascending=[True, False]).head(10).copy()
+                worst = with_labels(ranked.sort_values(["on_time_rate", "orders"], ascending=[True, False]).head(10))
                 worst["segment"] = ["Bottom 3" if i < 3 else "Other" for i in range(len(worst))]
 
                 fig = px.bar(
                     worst,
                     x="on_time_rate",
-                    y=carrier_col,
+                    y=label_of(carrier_col),
                     orientation="h",
                     color="segment",
                     color_discrete_map={
@@ -721,37 +776,14 @@ with tab_exec:
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         chart_header("Highest-risk lanes (cost exposure × failure)")
 
-        if len(f):
-            if "lane_name" in f.columns:
-                lane = (
-                    f.groupby("lane_name")
-                    .agg(
-                        orders=("order_id", "nunique"),
-                        freight_cost=("freight_cost_est", "sum"),
-                        on_time_rate=("is_on_time", "mean"),
-                    )
-                    .reset_index()
-                    .rename(columns={"lane_name": "lane"})
-                )
-            else:
-                lane = (
-                    f.groupby(["orig_port_cd", "dest_port_cd"])
-                    .agg(
-                        orders=("order_id", "nunique"),
-                        freight_cost=("freight_cost_est", "sum"),
-                        on_time_rate=("is_on_time", "mean"),
-                    )
-                    .reset_index()
-                )
-                lane["lane"] = lane["orig_port_cd"].astype(str) + " → " + lane["dest_port_cd"].astype(str)
-
-            lane = lane[lane["orders"] >= 20].copy()
+        if rows_in_view:
+            lane = lane_stats[lane_stats["orders"] >= 20]
 
             if lane.empty:
                 st.info("Not enough lane volume under current filters.")
             else:
-                lane["risk_score"] = lane["freight_cost"] * (1 - lane["on_time_rate"])
                 top = lane.sort_values("risk_score", ascending=False).head(10).copy()
+                top["lane"] = lane_column(top)
 
                 fig = px.bar(
                     top,
@@ -789,23 +821,9 @@ with tab_exec:
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         chart_header("Cost concentration (top spend lanes)")
 
-        if len(f):
-            if "lane_name" in f.columns:
-                lane_cost = (
-                    f.groupby("lane_name")
-                    .agg(freight_cost=("freight_cost_est", "sum"))
-                    .reset_index()
-                    .rename(columns={"lane_name": "lane"})
-                )
-            else:
-                lane_cost = (
-                    f.groupby(["orig_port_cd", "dest_port_cd"])
-                    .agg(freight_cost=("freight_cost_est", "sum"))
-                    .reset_index()
-                )
-                lane_cost["lane"] = lane_cost["orig_port_cd"].astype(str) + " → " + lane_cost["dest_port_cd"].astype(str)
-
-            topc = lane_cost.sort_values("freight_cost", ascending=False).head(10).copy()
+        if rows_in_view:
+            topc = lane_stats.sort_values("freight_cost", ascending=False).head(10).copy()
+            topc["lane"] = lane_column(topc)
 
             fig = px.bar(
                 topc,
@@ -850,52 +868,34 @@ with tab_exec:
         unsafe_allow_html=True,
     )
 
-    late_mask = f.get("is_late", pd.Series([False] * len(f))).fillna(False)
-    late_df = f[late_mask].copy()
+    # Same priority as the pipeline's exceptions queue when the stored model exists
+    late_df, triage = triage_queue(fact, RISK, queue_k, rows=INDEX.positions(INDEX.narrow(in_view, "is_late", [True])))
 
     if late_df.empty:
         st.info("No late shipments under current filters.")
     else:
-        late_df["days_late"] = late_df.get("ship_late_day_count", pd.Series([0] * len(late_df))).fillna(0).astype(float)
-        late_df["cost"] = late_df.get("freight_cost_est", pd.Series([0] * len(late_df))).fillna(0).astype(float)
-        late_df["priority_score"] = (late_df["days_late"].clip(lower=0) * (late_df["cost"].clip(lower=0) + 1)).astype(float)
-
-        q1 = late_df["priority_score"].quantile(0.70)
-        q2 = late_df["priority_score"].quantile(0.90)
-
-        def band(x: float) -> str:
-            if x >= q2:
-                return "High"
-            if x >= q1:
-                return "Medium"
-            return "Low"
-
-        late_df["priority_band"] = late_df["priority_score"].map(band)
+        # Labels for the displayed rows only
+        triage = with_labels(triage)
 
         action_cols = [
             "priority_band",
             "order_id",
             "order_date",
-            cust_col if cust_col in late_df.columns else "customer",
-            prod_col if prod_col in late_df.columns else "product_id",
-            plant_col if plant_col in late_df.columns else "plant_code",
-            "origin_port_name" if "origin_port_name" in late_df.columns else "orig_port_cd",
-            "dest_port_name" if "dest_port_name" in late_df.columns else "dest_port_cd",
-            carrier_col if carrier_col in late_df.columns else "carrier",
-            service_col if service_col in late_df.columns else "svc_cd",
-            "mode_dsc" if "mode_dsc" in late_df.columns else None,
+            label_of(cust_col),
+            label_of(prod_col),
+            label_of(plant_col),
+            label_of("orig_port_cd"),
+            label_of("dest_port_cd"),
+            label_of(carrier_col),
+            label_of(service_col),
+            "mode_dsc" if "mode_dsc" in triage.columns else None,
             "days_late",
-            "tpt" if "tpt" in late_df.columns else None,
-            "weight" if "weight" in late_df.columns else None,
+            "tpt" if "tpt" in triage.columns else None,
+            "weight" if "weight" in triage.columns else None,
             "cost",
             "priority_score",
         ]
-        action_cols = [c for c in action_cols if c and c in late_df.columns]
-
-        band_order = {"High": 0, "Medium": 1, "Low": 2}
-        triage = late_df.copy()
-        triage["_band_order"] = triage["priority_band"].map(band_order).fillna(9)
-        triage = triage.sort_values(["_band_order", "priority_score"], ascending=[True, False]).head(100).drop(columns=["_band_order"])
+        action_cols = [c for c in action_cols if c and c in triage.columns]
 
         t1, t2, t3, t4 = st.columns(4)
         with t1: kpi_card("Late shipments", fmt_compact(len(late_df)), "Exception queue size")
@@ -903,7 +903,8 @@ with tab_exec:
         with t3: kpi_card("Avg days late", f"{late_df['days_late'].mean():.1f}", "Delay severity")
         with t4: kpi_card("Cost exposure", fmt_compact(late_df["cost"].sum()), "Sum of est. freight cost")
 
-        st.caption("Sorted by priority score (delay × cost exposure). Use filters to narrow focus.")
+        basis = "risk score + cost exposure" if RISK is not None else "delay × cost exposure"
+        st.caption(f"Sorted by priority score ({basis}). Use filters to narrow focus.")
         st.dataframe(triage[action_cols], use_container_width=True, height=520)
 
 
@@ -914,14 +915,12 @@ with tab_risk:
     # -------------------------
     # Risk shipments (if pipeline output exists)
     # -------------------------
-    if RISK_SHIPMENTS.exists():
-        risk = load_csv(RISK_SHIPMENTS, parse_dates=["order_date"])
-        risk = risk[(risk["order_date"].dt.date >= start) & (risk["order_date"].dt.date <= end)].copy()
-
-        # Align filters (if enriched)
-        if "carrier_name" in risk.columns and carrier_sel:
-            risk = risk[risk["carrier_name"].isin(carrier_sel)]
-        elif "carrier" in risk.columns and carrier_sel:
+    if table_exists(RISK_SHIPMENTS, ANALYTICS_DIR):
+        # Date range is pushed down into the scan
+        risk = load_table(RISK_SHIPMENTS, start=start, end=end)
+
+        # Align filters (carrier codes)
+        if "carrier" in risk.columns and carrier_sel:
             risk = risk[risk["carrier"].isin(carrier_sel)]
 
         st.markdown(
@@ -987,37 +986,35 @@ with tab_risk:
             unsafe_allow_html=True,
         )
 
+        top_risk = top_k(risk, "risk_score", queue_k) if "risk_score" in risk.columns else risk.head(queue_k)
+        top_risk = with_labels(top_risk)
         show_cols = [c for c in [
             "order_id", "order_date",
-            "lane_name" if "lane_name" in risk.columns else ("lane" if "lane" in risk.columns else None),
-            "carrier_name" if "carrier_name" in risk.columns else ("carrier" if "carrier" in risk.columns else None),
-            "service_tier" if "service_tier" in risk.columns else ("svc_cd" if "svc_cd" in risk.columns else None),
-            "mode_dsc" if "mode_dsc" in risk.columns else None,
-            "risk_band" if "risk_band" in risk.columns else None,
-            "risk_score" if "risk_score" in risk.columns else None,
-            "ship_late_day_count" if "ship_late_day_count" in risk.columns else None,
-            "freight_cost_est" if "freight_cost_est" in risk.columns else None,
+            LANE_LABEL if LANE_LABEL in top_risk.columns else ("lane" if "lane" in top_risk.columns else None),
+            label_of("carrier"),
+            label_of("svc_cd"),
+            "mode_dsc", "risk_band", "risk_score", "ship_late_day_count", "freight_cost_est",
         ] if c]
-        show_cols = [c for c in show_cols if c in risk.columns]
+        show_cols = [c for c in show_cols if c in top_risk.columns]
 
-        if show_cols and "risk_score" in risk.columns:
-            st.dataframe(
-                risk.sort_values("risk_score", ascending=False).head(100)[show_cols],
-                use_container_width=True,
-                height=520,
-            )
+        if show_cols and "risk_score" in top_risk.columns:
+            st.dataframe(top_risk[show_cols], use_container_width=True, height=520)
         else:
-            st.dataframe(risk.head(100), use_container_width=True, height=520)
+            st.dataframe(top_risk, use_container_width=True, height=520)
 
     else:
-        st.info("No risk table found (`risk_shipments.csv`). Run: `python scripts/03_build_control_tower_v2.py`")
+        st.info("No risk table found (`risk_shipments`). Run: `python scripts/03_build_control_tower_v2.py`")
 
     st.divider()
 
     # -------------------------
     # Exceptions queue (if pipeline output exists)
     # -------------------------
-    if EXCEPTIONS.exists():
+    exception_types = [RISK_PRIORITY] if table_exists(EXCEPTIONS, ANALYTICS_DIR) else []
+    if table_exists(NETWORK_VIOLATIONS, ANALYTICS_DIR):
+        exception_types += list(VIOLATION_BITS)
+
+    if exception_types:
         st.markdown(
             """
 <div class="section-card">
@@ -1026,14 +1023,53 @@ with tab_risk:
 """,
             unsafe_allow_html=True,
         )
-        ex_raw = load_csv(EXCEPTIONS)
-        parse = ["order_date"] if "order_date" in ex_raw.columns else None
-        ex = load_csv(EXCEPTIONS, parse_dates=parse)
+        ex_type = st.selectbox("Exception type", exception_types)
 
-        st.dataframe(ex.head(300), use_container_width=True, height=520)
-        st.caption("This table is generated by the pipeline for ops triage and root-cause workflows.")
+        if ex_type == RISK_PRIORITY:
+            ex = load_table(EXCEPTIONS)
+            ex = top_k(ex, "priority_score", queue_k) if "priority_score" in ex.columns else ex.head(queue_k)
+            st.dataframe(ex, use_container_width=True, height=520)
+            st.caption("This table is generated by the pipeline for ops triage and root-cause workflows.")
+        else:
+            nv = load_table(NETWORK_VIOLATIONS, start=start, end=end)
+            nv = nv[(nv["violation_mask"] & VIOLATION_BITS[ex_type]) > 0]
+            # Same code filters as the fact
+            for col, sel in [(carrier_col, carrier_sel), (service_col, service_sel), (plant_col, plant_sel)]:
+                if sel:
+                    nv = nv[nv[col].isin(sel)]
+
+            st.caption(f"{len(nv):,} order(s) break this rule; largest freight exposure first.")
+            nv = with_labels(top_k(nv, "freight_cost_est", queue_k))
+            st.dataframe(nv, use_container_width=True, height=520)
+            st.caption("Checked by scripts/02f_check_network.py against ProductsPerPlant, PlantPorts and VmiCustomers.")
     else:
-        st.caption("No `exceptions.csv` found (optional output).")
+        st.caption("No `exceptions` table found (optional output).")
+
+    # -------------------------
+    # Rate shopping (if pipeline output exists)
+    # -------------------------
+    if table_exists(RATE_SAVINGS, ANALYTICS_DIR):
+        st.markdown(
+            """
+<div class="section-card">
+  <div class="section-title">Rate shopping: savings vs cheapest eligible rate (lane × carrier)</div>
+</div>
+""",
+            unsafe_allow_html=True,
+        )
+        rs = load_table(RATE_SAVINGS)
+        if carrier_sel:
+            rs = rs[rs["carrier"].isin(carrier_sel)]
+
+        c1, c2 = st.columns(2)
+        with c1:
+            kpi_card("Potential savings", fmt_money(rs["savings"].sum()), "switching to the cheapest eligible rate")
+        with c2:
+            kpi_card("Orders with a cheaper option", fmt_compact(rs["orders_with_savings"].sum()), f"of {fmt_compact(rs['orders'].sum())} shopped")
+
+        rs = with_labels(top_k(rs, "savings", queue_k), [LANE_LABEL, label_of("carrier")])
+        st.dataframe(rs, use_container_width=True, height=380)
+        st.caption("Generated by scripts/02d_rate_shopping.py; per-order alternatives are in `rate_shop_orders`.")
 
 
 # =========================
@@ -1048,8 +1084,8 @@ with tab_trends:
             "If you want trends, swap to a multi-week/month dataset and keep the same control tower structure."
         )
     else:
-        if SEASONALITY.exists():
-            s = load_csv(SEASONALITY)
+        if table_exists(SEASONALITY, ANALYTICS_DIR):
+            s = load_table(SEASONALITY)
             st.markdown("**Monthly service performance**")
 
             y_cols = [c for c in ["on_time_rate", "late_rate"] if c in s.columns]
@@ -1060,16 +1096,56 @@ with tab_trends:
                 st.plotly_chart(fig, use_container_width=True)
             st.dataframe(s, use_container_width=True, height=380)
         else:
-            st.info("No seasonality_monthly.csv found. (Optional)")
+            st.info("No seasonality_monthly table found. (Optional)")
 
         st.divider()
 
-        if SCENARIOS.exists():
-            sc = load_csv(SCENARIOS)
+        if table_exists(SCENARIOS, ANALYTICS_DIR):
+            sc = load_table(SCENARIOS)
             st.markdown("**What-if scenarios**")
             st.dataframe(sc, use_container_width=True, height=320)
         else:
-            st.caption("No scenarios.csv found. (Optional)")
+            st.caption("No scenarios table found. (Optional)")
+
+    # -------------------------
+    # Port congestion simulator (runs on the filtered orders)
+    # -------------------------
+    st.divider()
+    st.markdown("**Port congestion simulator**")
+    st.caption(
+        "Replays the filtered orders through their origin and destination ports, with berths sized for each "
+        "port's busiest day, then again under the congestion below. Delay is what the congestion adds."
+    )
+    port_options = sorted({str(p) for col in ["orig_port_cd", "dest_port_cd"] for p in INDEX.options(col, in_view)})
+    with st.form("port_congestion"):
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            handling_pct = st.slider("Handling time change", min_value=0, max_value=100, value=20, step=5, format="+%d%%")
+        with c2:
+            berth_pct = st.slider("Berths out of service", min_value=0, max_value=90, value=0, step=5, format="%d%%")
+        with c3:
+            congested_ports = st.multiselect("Congested ports (default: all)", port_options)
+        run_sim = st.form_submit_button("Run simulation")
+
+    if run_sim and rows_in_view:
+        spec = CongestionSpec(
+            handling_scale=1 + handling_pct / 100, berth_scale=1 - berth_pct / 100, ports=tuple(congested_ports),
+        )
+        sim_orders, sim_ports, _ = simulate_congestion(fact.take(INDEX.positions(in_view)), spec)
+        impact = congestion_impact(sim_orders)
+
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            kpi_card("Simulated on-time", fmt_pct(sim_orders["sim_is_on_time"].mean()), f"from {fmt_pct(sim_orders['is_on_time'].mean())}")
+        with c2:
+            kpi_card("Avg added delay", f"{sim_orders['delay_hours'].mean():.1f}h", f"{fmt_compact(sim_orders['is_delayed'].sum())} orders delayed")
+        with c3:
+            kpi_card("Late days added", fmt_compact(sim_orders["late_day_shift"].sum()), "ship_late_day_count shift")
+
+        impact = top_k(impact, ["on_time_impact_pp", "avg_delay_hours"], queue_k, ascending=[True, False])
+        st.dataframe(with_labels(impact, [LANE_LABEL, label_of("carrier")]), use_container_width=True, height=320)
+        st.dataframe(sim_ports, use_container_width=True, height=200)
+        st.caption("The pipeline version is scripts/02g_simulate_port_congestion.py (`port_congestion` tables).")
 
 # =========================
 # DATA (debug + transparency)
@@ -1079,29 +1155,27 @@ with tab_data:
 
     st.markdown(
         f"""
-**Fact table in use:** `{FACT.name}`  
+**Fact table in use:** `{table_file(FACT, ANALYTICS_DIR).name}`  
 **Rows:** {len(fact):,}  
 **Columns:** {len(fact.columns):,}  
-**Date range:** {to_date_range(fact)}  
+**Date range:** {to_date_range(fact['order_date'])}  
 """
     )
 
-    readable_cols = [c for c in [
-        "carrier_name", "service_tier", "origin_port_name", "dest_port_name",
-        "plant_name", "product_family", "customer_segment", "lane_name"
-    ] if c in fact.columns]
+    readable_cols = [label_of(c) for c in LABELS if c in fact.columns and label_of(c) != c]
+    if readable_cols and {"orig_port_cd", "dest_port_cd"} <= set(fact.columns):
+        readable_cols.append(LANE_LABEL)
 
     if readable_cols:
-        st.success("Context mapping is ACTIVE (plain-English labels available).")
+        st.success("Context mapping is ACTIVE (plain-English labels resolved on demand from `data/context`).")
         st.code(", ".join(readable_cols))
     else:
         st.warning(
             "Context mapping is NOT active yet — you are viewing coded identifiers.\n\n"
             "To enable plain-English labels run:\n"
             "1) python scripts/02b_generate_context_mappings.py\n"
-            "2) python scripts/02c_apply_context_mappings.py\n"
         )
 
     st.divider()
     st.markdown("**Preview**")
-    st.dataframe(fact.head(25), use_container_width=True, height=520)
+    st.dataframe(with_labels(fact.head(25)), use_container_width=True, height=520)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The stages import control_tower from scripts/, as the scripts themselves do
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.assignment import Network, greedy, improve, solve
+from control_tower.rates import SHOP_KEYS, build_lane_index
+
+
+def _candidates(rng: np.random.Generator, n: int, slots: int):
+    # Up to four candidate slots per order, sorted by order then cost; costs
+    # on a coarse grid so ties are common
+    per = rng.integers(0, 5, n)
+    o = np.repeat(np.arange(n), per)
+    slot = np.concatenate([rng.choice(slots, k, replace=False) for k in per])
+    cost = rng.integers(1, 20, len(o)).astype(float)
+    order = np.lexsort((cost, o))
+    return o[order], slot[order], cost[order]
+
+
+def _loads(slot: np.ndarray, choice: np.ndarray, slots: int) -> np.ndarray:
+    return np.bincount(slot[choice[choice >= 0]], minlength=slots)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_improve_keeps_capacity_and_never_costs_more(seed):
+    rng = np.random.default_rng(seed)
+    n, slots = 300, 12
+    o, slot, cost = _candidates(rng, n, slots)
+    capacity = rng.integers(0, 40, slots)
+
+    placed = greedy(o, slot, cost, capacity, n)
+    better = improve(o, slot, cost, placed, rounds=100)
+    for choice in (placed, better):
+        assigned = np.flatnonzero(choice >= 0)
+        assert (o[choice[assigned]] == assigned).all()
+        assert (_loads(slot, choice, slots) <= capacity).all()
+    # Swaps move orders between slots but never change who is placed or any slot's load
+    assert np.array_equal(better >= 0, placed >= 0)
+    assert np.array_equal(_loads(slot, better, slots), _loads(slot, placed, slots))
+    assert cost[better[better >= 0]].sum() <= cost[placed[placed >= 0]].sum() + 1e-9
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_improve_leaves_no_improving_swap(seed):
+    rng = np.random.default_rng(seed)
+    n, slots = 60, 5
+    o, slot, cost = _candidates(rng, n, slots)
+    choice = improve(o, slot, cost, greedy(o, slot, cost, rng.integers(5, 15, slots), n), rounds=1000)
+
+    # Every (order, slot) option, then every pair of placed orders that could trade slots
+    option = {(i, s): c for i, s, c in zip(o, slot, cost)}
+    placed = [(i, slot[c], cost[c]) for i, c in enumerate(choice) if c >= 0]
+    for i, a, ca in placed:
+        for j, b, cb in placed:
+            if a != b and (i, b) in option and (j, a) in option:
+                assert option[i, b] + option[j, a] >= ca + cb - 1e-9
+
+
+def test_greedy_gives_contested_slots_to_orders_without_a_fallback():
+    # Slot 0 has room for one; order 1 can also use slot 1 at a small premium
+    o = np.array([0, 1, 1])
+    slot = np.array([0, 0, 1])
+    cost = np.array([5.0, 1.0, 2.0])
+    assert greedy(o, slot, cost, np.array([1, 1]), 2).tolist() == [0, 2]
+    # With slot 1 full, neither has a fallback and the cheaper placement wins
+    assert greedy(o, slot, cost, np.array([1, 0]), 2).tolist() == [-1, 1]
+
+
+def _network() -> Network:
+    return Network.from_tables(
+        products=pd.DataFrame({"plant_code": ["PLANT01", "PLANT01", "PLANT02"], "product_id": [1, 2, 2]}),
+        ports=pd.DataFrame({"plant_code": ["PLANT01", "PLANT02"], "port": ["PORT04", "PORT05"]}),
+        vmi=pd.DataFrame({"plant_code": ["PLANT02"], "customers": ["C2"]}),
+        capacities=pd.DataFrame({"plant_code": ["PLANT01", "PLANT02"], "daily_capacity": [1, 5]}),
+        costs=pd.DataFrame({"plant_code": ["PLANT01", "PLANT02"], "wh_cost_per_unit": [1.0, 2.0]}),
+    )
+
+
+def _rates():
+    freight = pd.DataFrame({
+        "carrier": ["V444_0", "V444_1"],
+        "orig_port_cd": ["PORT04", "PORT05"],
+        "dest_port_cd": ["PORT09", "PORT09"],
+        "svc_cd": ["DTD", "DTD"],
+        "minm_wgh_qty": [0.0, 0.0],
+        "max_wgh_qty": [100.0, 100.0],
+        "minimum_cost": [10.0, 10.0],
+        "rate": [1.0, 1.0],
+        "mode_dsc": ["AIR", "AIR"],
+        "tpt_day_cnt": [2, 2],
+    })
+    return build_lane_index(freight, keys=SHOP_KEYS + ["svc_cd"])
+
+
+def test_solve_statuses():
+    orders = pd.DataFrame({
+        "product_id": [1, 1, 3, 2, 1, 2],
+        "customer": ["C1", "C1", "C1", "C2", "C1", "C1"],
+        "dest_port_cd": ["PORT09"] * 6,
+        "svc_cd": ["DTD"] * 6,
+        "weight": [5.0, 5.0, 5.0, 5.0, 5.0, 5.0],
+        "carrier": ["V444_0"] * 6,
+        "mode_dsc": ["AIR"] * 6,
+        "unit_quantity": [10, 20, 10, 10, 10, 10],
+        "order_date": pd.to_datetime(["2013-05-01"] * 4 + ["2013-05-02", "2013-05-01"]),
+    })
+    plan = solve(orders, _network(), _rates())
+
+    # Day 1 at PLANT01 has room for one: the cheaper of the two orders that
+    # can only go there. Product 3 is stocked nowhere; the last order's only
+    # other plant is a VMI plant that does not serve its customer.
+    assert plan["status"].tolist() == ["assigned", "over_capacity", "infeasible", "assigned", "assigned", "over_capacity"]
+    assert plan["plan_plant_code"].tolist() == ["PLANT01", None, None, "PLANT02", "PLANT01", None]
+    assert plan.loc[0, "plan_cost"] == 10.0 + 10 * 1.0
+    assert plan.loc[3, "plan_cost"] == 10.0 + 10 * 2.0
+    assert plan.loc[[1, 2, 5], "plan_cost"].isna().all()
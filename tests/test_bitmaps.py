@@ -0,0 +1,72 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.bitmaps import FilterIndex
+
+COLS = ["carrier", "plant_code", "is_late"]
+
+
+def _frame(rng: np.random.Generator, n: int, day_order: bool) -> pd.DataFrame:
+    days = pd.Timestamp("2013-05-01") + pd.to_timedelta(rng.integers(0, 20, n), unit="D")
+    days = days.where(rng.random(n) > 0.03)    # a few undated rows
+    carrier = rng.choice(["V44_1", "V44_2", "V44_3", None], n, p=[0.4, 0.3, 0.25, 0.05])
+    df = pd.DataFrame({
+        "order_date": days,
+        "carrier": pd.Categorical(carrier),
+        "plant_code": rng.choice([f"PLANT{i:02d}" for i in range(8)], n),
+        "is_late": rng.random(n) < 0.3,
+    })
+    return df.sort_values("order_date", kind="stable", ignore_index=True) if day_order else df
+
+
+def _mask(df: pd.DataFrame, start: date, end: date, selected: dict[str, list]) -> np.ndarray:
+    # The app's old filter: a date range, then one isin mask per non-empty multiselect
+    day = df["order_date"].dt.date
+    mask = (day >= start) & (day <= end)
+    for col, values in selected.items():
+        if values:
+            mask &= df[col].isin(values)
+    return mask.to_numpy()
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("day_order", [True, False])
+def test_bitmap_selection_matches_chained_masks(seed, day_order):
+    rng = np.random.default_rng(seed)
+    df = _frame(rng, 3000, day_order)
+    index = FilterIndex(df, COLS, "order_date")
+
+    for _ in range(20):
+        first, last = sorted(rng.integers(-2, 23, 2))
+        start = date(2013, 5, 1) + pd.Timedelta(days=int(first))
+        end = date(2013, 5, 1) + pd.Timedelta(days=int(last))
+        selected = {
+            "carrier": list(rng.choice(["V44_1", "V44_2", "V44_3", "V44_9"], rng.integers(0, 3), replace=False)),
+            "plant_code": list(rng.choice(df["plant_code"].unique(), rng.integers(0, 4), replace=False)),
+            "is_late": [True] if rng.random() < 0.3 else [],
+        }
+        expected = _mask(df, start, end, selected)
+
+        bits = index.dates(start, end)
+        for col, values in selected.items():
+            # Options offered at each step are the values left in the selection so far
+            shown = df.loc[np.unpackbits(bits, count=len(df)).astype(bool), col].dropna()
+            assert index.options(col, bits) == sorted(shown.unique().tolist())
+            bits = index.narrow(bits, col, values)
+
+        assert np.array_equal(index.positions(bits), np.flatnonzero(expected))
+        assert index.count(bits) == int(expected.sum())
+
+
+def test_whole_range_and_unknown_values():
+    df = _frame(np.random.default_rng(0), 500, day_order=False)
+    index = FilterIndex(df, COLS, "order_date")
+    everything = index.dates(date(2000, 1, 1), date(2100, 1, 1))
+    assert index.count(everything) == int(df["order_date"].notna().sum())
+    assert index.count(index.all()) == len(df)
+    assert index.count(index.narrow(everything, "carrier", ["V44_9"])) == 0
+    assert np.array_equal(index.narrow(everything, "carrier", []), everything)
+    assert index.count(index.dates(date(2013, 5, 10), date(2013, 5, 9))) == 0
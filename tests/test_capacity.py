@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.capacity import backlog_tables, simulate_backlog
+
+
+def _walk(arrivals: np.ndarray, capacity: float) -> dict[str, list]:
+    # The recurrence, one day at a time: B_t = max(0, B_{t-1} + a_t - c)
+    out = {"backlog": [], "processed": [], "spillover": [], "streak": []}
+    backlog, streak = 0.0, 0
+    for a in arrivals:
+        work = backlog + a
+        backlog = max(0.0, work - capacity)
+        streak = streak + 1 if backlog > 0 else 0
+        out["backlog"].append(backlog)
+        out["processed"].append(work - backlog)
+        out["spillover"].append(backlog > 0)
+        out["streak"].append(streak)
+    return out
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_simulate_backlog_matches_the_daily_loop(seed):
+    rng = np.random.default_rng(seed)
+    arrivals = rng.poisson(rng.uniform(0, 20, (6, 1)), (6, 60)).astype(float)
+    arrivals[:, rng.random(60) < 0.2] = 0
+    capacity = rng.integers(0, 20, 6).astype(float)
+
+    sim = simulate_backlog(arrivals, capacity)
+    for plant in range(len(capacity)):
+        expected = _walk(arrivals[plant], capacity[plant])
+        for name, values in expected.items():
+            np.testing.assert_allclose(sim[name][plant], values, atol=1e-9, err_msg=f"{name} of plant {plant}")
+
+
+def test_backlog_tables_walk_idle_days_and_skip_plants_without_capacity():
+    daily = pd.DataFrame({
+        "plant_code": ["P1", "P1", "P1", "P2", "P2", "P3"],
+        "day": pd.to_datetime(["2013-05-01", "2013-05-02", "2013-05-05", "2013-05-01", "2013-05-03", "2013-05-02"]),
+        "orders": [12, 9, 4, 3, 7, 5],
+        "daily_capacity": [5.0, 5.0, 5.0, 4.0, 4.0, np.nan],
+    })
+    out, summary = backlog_tables(daily)
+
+    assert summary["plant_code"].tolist() == ["P1", "P2"]
+    p1 = out[out["plant_code"] == "P1"]
+    # Five calendar days, including the two days without orders
+    assert p1["orders"].tolist() == [12, 9, 0, 0, 4]
+    assert p1["backlog"].tolist() == [7, 11, 6, 1, 0]
+    p2 = out[out["plant_code"] == "P2"]
+    assert p2["backlog"].tolist() == [0, 0, 3, 0, 0]
+
+    first = summary.set_index("plant_code").loc["P1"]
+    assert (first["spillover_days"], first["longest_spillover_streak"], first["peak_backlog"]) == (4, 4, 11)
+    assert first["overload_days"] == 2
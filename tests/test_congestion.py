@@ -0,0 +1,99 @@
+import heapq
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.congestion import CongestionSpec, PortPlan, replay
+
+DEPART, ARRIVE = 0, 1
+
+
+def _simulate(orig, dest, arrival, transit, berths, handling) -> dict[str, list]:
+    # Textbook event loop: arrivals and departures both on the heap; a berth
+    # freed at t serves the queue head before anything arriving at t
+    n, ports = len(arrival), len(berths)
+    free = list(berths)
+    queue = [deque() for _ in range(ports)]
+    out = {"wait_orig": [0] * n, "wait_dest": [0] * n, "finish": [0] * n, "queued": [0] * ports, "peak_queue": [0] * ports}
+    events = [(int(arrival[s]), ARRIVE, 0, s) for s in range(n)]
+    heapq.heapify(events)
+    arrived = {}
+
+    def start(t, leg, s, p):
+        out["wait_dest" if leg else "wait_orig"][s] = t - arrived[leg, s]
+        heapq.heappush(events, (t + int(handling[p]), DEPART, leg, s))
+
+    while events:
+        t, kind, leg, s = heapq.heappop(events)
+        p = int(dest[s] if leg else orig[s])
+        if kind == ARRIVE:
+            arrived[leg, s] = t
+            if free[p]:
+                free[p] -= 1
+                start(t, leg, s, p)
+            else:
+                queue[p].append((leg, s))
+                out["queued"][p] += 1
+                out["peak_queue"][p] = max(out["peak_queue"][p], len(queue[p]))
+            continue
+        if queue[p]:
+            start(t, *queue[p].popleft(), p)
+        else:
+            free[p] += 1
+        if leg == 0:
+            heapq.heappush(events, (t + int(transit[s]), ARRIVE, 1, s))
+        else:
+            out["finish"][s] = t
+    return out
+
+
+def test_one_berth_serves_in_arrival_order():
+    plan = PortPlan(pd.Index(["A", "B"]), berths=np.array([1, 2]), handling=np.array([10, 5]))
+    orig, dest = np.array([0, 0, 0, 0]), np.array([1, 1, 1, 1])
+    run = replay(orig, dest, np.array([0, 0, 0, 25]), np.array([0, 0, 0, 0]), plan)
+    assert run["wait_orig"].tolist() == [0, 10, 20, 5]
+    # B's two berths keep up with A's one
+    assert run["wait_dest"].tolist() == [0, 0, 0, 0]
+    assert run["finish"].tolist() == [15, 25, 35, 45]
+    assert run["queued"].tolist() == [3, 0]
+    assert run["peak_queue"].tolist() == [2, 0]
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("spec", [
+    CongestionSpec(handling_scale=1.0),
+    CongestionSpec(handling_scale=2.5, ports=("P1", "P3")),
+    CongestionSpec(handling_scale=0.5, berth_scale=0.01),
+    CongestionSpec(handling_scale=1.7, berth_scale=0.3, ports=("P0",)),
+])
+def test_replay_matches_an_explicit_departure_simulation(seed, spec):
+    rng = np.random.default_rng(seed)
+    ports, n = 5, 300
+    base = PortPlan(
+        pd.Index([f"P{i}" for i in range(ports)]),
+        berths=rng.integers(1, 5, ports),
+        handling=rng.integers(1, 30, ports),
+    )
+    plan = base.scaled(spec)
+    # Coarse arrival and transit times, so many events tie
+    orig = rng.integers(0, ports, n)
+    dest = np.where(rng.random(n) < 0.1, orig, rng.integers(0, ports, n))
+    arrival = rng.integers(0, 400, n) // 5 * 5
+    transit = rng.choice([0, 0, 5, 10, 60], n)
+
+    run = replay(orig, dest, arrival, transit, plan)
+    expected = _simulate(orig, dest, arrival, transit, plan.berths, plan.handling)
+    for name, values in expected.items():
+        assert run[name].tolist() == values, name
+    assert run["events"] == 2 * n
+
+
+def test_scaling_keeps_at_least_one_berth_and_minute():
+    plan = PortPlan(pd.Index(["P0", "P1"]), berths=np.array([3, 8]), handling=np.array([30, 2]))
+    scaled = plan.scaled(CongestionSpec(handling_scale=0.1, berth_scale=0.1))
+    assert scaled.berths.tolist() == [1, 1]
+    assert scaled.handling.tolist() == [3, 1]
+    only = plan.scaled(CongestionSpec(handling_scale=2.0, berth_scale=0.5, ports=("P1",)))
+    assert (only.berths.tolist(), only.handling.tolist()) == ([3, 4], [30, 4])
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.feasibility import (
+    PORT_NOT_LINKED, PRODUCT_NOT_STOCKED, VMI_EXCLUSIVE, NetworkRules, PairIndex, violation_names,
+)
+
+PRODUCTS = pd.DataFrame({
+    "plant_code": ["PLANT01", "PLANT01", "PLANT02", "PLANT03", "PLANT03"],
+    "product_id": [1700106, 1700107, 1700106, 1700107, 1700108],
+})
+PORTS = pd.DataFrame({"plant_code": ["PLANT01", "PLANT02", "PLANT02", "PLANT03"], "port": ["PORT04", "PORT04", "PORT05", "PORT09"]})
+VMI = pd.DataFrame({"plant_code": ["PLANT02", "PLANT02"], "customers": ["V55555_1", "V55555_2"]})
+
+
+def test_pair_index_matches_codes_not_dtypes():
+    index = PairIndex.build(PRODUCTS["plant_code"], PRODUCTS["product_id"])
+    # Ids read with gaps come back as floats, and codes may be categoricals
+    plant = pd.Series(["PLANT01", "PLANT01", "PLANT02", "PLANT04", None], dtype="category")
+    product = pd.Series([1700106.0, 1700108.0, 1700106.0, 1700106.0, 1700106.0])
+    assert index.contains(plant, product).tolist() == [True, False, True, False, False]
+    assert index.has_left(plant).tolist() == [True, True, True, False, False]
+    assert PairIndex.build(pd.Series([], dtype=object), pd.Series([], dtype=object)).contains(plant, product).tolist() == [False] * 5
+
+
+def test_check_sets_one_bit_per_broken_rule():
+    orders = pd.DataFrame({
+        "plant_code": ["PLANT01", "PLANT01", "PLANT02", "PLANT02", "PLANT03", None, "PLANT02"],
+        "product_id": [1700106, 1700108, 1700106, 1700107, 1700108, 1700106, np.nan],
+        "orig_port_cd": ["PORT04", "PORT05", "PORT05", "PORT09", None, "PORT04", "PORT04"],
+        "customer": ["V55555_9", "V55555_9", "V55555_1", "V55555_9", "V55555_9", "V55555_9", None],
+    })
+    mask = NetworkRules.from_tables(PRODUCTS, PORTS, VMI).check(orders)
+    assert mask.tolist() == [
+        0,
+        PRODUCT_NOT_STOCKED | PORT_NOT_LINKED,
+        0,
+        PRODUCT_NOT_STOCKED | PORT_NOT_LINKED | VMI_EXCLUSIVE,
+        0,      # no origin port: that check is skipped
+        0,      # no plant: nothing to check against
+        0,      # no product or customer
+    ]
+    names = violation_names(mask)
+    assert list(names.categories) == ["product_not_stocked|port_not_linked", "product_not_stocked|port_not_linked|vmi_exclusive"]
+    assert names.isna().tolist() == [True, False, True, False, True, True, True]
+
+
+def _semi_join(orders: pd.DataFrame, table: pd.DataFrame, right: str, col: str) -> np.ndarray:
+    # The merge-based check: does the order's (plant, value) pair appear in the sheet
+    pairs = table.rename(columns={right: col}).drop_duplicates()
+    merged = orders[["plant_code", col]].merge(pairs, on=["plant_code", col], how="left", indicator=True)
+    return (merged["_merge"] == "both").to_numpy()
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_check_matches_merge_semi_joins(seed):
+    rng = np.random.default_rng(seed)
+    plants = [f"PLANT{i:02d}" for i in range(6)]
+    products = pd.DataFrame({"plant_code": rng.choice(plants, 40), "product_id": rng.integers(0, 15, 40)})
+    ports = pd.DataFrame({"plant_code": rng.choice(plants, 8), "port": rng.choice([f"PORT{i:02d}" for i in range(4)], 8)})
+    vmi = pd.DataFrame({"plant_code": rng.choice(plants[:2], 5), "customers": rng.choice([f"C{i}" for i in range(6)], 5)})
+
+    n = 2000
+    orders = pd.DataFrame({
+        "plant_code": rng.choice(plants + ["PLANT99"], n),
+        "product_id": rng.integers(0, 18, n),
+        "orig_port_cd": rng.choice([f"PORT{i:02d}" for i in range(5)], n),
+        "customer": rng.choice([f"C{i}" for i in range(8)], n),
+    })
+    mask = NetworkRules.from_tables(products, ports, vmi).check(orders)
+
+    expected = np.where(~_semi_join(orders, products, "product_id", "product_id"), PRODUCT_NOT_STOCKED, 0)
+    expected |= np.where(~_semi_join(orders, ports, "port", "orig_port_cd"), PORT_NOT_LINKED, 0)
+    exclusive = orders["plant_code"].isin(vmi["plant_code"]).to_numpy()
+    expected |= np.where(exclusive & ~_semi_join(orders, vmi, "customers", "customer"), VMI_EXCLUSIVE, 0)
+    assert np.array_equal(mask, expected)
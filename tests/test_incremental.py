@@ -0,0 +1,71 @@
+import importlib.util
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from control_tower.storage import read_table
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _prepare():
+    # The stage resolves data/ against the working directory, so load it afresh there
+    spec = importlib.util.spec_from_file_location("prepare_stage", ROOT / "scripts" / "02_prepare_data.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _workspace(path: Path, orders: pd.DataFrame) -> Path:
+    processed = path / "data" / "processed"
+    processed.mkdir(parents=True)
+    for name in ["FreightRates", "WhCapacities", "WhCosts"]:
+        shutil.copy(ROOT / "data" / "processed" / f"{name}.csv", processed)
+    orders.to_csv(processed / "OrderList.csv", index=False)
+    return path
+
+
+def _plain(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    df = df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+    return df.sort_values(keys, kind="stable").reset_index(drop=True)
+
+
+def test_incremental_load_matches_a_full_rebuild(tmp_path, monkeypatch, capsys):
+    rng = np.random.default_rng(0)
+    sample = pd.read_csv(ROOT / "data" / "processed" / "OrderList.csv").sample(900, random_state=0)
+    # The sample is a single day; spread it over five
+    sample["Order_Date"] = (pd.Timestamp("2013-05-20") + pd.to_timedelta(rng.integers(0, 5, len(sample)), unit="D")).astype(str)
+    first = sample.iloc[:700]
+
+    # Next drop: a new day, edits to orders already loaded and an unchanged day re-sent
+    drop = sample.iloc[700:].copy()
+    drop["Order_Date"] = "2013-05-25"
+    edited = first[first["Order_Date"] == "2013-05-21"].head(20).copy()
+    edited["Weight"] = edited["Weight"] * 2
+    resent = first[first["Order_Date"] == "2013-05-23"]
+    drop = pd.concat([drop, edited, resent])
+    merged = pd.concat([first[~first["Order_ID"].isin(edited["Order_ID"])], edited, drop.iloc[:200]])
+
+    monkeypatch.chdir(_workspace(tmp_path / "incremental", first))
+    _prepare().main()
+    (tmp_path / "incremental" / "data" / "processed" / "OrderList.csv").unlink()
+    drop.to_csv(tmp_path / "incremental" / "data" / "processed" / "OrderList.csv", index=False)
+    _prepare().main(incremental=True)
+    assert "Changed days: ['2013-05-21', '2013-05-25']" in capsys.readouterr().out
+
+    monkeypatch.chdir(_workspace(tmp_path / "full", merged))
+    stage = _prepare()
+    stage.main()
+
+    incremental, full = tmp_path / "incremental" / "data" / "analytics", tmp_path / "full" / "data" / "analytics"
+    pd.testing.assert_frame_equal(
+        _plain(read_table("fact_orders", incremental), ["order_id"]), _plain(read_table("fact_orders", full), ["order_id"]),
+        check_dtype=False,
+    )
+    for spec in stage.KPI_SPECS:
+        pd.testing.assert_frame_equal(
+            _plain(read_table(spec.name, incremental), spec.keys), _plain(read_table(spec.name, full), spec.keys),
+            check_dtype=False, obj=spec.name,
+        )
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.kpis import KpiAccumulator, KpiSpec, compute_kpis
+
+SPECS = [
+    KpiSpec("by_carrier", ["carrier"], {
+        "orders": ("order_id", "nunique"),
+        "rows": ("order_id", "size"),
+        "late": ("is_late", "sum"),
+        "late_rate": ("is_late", "mean"),
+        "cost": ("cost", "sum"),
+        "costed": ("cost", "count"),
+        "avg_cost": ("cost", "mean"),
+    }),
+    KpiSpec("by_lane_mode", ["lane", "mode"], {"units": ("units", "sum"), "avg_tpt": ("tpt", "mean")}),
+    KpiSpec("by_plant_all", ["plant", "carrier"], {"rows": ("order_id", "size"), "cost": ("cost", "sum")}, dropna=False),
+]
+
+
+def _frame(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    def codes(prefix: str, k: int) -> np.ndarray:
+        v = np.array([f"{prefix}{i:02d}" for i in rng.integers(0, k, n)], dtype=object)
+        v[rng.random(n) < 0.05] = None
+        return v
+
+    cost = rng.uniform(10, 500, n).round(2)
+    cost[rng.random(n) < 0.1] = np.nan
+    tpt = rng.integers(0, 5, n).astype(float)
+    tpt[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        "order_id": rng.permutation(n).astype(float),
+        "date": pd.Timestamp("2013-05-01") + pd.to_timedelta(rng.integers(0, 10, n), unit="D"),
+        "carrier": pd.Categorical(codes("V44_", 5)),
+        "lane": codes("PORT", 4),
+        "mode": codes("M", 3),
+        "plant": codes("PLANT", 6),
+        "is_late": rng.random(n) < 0.3,
+        "cost": cost,
+        "units": rng.integers(1, 1000, n),
+        "tpt": tpt,
+    })
+
+
+def _groupby(df: pd.DataFrame, spec: KpiSpec) -> pd.DataFrame:
+    return df.groupby(spec.keys, dropna=spec.dropna, observed=True, sort=True).agg(**spec.measures).reset_index()
+
+
+def _assert_same(actual: pd.DataFrame, expected: pd.DataFrame, keys: list[str]) -> None:
+    plain = {k: object for k in keys}
+    pd.testing.assert_frame_equal(
+        actual.astype(plain).reset_index(drop=True), expected.astype(plain).reset_index(drop=True), check_dtype=False,
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compute_kpis_matches_groupby(seed):
+    df = _frame(np.random.default_rng(seed), 2000)
+    specs = SPECS + [KpiSpec("lanes_per_mode", ["mode"], {"lanes": ("lane", "nunique")})]
+    tables = compute_kpis(df, specs)
+    for spec in specs:
+        _assert_same(tables[spec.name], _groupby(df, spec), spec.keys)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("by", [None, "date"])
+def test_accumulated_batches_match_one_shot_groupby(seed, by):
+    rng = np.random.default_rng(seed)
+    df = _frame(rng, 3000)
+    acc = KpiAccumulator(SPECS, by=by)
+    cuts = np.sort(rng.choice(np.arange(1, len(df)), size=6, replace=False))
+    for a, b in zip(np.r_[0, cuts], np.r_[cuts, len(df)]):
+        acc.update(df.iloc[a:b])
+    tables = acc.result()
+    for spec in SPECS:
+        _assert_same(tables[spec.name], _groupby(df, spec), spec.keys)
+
+
+def test_dropped_days_are_replaced_by_their_new_rows(tmp_path):
+    rng = np.random.default_rng(11)
+    df = _frame(rng, 3000)
+    acc = KpiAccumulator(SPECS, by="date")
+    acc.update(df)
+    acc.save(tmp_path)
+
+    # An incremental load: two days are rebuilt from new rows
+    days = df["date"].drop_duplicates().iloc[:2]
+    redo = _frame(rng, 500)
+    redo["date"] = rng.choice(days.to_numpy(), len(redo))
+    redo["order_id"] += len(df)
+    acc = KpiAccumulator.load(SPECS, tmp_path, by="date")
+    acc.drop(days)
+    acc.update(redo)
+
+    expected = pd.concat([df[~df["date"].isin(days)], redo], ignore_index=True)
+    tables = acc.result()
+    for spec in SPECS:
+        _assert_same(tables[spec.name], _groupby(expected, spec), spec.keys)
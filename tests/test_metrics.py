@@ -0,0 +1,84 @@
+import json
+
+import pandas as pd
+import pytest
+
+from control_tower.metrics import compare_runs, instrument, load_run, resolve_run, save_baseline, step
+
+
+def _manifest(runs, run_id: str, stage: str) -> dict:
+    return json.loads((runs / run_id / f"{stage}.json").read_text())
+
+
+def test_steps_nest_and_repeated_calls_add_up(tmp_path):
+    with instrument("prepare", run_id="r1", runs_dir=tmp_path):
+        with step("build", rows_in=10) as outer:
+            for rows in (3, 4):
+                with step("kpi") as inner:
+                    inner.rows_out = rows
+                    inner.bytes_written = 100
+            outer.rows_out = 7
+    steps = {m["step"]: m for m in _manifest(tmp_path, "r1", "prepare")["steps"]}
+
+    assert sorted(steps) == ["build", "build/kpi"]
+    assert (steps["build/kpi"]["calls"], steps["build/kpi"]["rows_out"], steps["build/kpi"]["rows_in"]) == (2, 7, None)
+    assert (steps["build"]["calls"], steps["build"]["rows_in"], steps["build"]["rows_out"]) == (1, 10, 7)
+    manifest = _manifest(tmp_path, "r1", "prepare")
+    assert manifest["status"] == "ok"
+    assert manifest["total"]["bytes_written"] == 200
+    assert manifest["total"]["wall_s"] >= steps["build"]["wall_s"] >= steps["build/kpi"]["wall_s"]
+
+
+def test_failed_stage_still_writes_its_manifest(tmp_path):
+    with pytest.raises(RuntimeError):
+        with instrument("prepare", run_id="r1", runs_dir=tmp_path):
+            with step("build"):
+                raise RuntimeError("boom")
+    manifest = _manifest(tmp_path, "r1", "prepare")
+    assert manifest["status"] == "failed"
+    assert [m["step"] for m in manifest["steps"]] == ["build"]
+
+    # Outside a stage, steps record nothing
+    with step("loose") as handle:
+        handle.rows_out = 1
+    assert [p.name for p in (tmp_path / "r1").iterdir()] == ["prepare.json"]
+
+
+def _run(**steps) -> pd.DataFrame:
+    rows = [{"stage": "s", "status": "ok", "step": name, "calls": 1, "rows_in": 5, "rows_out": 5, **m} for name, m in steps.items()]
+    return pd.DataFrame(rows)
+
+
+def test_regressions_need_both_the_ratio_and_the_floor():
+    metrics = {"cpu_s": 1.0, "peak_rss_mb": 100.0, "bytes_written": 0}
+    base = _run(slow={"wall_s": 1.0, **metrics}, tiny={"wall_s": 0.01, **metrics}, gone={"wall_s": 1.0, **metrics})
+    cur = _run(slow={"wall_s": 1.3, **metrics}, tiny={"wall_s": 0.03, **metrics}, new={"wall_s": 9.0, **metrics})
+    cur.loc[0, "rows_out"] = 6
+    out = compare_runs(base, cur, threshold=0.2).set_index(["step", "metric"])
+
+    # +30% over a second regresses; tripling 10 ms is under the floor
+    assert out.loc[("slow", "wall_s"), "regression"]
+    assert out.loc[("slow", "wall_s"), "change"] == pytest.approx(0.3)
+    assert not out.loc[("tiny", "wall_s"), "regression"]
+    assert not out.loc[("slow", "peak_rss_mb"), "regression"]
+    assert out.loc[("slow", "wall_s"), "rows_changed"] and not out.loc[("tiny", "wall_s"), "rows_changed"]
+    # Steps in only one of the runs are left out
+    assert set(out.index.get_level_values("step")) == {"slow", "tiny"}
+    assert not compare_runs(base, cur, threshold=0.5)["regression"].any()
+
+
+def test_runs_round_trip_through_the_baseline(tmp_path):
+    for run_id in ("20130501-000000-1", "20130502-000000-1"):
+        with instrument("prepare", run_id=run_id, runs_dir=tmp_path):
+            with step("build"):
+                pass
+    latest = resolve_run("latest", tmp_path)
+    assert latest.name == "20130502-000000-1"
+
+    save_baseline(resolve_run("20130501-000000-1", tmp_path), tmp_path)
+    # The baseline is never "latest", whatever its name sorts as
+    assert resolve_run("latest", tmp_path) == latest
+    base = load_run(resolve_run("baseline", tmp_path))
+    assert base[["stage", "step"]].values.tolist() == [["prepare", "total"], ["prepare", "build"]]
+    with pytest.raises(FileNotFoundError):
+        resolve_run("nope", tmp_path)
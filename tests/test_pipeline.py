@@ -0,0 +1,151 @@
+import json
+import os
+
+import pytest
+
+from control_tower import pipeline
+from control_tower.pipeline import STAGES, Fingerprints, Stage, table_files, upstream
+
+# Stages over tracked reference tables, so fingerprints and output checks see real files
+CHAIN = [
+    Stage("a", "01_ingest_dataset.py", ("processed/WhCosts",), ("processed/WhCapacities",)),
+    Stage("b", "02_prepare_data.py", ("processed/WhCapacities",), ("processed/PlantPorts",)),
+    Stage("c", "02b_generate_context_mappings.py", ("processed/PlantPorts", "processed/WhCosts"), ("processed/VmiCustomers",)),
+    Stage("d", "02c_apply_context_mappings.py", ("processed/ProductsPerPlant",), ("processed/FreightRates",)),
+]
+
+
+def test_declared_stage_order_is_topological():
+    deps = upstream(STAGES)
+    seen = set()
+    for stage in STAGES:
+        assert deps[stage.name] <= seen, stage.name
+        seen.add(stage.name)
+    assert deps["apply_context"] == {"prepare", "context"}
+    assert deps["ingest"] == set()
+
+
+def test_fingerprint_follows_content_not_timestamps(tmp_path):
+    (tmp_path / "processed").mkdir()
+    table = tmp_path / "processed" / "WhCosts.csv"
+    table.write_text("WH,Cost/unit\nPLANT01,1.5\n")
+    stage = Stage("s", "02_prepare_data.py", ("processed/WhCosts",), ())
+    first = Fingerprints({}, tmp_path).stage(stage, [], "code")
+
+    # Touched but identical: same fingerprint
+    os.utime(table, ns=(table.stat().st_atime_ns, table.stat().st_mtime_ns + 10**9))
+    assert Fingerprints({}, tmp_path).stage(stage, [], "code") == first
+
+    table.write_text("WH,Cost/unit\nPLANT01,1.6\n")
+    changed = Fingerprints({}, tmp_path).stage(stage, [], "code")
+    assert changed != first
+    assert Fingerprints({}, tmp_path).stage(stage, ["--csv"], "code") != changed
+    assert Fingerprints({}, tmp_path).stage(stage, [], "other code") != changed
+    # A new file matching an input is an input too
+    (tmp_path / "processed" / "WhCosts.parquet").write_bytes(b"x")
+    assert Fingerprints({}, tmp_path).stage(stage, [], "code") != changed
+
+
+def test_digests_are_cached_against_size_and_mtime(tmp_path, monkeypatch):
+    (tmp_path / "processed").mkdir()
+    table = tmp_path / "processed" / "WhCosts.csv"
+    table.write_text("WH,Cost/unit\nPLANT01,1.5\n")
+    stage = Stage("s", "02_prepare_data.py", ("processed/WhCosts",), ())
+    reads, real = [], pipeline.file_hash
+    monkeypatch.setattr(pipeline, "file_hash", lambda path: reads.append(path) or real(path))
+
+    # The runner starts from an empty cache in a fresh state file
+    cache = {}
+    first = Fingerprints(cache, tmp_path).stage(stage, [], "code")
+    assert list(cache) == ["processed/WhCosts.csv"]
+    reads.clear()
+    assert Fingerprints(cache, tmp_path).stage(stage, [], "code") == first
+    assert table not in reads
+
+    os.utime(table, ns=(table.stat().st_atime_ns, table.stat().st_mtime_ns + 10**9))
+    assert Fingerprints(cache, tmp_path).stage(stage, [], "code") == first
+    assert table in reads
+
+
+def test_runs_save_the_digest_cache(tmp_path, runner):
+    state = tmp_path / "state.json"
+    pipeline.run(stages=CHAIN, state_file=state)
+    files = json.loads(state.read_text())["files"]
+    assert {"processed/WhCosts.csv", "processed/WhCapacities.csv"} <= set(files)
+
+
+def test_table_files_resolves_tables_dirs_and_globs(tmp_path):
+    (tmp_path / "analytics" / "fact_orders" / "2013-05-01").mkdir(parents=True)
+    part = tmp_path / "analytics" / "fact_orders" / "2013-05-01" / "part-00000.parquet"
+    part.write_bytes(b"x")
+    for name in ["kpi_lane.parquet", "kpi_lane.csv", "kpi_plant.csv"]:
+        (tmp_path / "analytics" / name).write_text("x")
+    assert table_files("analytics/fact_orders", tmp_path) == [part]
+    assert [p.name for p in table_files("analytics/kpi_lane", tmp_path)] == ["kpi_lane.parquet", "kpi_lane.csv"]
+    assert [p.name for p in table_files("analytics/kpi_*", tmp_path)] == ["kpi_lane.csv", "kpi_lane.parquet", "kpi_plant.csv"]
+    assert table_files("analytics/kpi_daily", tmp_path) == []
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    # Stage scripts are not run; each call reports the exit code set for its stage
+    calls, exits = [], {}
+
+    def execute(stage, args, *rest):
+        calls.append(stage.name)
+        return exits.get(stage.name, 0), "", 0.0
+
+    monkeypatch.setattr(pipeline, "_execute", execute)
+    return calls, exits
+
+
+def test_failures_block_downstream_and_reruns_skip_fresh_stages(tmp_path, runner):
+    calls, exits = runner
+    state = tmp_path / "state.json"
+
+    exits["b"] = 1
+    status = pipeline.run(stages=CHAIN, state_file=state)
+    assert status == {"a": "ran", "b": "failed", "c": "blocked", "d": "ran"}
+    assert sorted(calls) == ["a", "b", "d"]
+
+    calls.clear()
+    exits.clear()
+    status = pipeline.run(stages=CHAIN, state_file=state)
+    assert status == {"a": "skipped", "b": "ran", "c": "ran", "d": "skipped"}
+    assert sorted(calls) == ["b", "c"]
+
+    calls.clear()
+    assert set(pipeline.run(stages=CHAIN, state_file=state).values()) == {"skipped"}
+    assert calls == []
+    assert set(pipeline.run(stages=CHAIN, state_file=state, force=True, jobs=1).values()) == {"ran"}
+
+
+def test_dry_run_marks_stale_stages_and_their_downstream(tmp_path, runner):
+    calls, _ = runner
+    state = tmp_path / "state.json"
+    pipeline.run(stages=CHAIN, state_file=state)
+    calls.clear()
+
+    # Only b takes --csv, so only its fingerprint changes; c is stale because b is
+    flagged = [Stage(s.name, s.script, s.inputs, s.outputs, flags=frozenset({"csv"} if s.name == "b" else ())) for s in CHAIN]
+    status = pipeline.run(stages=flagged, state_file=state, export_csv=True, dry_run=True)
+    assert status == {"a": "skipped", "b": "stale", "c": "stale", "d": "skipped"}
+    status = pipeline.run(stages=CHAIN, state_file=state, only=["b", "c"], dry_run=True)
+    assert status == {"b": "skipped", "c": "skipped"}
+    assert calls == []
+
+    with pytest.raises(ValueError):
+        pipeline.run(stages=CHAIN, state_file=state, only=["nope"])
+
+
+def test_source_stage_without_inputs_keeps_its_outputs(tmp_path, runner):
+    calls, _ = runner
+    # No workbook to ingest, but the processed tables it would write are there
+    chain = [Stage("a", "01_ingest_dataset.py", ("raw/*.nothing",), ("processed/WhCapacities",)), *CHAIN[1:]]
+    status = pipeline.run(stages=chain, state_file=tmp_path / "state.json", force=True)
+    assert status == {"a": "skipped", "b": "ran", "c": "ran", "d": "ran"}
+    assert "a" not in calls
+
+    # Without its outputs it is run as usual
+    chain[0] = Stage("a", "01_ingest_dataset.py", ("raw/*.nothing",), ("processed/Missing",))
+    assert pipeline.run(stages=chain, state_file=tmp_path / "state.json")["a"] == "ran"
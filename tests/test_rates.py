@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.rates import (
+    RATE_COLS, RATE_KEYS, SHOP_KEYS, apply_rates, band_issues, build_lane_index, build_rate_index, shop_rates,
+)
+
+KEYS = [
+    ("V444_0", "PORT04", "PORT09", "DTD"),
+    ("V444_0", "PORT04", "PORT09", "DTP"),
+    ("V444_1", "PORT04", "PORT09", "DTD"),
+    ("V444_2", "PORT05", "PORT09", "CRF"),
+    ("V444_3", "PORT08", "PORT09", "DTD"),
+]
+
+
+def _freight(rng: np.random.Generator) -> pd.DataFrame:
+    # Cent-step bands per key, with some overlapping, gapped and unusable rows,
+    # in shuffled rate card order
+    rows = []
+    for key in KEYS:
+        lo = 0.0
+        for _ in range(rng.integers(1, 8)):
+            hi = lo + float(rng.choice([4.99, 9.99, 49.99]))
+            rows.append((*key, lo, hi))
+            lo = hi + float(rng.choice([0.01, 0.01, 0.01, 5.0, -2.0]))
+    rows.append((*KEYS[0], np.nan, 10.0))
+    rows.append((*KEYS[1], 30.0, 20.0))
+    freight = pd.DataFrame(rows, columns=RATE_KEYS + ["minm_wgh_qty", "max_wgh_qty"])
+    n = len(freight)
+    freight["minimum_cost"] = rng.choice([25.0, 40.0], n)
+    freight["rate"] = rng.uniform(0.1, 2.0, n).round(4)
+    freight["mode_dsc"] = rng.choice(["AIR", "GROUND"], n)
+    freight["carrier_type"] = rng.choice(["V88888888_0", "V88888888_1"], n)
+    # Few distinct transit times and rounded costs, so shopping has ties to break
+    freight["tpt_day_cnt"] = rng.integers(1, 4, n)
+    return freight.iloc[rng.permutation(n)].reset_index(drop=True)
+
+
+def _orders(rng: np.random.Generator, freight: pd.DataFrame, n: int = 400) -> pd.DataFrame:
+    keys = KEYS + [("V444_9", "PORT04", "PORT09", "DTD")]
+    picked = [keys[i] for i in rng.integers(0, len(keys), n)]
+    orders = pd.DataFrame(picked, columns=RATE_KEYS)
+    # Weights on and just outside band edges, inside bands, past every band, and missing
+    edges = np.concatenate([freight["minm_wgh_qty"], freight["max_wgh_qty"]])
+    edges = edges[~np.isnan(edges)]
+    weight = rng.choice(edges, n) + rng.choice([0.0, 0.0, -0.005, 0.005], n)
+    weight = np.where(rng.random(n) < 0.3, rng.uniform(0, 400, n), weight)
+    weight[rng.random(n) < 0.05] = np.nan
+    orders["weight"] = weight
+    orders["order_id"] = np.arange(n, dtype=float)
+    return orders
+
+
+def _merge_rows(orders: pd.DataFrame, freight: pd.DataFrame) -> np.ndarray:
+    # The merge-based costing: every rate row of the order's key, the first
+    # in-band row in rate card order, else the key's first row
+    merged = orders.merge(freight.rename_axis("row").reset_index(), on=RATE_KEYS, how="left")
+    w = merged["weight"]
+    merged["band_ok"] = (w >= merged["minm_wgh_qty"]) & (w <= merged["max_wgh_qty"])
+    merged = merged.sort_values(["order_id", "band_ok"], ascending=[True, False], kind="stable")
+    merged = merged.drop_duplicates(subset=["order_id"], keep="first").set_index("order_id")
+    return merged["row"].reindex(orders["order_id"]).fillna(-1).to_numpy(dtype=np.int64)
+
+
+def test_lookup_resolves_overlaps_to_the_earliest_row():
+    lane = ("V444_0", "PORT04", "PORT09", "DTD")
+    freight = pd.DataFrame(
+        [(*lane, 10.0, 20.0), (*lane, 0.0, 9.99), (*lane, 5.0, 15.0), ("V444_1", "PORT04", "PORT09", "DTD", 0.0, 50.0)],
+        columns=RATE_KEYS + ["minm_wgh_qty", "max_wgh_qty"],
+    )
+    orders = pd.DataFrame([lane] * 6 + [("V444_9", "PORT04", "PORT09", "DTD")], columns=RATE_KEYS)
+    weight = [7.0, 12.0, 9.995, 20.0, 25.0, np.nan, 7.0]
+    # In two bands, the earlier row wins; in the gap only row 2 covers; past
+    # every band or unweighed, the lane's first row; unknown lane, none
+    assert build_rate_index(freight).lookup(orders, weight).tolist() == [1, 0, 2, 0, 0, 0, -1]
+
+
+def test_band_issues_flag_overlaps_and_gaps_beyond_a_cent():
+    lane = ("V444_0", "PORT04", "PORT09", "DTD")
+    freight = pd.DataFrame(
+        [(*lane, lo, hi) for lo, hi in [(5.0, 9.99), (0.0, 4.99), (1.0, 2.0), (15.0, 20.0), (18.0, 25.0), (np.nan, 3.0)]],
+        columns=RATE_KEYS + ["minm_wgh_qty", "max_wgh_qty"],
+    )
+    issues = band_issues(freight)
+    # (1, 2) sits inside (0, 4.99); 5.00 follows 4.99 by a cent, not past the nested band
+    assert issues[["minm_wgh_qty", "issue"]].values.tolist() == [[1.0, "overlap"], [15.0, "gap"], [18.0, "overlap"]]
+    assert issues["prev_max_wgh_qty"].tolist() == [4.99, 9.99, 20.0]
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_lookup_matches_merge_and_band_filter(seed):
+    rng = np.random.default_rng(seed)
+    freight = _freight(rng)
+    orders = _orders(rng, freight)
+    index = build_rate_index(freight)
+    assert np.array_equal(index.lookup(orders, orders["weight"]), _merge_rows(orders, freight))
+
+
+def test_apply_rates_costs_the_matched_row():
+    rng = np.random.default_rng(7)
+    freight = _freight(rng)
+    orders = _orders(rng, freight)
+    costed = apply_rates(orders, build_rate_index(freight))
+
+    expected = freight.reindex(_merge_rows(orders, freight))
+    for col in RATE_COLS:
+        pd.testing.assert_series_equal(costed[col], expected[col].set_axis(costed.index), check_names=False)
+    cost = np.maximum(expected["minimum_cost"].fillna(0).to_numpy(), orders["weight"].to_numpy() * expected["rate"].to_numpy())
+    np.testing.assert_allclose(costed["freight_cost_est"].to_numpy(), cost)
+
+
+def _merge_shop(orders: pd.DataFrame, freight: pd.DataFrame) -> pd.DataFrame:
+    # Every in-band rate row of the order's lane, best first by a full sort
+    merged = orders.merge(freight.rename_axis("row").reset_index(), on=SHOP_KEYS, how="left", suffixes=("", "_rate"))
+    w = merged["weight"]
+    merged = merged[(w >= merged["minm_wgh_qty"]) & (w <= merged["max_wgh_qty"])].copy()
+    merged["cost"] = np.maximum(merged["minimum_cost"].fillna(0), merged["weight"] * merged["rate"])
+    out = pd.DataFrame({"options": merged.groupby("order_id").size()}).reindex(orders["order_id"]).fillna(0)
+    for name, by in (("cheapest", ["cost", "tpt_day_cnt", "row"]), ("fastest", ["tpt_day_cnt", "cost", "row"])):
+        best = merged.sort_values(["order_id", *by], kind="stable").drop_duplicates("order_id").set_index("order_id")
+        out[f"{name}_carrier"] = best["carrier_rate"]
+        out[f"{name}_cost"] = best["cost"]
+        out[f"{name}_tpt"] = best["tpt_day_cnt"].astype(float)
+    return out.reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("max_pairs", [7, 5_000_000])
+def test_shop_rates_matches_merge_and_sort(seed, max_pairs):
+    rng = np.random.default_rng(seed)
+    freight = _freight(rng)
+    orders = _orders(rng, freight)
+    shopped = shop_rates(orders, build_lane_index(freight), max_pairs=max_pairs)
+
+    expected = _merge_shop(orders, freight)
+    assert shopped["options"].tolist() == expected["options"].astype(int).tolist()
+    for col in ["cheapest_carrier", "cheapest_cost", "cheapest_tpt", "fastest_carrier", "fastest_cost", "fastest_tpt"]:
+        pd.testing.assert_series_equal(
+            shopped[col].reset_index(drop=True), expected[col], check_names=False, check_dtype=False,
+        )
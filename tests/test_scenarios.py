@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.scenarios import MAX_DELAY_DAYS, ScenarioAccumulator, ScenarioSpec, run_trials, simulate
+
+
+def _orders(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    late = np.where(rng.random(n) < 0.2, rng.integers(1, 4, n), 0)
+    weight = rng.uniform(1, 300, n)
+    weight[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        "lane": rng.choice([f"PORT{i:02d}->PORT09" for i in range(5)], n),
+        "carrier": rng.choice(["V444_0", "V444_1", "V444_2"], n),
+        "weight": weight,
+        "rate": rng.uniform(0.1, 2.0, n),
+        "minimum_cost": rng.choice([np.nan, 25.0, 40.0], n),
+        "ship_late_day_count": late,
+        "ship_ahead_day_count": np.where(late > 0, 0, rng.integers(0, MAX_DELAY_DAYS + 4, n)),
+    })
+
+
+def _inputs(df: pd.DataFrame):
+    acc = ScenarioAccumulator()
+    acc.update(df)
+    return acc.inputs()
+
+
+def _per_order(df: pd.DataFrame, uplift: float, delay: int) -> tuple[float, float]:
+    # One order at a time: re-cost, scale by the uplift, and hold the (capped)
+    # delay against the order's slack
+    cost = np.maximum(df["minimum_cost"].fillna(0), df["weight"] * df["rate"]).fillna(0)
+    slack = np.where(df["ship_late_day_count"] > 0, -df["ship_late_day_count"], df["ship_ahead_day_count"])
+    late = slack < min(delay, MAX_DELAY_DAYS)
+    return float(cost.sum() * uplift), 1 - late.mean()
+
+
+@pytest.mark.parametrize("spec,uplift,delay", [
+    (ScenarioSpec("Baseline"), 1.0, 0),
+    (ScenarioSpec("Fuel", fuel_mean=0.10, pass_through=(0.7, 0.7)), 1.07, 0),
+    (ScenarioSpec("Shock", shock_prob=1.0, shock_delay_days=2, shock_premium=0.15), 1.15, 2),
+    (ScenarioSpec("Long shock", shock_prob=1.0, shock_delay_days=30), 1.0, 30),
+])
+def test_deterministic_scenarios_match_per_order_costing(spec, uplift, delay):
+    df = _orders(np.random.default_rng(3), 2000)
+    cost, on_time = run_trials(_inputs(df), spec, trials=4, seed=0)
+    expected_cost, expected_on_time = _per_order(df, uplift, delay)
+    np.testing.assert_allclose(cost, expected_cost)
+    np.testing.assert_allclose(on_time, expected_on_time)
+
+
+def test_congestion_delays_only_ever_cost_on_time():
+    df = _orders(np.random.default_rng(4), 2000)
+    _, on_time = run_trials(_inputs(df), ScenarioSpec("Port", congestion_days=1.5), trials=200, seed=1)
+    _, baseline = _per_order(df, 1.0, 0)
+    _, worst = _per_order(df, 1.0, MAX_DELAY_DAYS)
+    assert (on_time <= baseline).all() and (on_time >= worst).all()
+    assert on_time.min() < baseline
+
+
+def test_batches_fold_to_one_shot_inputs():
+    rng = np.random.default_rng(5)
+    df = _orders(rng, 3000)
+    acc = ScenarioAccumulator()
+    for part in np.array_split(np.arange(len(df)), 7):
+        acc.update(df.iloc[part])
+    batched, whole = acc.inputs(), _inputs(df)
+    for name in ["lane", "carrier", "cost", "late_by_delay"]:
+        np.testing.assert_allclose(getattr(batched, name), getattr(whole, name), err_msg=name)
+    assert (batched.orders, batched.n_lanes, batched.n_carriers) == (whole.orders, whole.n_lanes, whole.n_carriers)
+
+
+def test_results_do_not_depend_on_worker_count():
+    inputs = _inputs(_orders(np.random.default_rng(6), 1000))
+    specs = [ScenarioSpec("Combined", fuel_mean=0.1, fuel_sd=0.03, congestion_days=0.2, shock_prob=0.1, shock_delay_days=1)]
+    one = simulate(inputs, specs, trials=1200, seed=9, workers=1)
+    three = simulate(inputs, specs, trials=1200, seed=9, workers=3)
+    pd.testing.assert_frame_equal(one, three)
+    assert one.loc[0, "trials"] == 1200
+
+
+def test_row_order_does_not_change_the_draws():
+    df = _orders(np.random.default_rng(7), 2000)
+    shuffled = df.sample(frac=1, random_state=1)
+    spec = [ScenarioSpec("Combined", fuel_mean=0.1, fuel_sd=0.03, congestion_days=0.5, shock_prob=0.2, shock_delay_days=1)]
+    pd.testing.assert_frame_equal(
+        simulate(_inputs(df), spec, trials=500, seed=2), simulate(_inputs(shuffled), spec, trials=500, seed=2),
+    )
@@ -0,0 +1,158 @@
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.storage import (
+    UNDATED, TableWriter, changed_days, day_hashes, drop_partitions, export_partitions_csv, partition_hashes,
+    read_manifest, read_table, write_partitions,
+)
+
+NAME = "fact_orders"
+
+
+def _fact(rng: np.random.Generator, n: int, first_id: int = 0) -> pd.DataFrame:
+    day = pd.Timestamp("2013-05-01") + pd.to_timedelta(rng.integers(0, 6, n), unit="D")
+    return pd.DataFrame({
+        "order_id": np.arange(first_id, first_id + n, dtype=float),
+        "order_date": day.where(rng.random(n) > 0.05),
+        "carrier": rng.choice(["V444_0", "V444_1", "V444_2"], n),
+        "unit_quantity": rng.integers(1, 900, n),
+        "weight": rng.uniform(0, 300, n).round(3),
+        "is_late": rng.random(n) < 0.3,
+    })
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.astype({"carrier": object}).sort_values("order_id", kind="stable")
+    return df.reset_index(drop=True)
+
+
+def test_manifest_records_each_days_hash_and_rows(tmp_path):
+    df = _fact(np.random.default_rng(0), 1000)
+    write_partitions(df, NAME, tmp_path)
+
+    days = read_manifest(NAME, tmp_path)["days"]
+    assert day_hashes(NAME, tmp_path) == partition_hashes(df, NAME)
+    keys = df["order_date"].dt.strftime("%Y-%m-%d").fillna(UNDATED)
+    assert {day: meta["rows"] for day, meta in days.items()} == keys.value_counts().to_dict()
+    assert sorted(p.name for p in (tmp_path / NAME).iterdir() if p.is_dir()) == sorted(days)
+    pd.testing.assert_frame_equal(_sorted(read_table(NAME, tmp_path)), _sorted(df), check_dtype=False)
+
+
+def test_day_hash_ignores_row_order_and_storage_types():
+    df = _fact(np.random.default_rng(1), 300)
+    shuffled = df.sample(frac=1, random_state=0)
+    floats = df.astype({"unit_quantity": float})
+    assert partition_hashes(shuffled, NAME) == partition_hashes(df, NAME) == partition_hashes(floats, NAME)
+    edited = df.copy()
+    edited.loc[0, "weight"] += 0.001
+    day = edited["order_date"].dt.strftime("%Y-%m-%d").fillna(UNDATED)[0]
+    assert changed_days(partition_hashes(edited, NAME), partition_hashes(df, NAME)) == [day]
+
+
+def test_appended_parts_add_up_to_a_one_shot_write(tmp_path):
+    rng = np.random.default_rng(2)
+    df = _fact(rng, 1500)
+    cuts = np.sort(rng.choice(np.arange(1, len(df)), size=4, replace=False))
+    for part, (a, b) in enumerate(zip(np.r_[0, cuts], np.r_[cuts, len(df)])):
+        write_partitions(df.iloc[a:b], NAME, tmp_path, mode="append" if part else "overwrite", part=part)
+
+    assert read_manifest(NAME, tmp_path)["days"] == {
+        day: {"hash": h, "rows": int((df["order_date"].dt.strftime("%Y-%m-%d").fillna(UNDATED) == day).sum())}
+        for day, h in partition_hashes(df, NAME).items()
+    }
+    pd.testing.assert_frame_equal(_sorted(read_table(NAME, tmp_path)), _sorted(df), check_dtype=False)
+
+
+def test_replace_rewrites_only_the_days_given_and_drop_removes_them(tmp_path):
+    rng = np.random.default_rng(3)
+    df = _fact(rng, 1000)
+    write_partitions(df, NAME, tmp_path)
+    before = day_hashes(NAME, tmp_path)
+
+    redo = _fact(rng, 200, first_id=5000)
+    redo["order_date"] = pd.Timestamp("2013-05-02")
+    write_partitions(redo, NAME, tmp_path, mode="replace")
+    after = day_hashes(NAME, tmp_path)
+    assert changed_days(after, before) == ["2013-05-02"]
+    assert after["2013-05-02"] == partition_hashes(redo, NAME)["2013-05-02"]
+    expected = pd.concat([df[df["order_date"] != pd.Timestamp("2013-05-02")], redo])
+    pd.testing.assert_frame_equal(_sorted(read_table(NAME, tmp_path)), _sorted(expected), check_dtype=False)
+
+    drop_partitions(NAME, tmp_path, ["2013-05-02", UNDATED])
+    assert sorted(day_hashes(NAME, tmp_path)) == sorted(set(before) - {"2013-05-02", UNDATED})
+    assert not (tmp_path / NAME / "2013-05-02").exists()
+    assert json.loads((tmp_path / NAME / "_manifest.json").read_text())["days"].keys() == day_hashes(NAME, tmp_path).keys()
+
+
+def test_csv_export_is_one_file_that_follows_the_table(tmp_path):
+    rng = np.random.default_rng(5)
+    df = _fact(rng, 1200)
+    with TableWriter(NAME, tmp_path, export_csv=True) as writer:
+        for a in range(0, len(df), 500):
+            writer.write(df.iloc[a:a + 500])
+    assert not list((tmp_path / NAME).rglob("*.csv"))
+
+    redo = _fact(rng, 100, first_id=5000)
+    redo["order_date"] = pd.Timestamp("2013-05-03")
+    write_partitions(redo, NAME, tmp_path, mode="replace", export_csv=True)
+    assert len(pd.read_csv(tmp_path / f"{NAME}.csv")) == len(read_table(NAME, tmp_path))
+    drop_partitions(NAME, tmp_path, [UNDATED])
+    export_partitions_csv(NAME, tmp_path)
+    stored = read_table(NAME, tmp_path)
+
+    # Without the partitions, reads fall back to the export and see the same table
+    shutil.rmtree(tmp_path / NAME)
+    pd.testing.assert_frame_equal(read_table(NAME, tmp_path), stored, check_dtype=False, check_categorical=False)
+
+
+def test_a_failed_table_writer_leaves_the_stored_table(tmp_path):
+    rng = np.random.default_rng(6)
+    df = _fact(rng, 800)
+    write_partitions(df, NAME, tmp_path)
+    manifest = read_manifest(NAME, tmp_path)
+
+    new = _fact(rng, 600, first_id=5000)
+    with pytest.raises(RuntimeError):
+        with TableWriter(NAME, tmp_path) as writer:
+            writer.write(new.iloc[:300])
+            # Readers still see the old table while the new one is written
+            pd.testing.assert_frame_equal(_sorted(read_table(NAME, tmp_path)), _sorted(df), check_dtype=False)
+            raise RuntimeError("batch failed")
+    assert read_manifest(NAME, tmp_path) == manifest
+    pd.testing.assert_frame_equal(_sorted(read_table(NAME, tmp_path)), _sorted(df), check_dtype=False)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [NAME]
+
+    with TableWriter(NAME, tmp_path) as writer:
+        writer.write(new.iloc[:300])
+        writer.write(new.iloc[300:])
+    assert day_hashes(NAME, tmp_path) == partition_hashes(new, NAME)
+    pd.testing.assert_frame_equal(_sorted(read_table(NAME, tmp_path)), _sorted(new), check_dtype=False)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [NAME]
+
+
+@pytest.mark.parametrize("start,end,days", [
+    ("2013-05-02", "2013-05-04", None),
+    ("2013-05-03", None, None),
+    (None, "2013-05-01", None),
+    ("2013-05-04", "2013-05-02", None),
+    (None, None, ["2013-05-05", UNDATED]),
+])
+def test_reads_prune_partitions_like_a_row_filter(tmp_path, start, end, days):
+    df = _fact(np.random.default_rng(4), 800)
+    write_partitions(df, NAME, tmp_path)
+    day = df["order_date"]
+    keep = pd.Series(True, index=df.index)
+    if start is not None:
+        keep &= day >= pd.Timestamp(start)
+    if end is not None:
+        keep &= day <= pd.Timestamp(end)
+    if days is not None:
+        keep &= day.dt.strftime("%Y-%m-%d").fillna(UNDATED).isin(days)
+
+    got = read_table(NAME, tmp_path, columns=["order_id", "order_date", "carrier"], start=start, end=end, days=days)
+    assert list(got.columns) == ["order_id", "order_date", "carrier"]
+    pd.testing.assert_frame_equal(_sorted(got), _sorted(df.loc[keep, list(got.columns)]), check_dtype=False)
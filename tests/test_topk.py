@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from control_tower.topk import top_k, top_k_positions
+
+
+def _frame(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    # Few distinct values so most rows tie on some key; some keys missing
+    score = rng.integers(0, 6, n).astype(float)
+    score[rng.random(n) < 0.15] = np.nan
+    cost = rng.choice([0.5, 1.0, 2.0, np.nan], n)
+    band = pd.Categorical(rng.choice(["High", "Medium", "Low", None], n), categories=["High", "Medium", "Low"], ordered=True)
+    return pd.DataFrame({"score": score, "cost": cost, "band": band, "id": np.arange(n)})
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("k", [0, 1, 5, 37, 500])
+@pytest.mark.parametrize("by,ascending", [
+    ("score", False),
+    ("score", True),
+    (["score", "cost"], False),
+    (["score", "cost"], [False, True]),
+    (["band", "score", "cost"], [True, False, True]),
+])
+def test_top_k_matches_stable_sort_head(seed, k, by, ascending):
+    df = _frame(np.random.default_rng(seed), 200)
+    expected = df.sort_values(by, ascending=ascending, kind="stable").head(k)
+    pd.testing.assert_frame_equal(top_k(df, by, k, ascending=ascending), expected)
+
+
+def test_top_k_positions_on_all_missing_keys():
+    df = pd.DataFrame({"score": [np.nan] * 5, "cost": [3.0, 1.0, 2.0, 1.0, np.nan]})
+    assert top_k_positions(df, ["score", "cost"], 3, ascending=True).tolist() == [1, 3, 2]
+    assert top_k_positions(df, "score", 2).tolist() == [0, 1]